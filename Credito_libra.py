@@ -1,10 +1,32 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
+import numpy as np
 import pandas as pd
+import plotly.express as px
 import psycopg2
 import psycopg2.extras as pg_extras
+import psycopg2.errors
+import psycopg2.pool
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_requests import ScriptRequestType
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from contextlib import contextmanager
 from datetime import date, datetime
 
+from arquivo_empresas import SQL_FUNCOES_ARQUIVO, TABELAS_ARQUIVAVEIS
+from cache_compartilhado import ERROS_BACKEND, criar_cache
+from consulta_carteira import SQL_CARTEIRA, filtros_carteira, sql_funcao_carteira
+from dados_carteira import campos_alterados, categoria, tipar_carteira, valores_formulario
+from dias_uteis import CalendarioUteis
+from particoes_log import INDICE_KEYSET, SQL_COLUNA_ID_LOG, SQL_FUNCOES_PARTICAO
+from motores_leitura import ler_copy, ler_tuplas
+from mudancas import (TABELAS_MONITORADAS, TABELAS_SEM_EMPRESA, SQL_FUNCAO_AVISO, VersoesDados,
+                      ddl_gatilhos, ouvir_mudancas)
+
 # =========================================================
 # 🎨 PALETA / ESTILO
 # =========================================================
@@ -22,78 +44,32 @@ st.set_page_config(
 # =========================================================
 # 🌑 CSS GLOBAL
 # =========================================================
-st.markdown(
-    f"""
-    <style>
-      html, body, [data-testid="stAppViewContainer"], [data-testid="stSidebar"], [data-testid="stHeader"] {{
-        background-color: #061e26 !important;
-        color: {HONEYDEW} !important;
-      }}
-      * {{ color-scheme: dark !important; }}
-      .block-container {{ padding-top: 1.2rem; }}
-      .kpi-card {{
-        background: {HARVEST_GOLD}22;
-        border: 1px solid {HARVEST_GOLD}55;
-        color: {HONEYDEW};
-        padding: 12px 14px; border-radius: 10px; text-align: center;
-      }}
-      .kpi-card h3 {{ margin: 0; font-size: 1.7rem; color: {HONEYDEW}; }}
-      .kpi-card span {{ font-size: .9rem; color: {SLATE_GRAY}; }}
-      .stDataFrame, .stTable, .stMarkdown, .stText {{
-        color: {HONEYDEW} !important;
-      }}
-      /* Progress bar discreta no rodapé do card */
-      .prog-wrap {{
-        width: 100%;
-        height: 8px;
-        border-radius: 999px;
-        background: rgba(255,255,255,0.06);
-        border: 1px solid rgba(255,255,255,0.08);
-        overflow: hidden;
-      }}
-      .prog-fill {{
-        height: 100%;
-        transition: width .45s ease;
-      }}
-      .chip {{
-        padding:3px 10px;border-radius:12px;background:{HARVEST_GOLD}22;border:1px solid {HARVEST_GOLD}55;
-      }}
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# O estilo fica em static/estilo.css (servido como text/css em /app/static, com cache
+# do navegador). Um <link> no <head> da página, posto uma vez por sessão, sobrevive
+# aos reruns: só a 1ª execução da sessão manda o script, nenhum CSS vai a cada rerun.
+LOGO_URL = "app/static/imagens/Capital-branca.png"
+ESTILO_URL = "app/static/estilo.css"
+
+if not st.session_state.get("_estilo_carregado"):
+    st.html(
+        f"""<script>
+        if (!document.getElementById("estilo-libra")) {{
+            const l = document.createElement("link");
+            l.id = "estilo-libra"; l.rel = "stylesheet"; l.href = "{ESTILO_URL}";
+            document.head.appendChild(l);
+        }}
+        </script>""",
+        unsafe_allow_javascript=True,
+    )
+    st.session_state["_estilo_carregado"] = True
 
 # =========================================================
 # 🧭 SIDEBAR (Logo + saudação)
 # =========================================================
 def sidebar_content():
     with st.sidebar:
-        st.markdown(
-            f"""
-            <style>
-            .logo-hover {{
-                transition: all 0.3s ease-in-out;
-                filter: drop-shadow(0px 0px 8px rgba(198,99,0,0.4));
-                cursor: pointer;
-            }}
-            .logo-hover:hover {{
-                transform: scale(1.06);
-                filter: drop-shadow(0px 0px 12px rgba(198,99,0,0.7));
-            }}
-            </style>
-
-            <div style="
-                display:flex;
-                flex-direction:column;
-                align-items:center;
-                justify-content:center;
-                margin-top:10px;
-                margin-bottom:15px;">
-                <img src="https://raw.githubusercontent.com/juancarneirolibra/assets/main/Capital-branca.png" class="logo-hover" width="150">
-            </div>
-            """,
-            unsafe_allow_html=True
-        )
+        st.markdown(f'<div class="logo-box"><img src="{LOGO_URL}" class="logo-hover" width="150"></div>',
+                    unsafe_allow_html=True)
 
         st.markdown("<div style='margin-top: 1rem;'></div>", unsafe_allow_html=True)
 
@@ -103,35 +79,36 @@ def sidebar_content():
             st.success(f"Olá, **{nome}** ({tipo})")
             st.markdown("<div style='margin-top: 1rem;'></div>", unsafe_allow_html=True)
 
+            # 🩺 Instrumentação do banco (só liderança/analistas)
+            cache = cache_compartilhado()
+            ttfr = st.session_state.get("_ttfr_login_s")
+            if tipo != "comercial" and (DB_REPLICAS or cache is not None or ttfr is not None):
+                with st.expander("🩺 Banco de dados"):
+                    if ttfr is not None:
+                        st.caption(f"⏱️ 1ª tela após o login: {ttfr * 1000:.0f}ms "
+                                   f"(aquecimento {'ligado' if AQUECIMENTO_LOGIN else 'desligado'})")
+                    for r in status_replicas():
+                        lag = "—" if r["lag_s"] is None else f"{r['lag_s']:.1f}s"
+                        st.caption(f"{'🟢' if r['ok'] else '🔴'} {r['alvo']} | lag: {lag}")
+                    if cache is not None:
+                        e = cache.estatisticas()
+                        st.caption(
+                            f"🧊 Cache compartilhado: {e['taxa_acerto']:.0%} acertos "
+                            f"({e['hits']}/{e['hits'] + e['misses']}) | "
+                            f"serialização {e['serializacao_s'] * 1000:.0f}ms, "
+                            f"leitura {e['desserializacao_s'] * 1000:.0f}ms, "
+                            f"{e['bytes_gravados'] / 1024:.0f} KiB gravados"
+                        )
+
 # =========================================================
 # 🏷 HEADER CENTRALIZADO
 # =========================================================
 def header():
     st.markdown(
-        f"""
-        <div style="
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            gap: 0.8rem;
-            padding-top: 25px;
-            padding-bottom: 25px;
-        ">
-            <span style='
-                color:{HONEYDEW};
-                font-size: 1.8rem;
-                font-weight:900;
-                letter-spacing:0.02em;
-                border-bottom: 2px solid {HARVEST_GOLD}80;
-                padding-bottom: 0.1em;
-                text-shadow: 0px 0px 8px rgba(255,255,255,0.1);
-            '>LIBRA CAPITAL</span>
-            <span style='font-weight:400; color:{HARVEST_GOLD}; font-size: 1.3rem;'>| Análise de Crédito</span>
-        </div>
-        """,
+        '<div class="cabecalho"><span class="cabecalho-marca">LIBRA CAPITAL</span>'
+        '<span class="cabecalho-sub">| Análise de Crédito</span></div>',
         unsafe_allow_html=True
     )
-    st.markdown("<div style='margin-bottom: 1.5rem;'></div>", unsafe_allow_html=True)
 
 # =========================================================
 # 🗄️ BANCO DE DADOS
@@ -143,6 +120,9 @@ DB_CONFIG = {
     "user": st.secrets["db_user"],
     "password": st.secrets["db_password"],
 }
+# opcional: parâmetros extras do libpq (ex.: "-c search_path=..." para rodar num schema isolado)
+if st.secrets.get("db_options"):
+    DB_CONFIG["options"] = st.secrets["db_options"]
 
 def safe_int(value, default=0):
     try:
@@ -152,22 +132,339 @@ def safe_int(value, default=0):
     except Exception:
         return default
 
+# 🔀 Réplicas de leitura (opcional): lista de dicts em st.secrets["db_replicas"],
+# cada um sobrescrevendo só o que muda em relação ao primário (host, port...)
+DB_REPLICAS = [{**DB_CONFIG, "connect_timeout": 3, **dict(r)} for r in st.secrets.get("db_replicas", [])]
+POOL_MAX_CONEXOES = int(st.secrets.get("db_pool_max", 10))
+ESPERA_CONEXAO_S = float(st.secrets.get("espera_conexao_s", 5))
+JANELA_PRIMARIO_S = float(st.secrets.get("janela_primario_s", 5))   # read-your-writes
+LAG_MAXIMO_S = float(st.secrets.get("replica_lag_max_s", 30))
+
+# 🧊 Cache compartilhado entre processos (opcional): st.secrets["cache_compartilhado"],
+# ex. {backend = "disco", diretorio = "/dev/shm/credito_cache"} ou {backend = "redis", url = "..."}
 @st.cache_resource(show_spinner=False)
-def get_conn():
-    return psycopg2.connect(**DB_CONFIG)
-
-def run_query_df(sql, params=None):
-    conn = get_conn()
-    return pd.read_sql(sql, conn, params=params)
-
-def run_exec(sql, params=None, many=False):
-    conn = get_conn()
-    with conn, conn.cursor(cursor_factory=pg_extras.RealDictCursor) as cur:
-        if many:
-            cur.executemany(sql, params)
-        else:
-            cur.execute(sql, params)
-    conn.commit()
+def cache_compartilhado():
+    config = st.secrets.get("cache_compartilhado")
+    if not config:
+        return None
+    try:
+        return criar_cache(dict(config))
+    except Exception as e:
+        st.warning(f"Cache compartilhado indisponível, seguindo só com o cache local: {e}")
+        return None
+
+def invalidar_compartilhado(tabelas):
+    cache = cache_compartilhado()
+    if cache is not None and tabelas:
+        try:
+            cache.invalidar(sorted(tabelas))
+        except ERROS_BACKEND:
+            pass  # ficam pendentes no cache: até subirem, as leituras deste processo não o usam
+
+# 🔔 Escritas publicadas por LISTEN/NOTIFY (ver mudancas.py); definido antes das
+# rotinas de DDL abaixo, que já passam pelo run_exec
+_RE_ESCRITA = re.compile(r"\b(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+([a-z_]+)", re.IGNORECASE)
+
+def _tabelas_escritas(sql):
+    return {t.lower() for t in _RE_ESCRITA.findall(sql or "")} & set(TABELAS_MONITORADAS)
+
+@st.cache_resource(show_spinner=False)
+def versoes_dados():
+    # aviso de escrita que o run_exec deste processo não viu (outro processo, cascata de
+    # trigger, função, psql...) também sobe a versão compartilhada: todo processo que
+    # o recebe sobe, e basta um conseguir
+    return VersoesDados(ao_mudar=lambda tabela: invalidar_compartilhado((tabela,)))
+
+class ConexaoCredito(psycopg2.extensions.connection):
+    """Conexão do pool que lembra quais statements já foram preparados nela."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparados = set()
+        self.timeout_ms = 0  # statement_timeout da consulta em curso (reaplicado após rollback)
+
+class ConsultaIndisponivel(Exception):
+    """Consulta abortada (timeout, fila ou pool cheios): a tela mostra "carregando" em vez de travar."""
+
+@st.cache_resource(show_spinner=False)
+def _pool(alvo):
+    """Pool de `alvo` + semáforo do tamanho dele (o getconn do psycopg2 não espera: estoura PoolError)."""
+    cfg = DB_CONFIG if alvo == "primario" else DB_REPLICAS[int(alvo.split(":")[1])]
+    pool = psycopg2.pool.ThreadedConnectionPool(0, POOL_MAX_CONEXOES, connection_factory=ConexaoCredito, **cfg)
+    return pool, threading.BoundedSemaphore(POOL_MAX_CONEXOES)
+
+@contextmanager
+def get_conn(alvo="primario"):
+    """Empresta uma conexão do pool de `alvo` ("primario" ou "replica:N"), esperando até ESPERA_CONEXAO_S por uma livre."""
+    pool, vagas = _pool(alvo)
+    if not vagas.acquire(timeout=ESPERA_CONEXAO_S):
+        raise ConsultaIndisponivel(f"nenhuma conexão livre no pool '{alvo}'")
+    try:
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            pool.putconn(conn, close=bool(conn.closed))
+    finally:
+        vagas.release()
+
+@st.cache_data(show_spinner=False, ttl=15)
+def status_replicas():
+    """Saúde e atraso (segundos) de cada réplica; cacheado por 15s."""
+    status = []
+    for i in range(len(DB_REPLICAS)):
+        alvo = f"replica:{i}"
+        try:
+            with get_conn(alvo) as conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                ELSE EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp())
+                           END
+                """)
+                lag = cur.fetchone()[0]
+                conn.rollback()
+            lag = float(lag) if lag is not None else None
+            status.append({"alvo": alvo, "ok": lag is not None and lag <= LAG_MAXIMO_S, "lag_s": lag})
+        except Exception as e:
+            status.append({"alvo": alvo, "ok": False, "lag_s": None, "erro": str(e)})
+    return status
+
+def _marcar_escrita():
+    try:
+        st.session_state["_escrita_em"] = time.time()
+    except Exception:
+        pass  # fora de uma sessão (thread do listener etc.)
+
+def _alvo_leitura():
+    """Réplica saudável, a menos que a sessão tenha escrito há pouco (read-your-writes)."""
+    if not DB_REPLICAS:
+        return "primario"
+    try:
+        if time.time() - st.session_state.get("_escrita_em", 0) < JANELA_PRIMARIO_S:
+            return "primario"
+    except Exception:
+        pass
+    saudaveis = [r["alvo"] for r in status_replicas() if r["ok"]]
+    return random.choice(saudaveis) if saudaveis else "primario"
+
+# ⚡ Consultas quentes (rodam a cada rerun): preparadas uma vez por conexão do pool
+# e chamadas pelo nome — o servidor não re-parseia/re-planeja a cada execução.
+CONSULTAS_PREPARADAS = {
+    "dados_empresa": ("text", "SELECT * FROM analise_credito WHERE empresa = $1"),
+    "pendencias_da_empresa": ("text", """
+        SELECT id, documento, status, data_ultima_atualizacao
+          FROM pendencias_empresa WHERE empresa = $1 ORDER BY documento"""),
+    "pendencias_abertas_empresa": ("text", """
+        SELECT id, documento, status, data_ultima_atualizacao
+          FROM pendencias_empresa WHERE empresa = $1 AND status = 'pendente' ORDER BY documento"""),
+    "qtd_pendentes_empresa": ("text", """
+        SELECT qtd_bits(pendentes_mask) + pendentes_fora_dim FROM analise_credito WHERE empresa = $1"""),
+    # histórico paginado por keyset (created_at, id): custo por página independe do tamanho do log
+    "log_empresa_inicio": ("text, int", """
+        SELECT id, etapa, responsavel, created_at, prazo_dias, status_prazo
+          FROM log_workflow WHERE empresa = $1
+         ORDER BY created_at DESC, id DESC LIMIT $2"""),
+    "log_empresa_apos": ("text, timestamptz, bigint, int", """
+        SELECT id, etapa, responsavel, created_at, prazo_dias, status_prazo
+          FROM log_workflow WHERE empresa = $1 AND (created_at, id) < ($2, $3)
+         ORDER BY created_at DESC, id DESC LIMIT $4"""),
+    "resumo_log_empresa": ("text", """
+        SELECT COUNT(*) AS transicoes,
+               EXTRACT(EPOCH FROM NOW() - MAX(created_at)) AS seg_etapa_atual,
+               EXTRACT(EPOCH FROM NOW() - MIN(created_at)) AS seg_total
+          FROM log_workflow WHERE empresa = $1"""),
+}
+
+_ERROS_PREPARADA = (
+    psycopg2.errors.InvalidSqlStatementName,     # sumiu do servidor (DISCARD, pooler...)
+    psycopg2.errors.DuplicatePreparedStatement,  # servidor já tem, a conexão não sabia
+    psycopg2.errors.FeatureNotSupported,         # "cached plan must not change result type" (DDL)
+)
+
+def _ler_preparada(conn, nome, params):
+    """Motor de statements preparados: aqui `sql` é o nome em CONSULTAS_PREPARADAS."""
+    tipos, sql = CONSULTAS_PREPARADAS[nome]
+    params = list(params or [])
+    args = f" ({', '.join(['%s'] * len(params))})" if params else ""
+    for tentativa in (1, 2):
+        try:
+            with conn.cursor() as cur:
+                if nome not in conn.preparados:
+                    cur.execute(f"PREPARE {nome} ({tipos}) AS {sql}")
+                    conn.preparados.add(nome)
+                cur.execute(f"EXECUTE {nome}{args}", params)
+                colunas = [d.name for d in cur.description]
+                return pd.DataFrame.from_records(cur.fetchall(), columns=colunas, coerce_float=True)
+        except _ERROS_PREPARADA:
+            if tentativa == 2:
+                raise
+            # estado divergente: zera os preparados da conexão e prepara de novo
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("DEALLOCATE ALL")
+            conn.preparados.clear()
+            _aplicar_timeout(conn)
+
+MOTORES_LEITURA = {"tuplas": ler_tuplas, "copy": ler_copy, "preparada": _ler_preparada}
+
+def _em_aquecimento():
+    return threading.current_thread().name.startswith("aquecimento")
+
+def _contar_consulta():
+    """Conta idas ao banco no rerun atual (lido pelo harness carga_sessoes.py)."""
+    if _em_aquecimento():
+        return  # prefetch pós-login não entra na conta do rerun
+    try:
+        st.session_state["_consultas_rerun"] = st.session_state.get("_consultas_rerun", 0) + 1
+    except Exception:
+        pass  # fora de uma sessão
+
+# =========================================================
+# ⏱️ TIMEOUTS, CANCELAMENTO E FILA DAS CONSULTAS
+# =========================================================
+# Toda ida ao banco tem uma classe: o statement_timeout dela vale só na transação
+# (SET LOCAL) e as classes caras passam por um semáforo por processo, para que uma
+# leitura lenta não prenda o pool inteiro. Leituras de uma execução que o usuário
+# já abandonou (novo rerun ou aba fechada) são canceladas no servidor.
+def _classes_consulta():
+    classes = {
+        "rapida":     {"timeout_ms": 3000,  "limite": None},
+        "carteira":   {"timeout_ms": 15000, "limite": 4},
+        "escrita":    {"timeout_ms": 10000, "limite": None},
+        "manutencao": {"timeout_ms": 0,     "limite": None},  # DDL/migrações/jobs: sem teto
+    }
+    for nome, cfg in dict(st.secrets.get("classes_consulta", {})).items():
+        classes.setdefault(nome, {"timeout_ms": 0, "limite": None}).update(dict(cfg))
+    return classes
+CLASSES_CONSULTA = _classes_consulta()
+ESPERA_FILA_S = float(st.secrets.get("espera_fila_s", 3))
+
+@st.cache_resource(show_spinner=False)
+def _semaforos():
+    return {nome: threading.BoundedSemaphore(int(cfg["limite"]))
+            for nome, cfg in CLASSES_CONSULTA.items() if cfg.get("limite")}
+
+@st.cache_resource(show_spinner=False)
+def _consultas_em_voo():
+    """conexão → contexto da execução do script que está esperando por ela."""
+    return {}, threading.Lock()
+
+def _execucao_interrompida(ctx):
+    """
+    Há rerun ou parada pendente para a execução (usuário mexeu de novo ou fechou a aba).
+    O Streamlit não expõe esse sinal publicamente: lê ScriptRequests._state, com a
+    versão fixada no requirements.txt e tests/test_sinal_rerun.py vigiando o atributo.
+    """
+    pedidos = getattr(ctx, "script_requests", None)
+    return getattr(pedidos, "_state", None) in (ScriptRequestType.RERUN, ScriptRequestType.STOP)
+
+def _vigiar_em_voo():
+    em_voo, trava = _consultas_em_voo()
+    while True:
+        time.sleep(0.2)
+        with trava:
+            registradas = list(em_voo.items())
+        alvos = [(conn, ctx) for conn, ctx in registradas if _execucao_interrompida(ctx)]
+        if not alvos:
+            continue
+        # cancel() com a trava: o finally de _consulta_controlada tira a conexão do
+        # registro (com a mesma trava) antes de devolvê-la ao pool, então o cancel
+        # nunca cai na consulta seguinte de outra execução na mesma conexão
+        with trava:
+            for conn, ctx in alvos:
+                if em_voo.get(conn) is not ctx:
+                    continue  # a consulta já terminou (ou a conexão já é de outra execução)
+                em_voo.pop(conn)  # cancela uma vez só
+                try:
+                    conn.cancel()
+                except Exception:
+                    pass
+
+@st.cache_resource(show_spinner=False)
+def iniciar_vigia_consultas():
+    """Uma thread por processo que cancela consultas de execuções abandonadas."""
+    t = threading.Thread(target=_vigiar_em_voo, name="vigia-consultas", daemon=True)
+    t.start()
+    return t
+iniciar_vigia_consultas()
+
+def _aplicar_timeout(conn):
+    if conn.timeout_ms:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (int(conn.timeout_ms),))
+
+@contextmanager
+def _consulta_controlada(conn, classe, cancelavel=True):
+    """Timeout da classe na transação atual + registro para cancelamento; traduz o QueryCanceled."""
+    conn.timeout_ms = int(CLASSES_CONSULTA[classe]["timeout_ms"] or 0)
+    _aplicar_timeout(conn)
+    ctx = get_script_run_ctx() if cancelavel and not _em_aquecimento() else None
+    em_voo, trava = _consultas_em_voo()
+    if ctx is not None:
+        with trava:
+            em_voo[conn] = ctx
+    try:
+        yield
+    except psycopg2.errors.QueryCanceled as e:
+        if ctx is not None and _execucao_interrompida(ctx):
+            st.stop()  # execução já substituída: o próximo rerun assume a tela
+        raise ConsultaIndisponivel(f"consulta '{classe}' passou de {conn.timeout_ms / 1000:.0f}s") from e
+    finally:
+        if ctx is not None:
+            with trava:
+                em_voo.pop(conn, None)
+
+def run_query_df(sql, params=None, alvo=None, motor="tuplas", classe="rapida"):
+    ler = MOTORES_LEITURA[motor]
+    _contar_consulta()
+    fila = _semaforos().get(classe)
+    if fila is not None and not fila.acquire(timeout=ESPERA_FILA_S):
+        raise ConsultaIndisponivel(f"muitas consultas '{classe}' em andamento")
+    try:
+        alvo = alvo or _alvo_leitura()
+        try:
+            with get_conn(alvo) as conn, _consulta_controlada(conn, classe):
+                return ler(conn, sql, params)
+        except psycopg2.OperationalError:
+            if alvo == "primario":
+                raise
+            status_replicas.clear()
+            with get_conn("primario") as conn, _consulta_controlada(conn, classe):
+                return ler(conn, sql, params)
+    finally:
+        if fila is not None:
+            fila.release()
+
+def run_exec(sql, params=None, many=False, empresa=None, values=False, classe="escrita"):
+    """
+    Executa no primário e devolve as linhas (RealDict) se o comando retornar alguma.
+    - many: executemany (um comando por tupla)
+    - values: execute_values — `sql` tem um único %s que vira VALUES (...), (...) num comando só
+    - classe: define o statement_timeout ("manutencao" = sem teto, para DDL/migrações)
+    Escritas não são canceladas por rerun: um "Salvar" clicado vai até o fim.
+    """
+    _contar_consulta()
+    tabelas = _tabelas_escritas(sql)
+    with get_conn("primario") as conn:
+        with conn, _consulta_controlada(conn, classe, cancelavel=False), \
+                conn.cursor(cursor_factory=pg_extras.RealDictCursor) as cur:
+            if values:
+                linhas = pg_extras.execute_values(cur, sql, params, page_size=max(1, len(params)), fetch=True)
+            else:
+                if many:
+                    cur.executemany(sql, params)
+                else:
+                    cur.execute(sql, params)
+                linhas = cur.fetchall() if cur.description else None
+            if tabelas:
+                cur.execute("SELECT txid_current() AS t")
+                versoes_dados().transacao_propria(cur.fetchone()["t"], tabelas)
+    _marcar_escrita()
+    # invalida o cache local já (o aviso desta transação, quando voltar pelo
+    # listener, é ignorado) e o compartilhado, que os outros processos consultam pela versão
+    for tabela in tabelas:
+        versoes_dados().registrar(tabela, empresa)
+    invalidar_compartilhado(tabelas)
+    return linhas
 
 # índices úteis (roda uma vez)
 @st.cache_resource(show_spinner=False)
@@ -181,11 +478,586 @@ def ensure_indexes():
     ]
     for q in ddl:
         try:
-            run_exec(q)
+            run_exec(q, classe="manutencao")
         except Exception:
             pass
 ensure_indexes()
 
+# =========================================================
+# 🗂️ LOG_WORKFLOW PARTICIONADO POR MÊS
+# =========================================================
+LOG_MESES_A_FRENTE = int(st.secrets.get("log_meses_a_frente", 3))
+LOG_RETENCAO_MESES = st.secrets.get("log_retencao_meses")  # None = mantém tudo particionado
+
+# A conversão da tabela é um passo explícito de manutenção (python particoes_log.py
+# migrar), não roda no import; aqui só as funções de manutenção, a coluna id (o
+# keyset do histórico precisa dela) e o índice do keyset.
+@st.cache_resource(show_spinner=False)
+def ensure_funcoes_particao():
+    try:
+        run_exec(SQL_FUNCOES_PARTICAO, classe="manutencao")
+        run_exec(SQL_COLUNA_ID_LOG, classe="manutencao")
+        # índice do keyset do histórico (substitui o de (empresa, created_at))
+        run_exec(INDICE_KEYSET.format(nome="idx_lw_empresa_created_id", tabela="log_workflow")
+                 + "; DROP INDEX IF EXISTS idx_lw_empresa_created;", classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar as partições do log_workflow: {e}")
+ensure_funcoes_particao()
+
+@st.cache_resource(show_spinner=False, ttl=24 * 3600)
+def manter_particoes_log():
+    """Cria as partições dos próximos meses e aplica a retenção (1x por dia por processo)."""
+    try:
+        run_exec("""
+            SELECT criar_particao_log_workflow((date_trunc('month', NOW()) + make_interval(months => m))::date)
+              FROM generate_series(0, %s) AS m;
+        """, (LOG_MESES_A_FRENTE,), classe="manutencao")
+        if LOG_RETENCAO_MESES:
+            run_exec("SELECT arquivar_particoes_log_workflow(%s);", (int(LOG_RETENCAO_MESES),), classe="manutencao")
+    except Exception as e:
+        st.warning(f"Manutenção das partições do log_workflow falhou: {e}")
+manter_particoes_log()
+
+# =========================================================
+# 🧩 MÁSCARA DE PENDÊNCIAS (bitset por empresa)
+# =========================================================
+# Cada documento da dim_pendencias tem uma posição de bit fixa (0..62, nunca
+# reaproveitada). analise_credito guarda pendentes_mask / recebidos_mask,
+# mantidas pelo trigger em pendencias_empresa — contagem de pendências vira
+# popcount e a matriz empresa × documento sai de uma leitura só.
+# Pendência de documento fora da dim_pendencias (sem bit) conta em
+# pendentes_fora_dim: o total é qtd_bits(pendentes_mask) + pendentes_fora_dim.
+# Quando o documento entra na dim (ou sai), o trigger da dim move a contagem
+# entre o contador e o bit.
+SQL_MASCARA_PENDENCIAS = """
+CREATE OR REPLACE FUNCTION qtd_bits(mascara bigint) RETURNS int AS $$
+    SELECT length(replace(mascara::bit(64)::text, '0', ''));
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE dim_pendencias ADD COLUMN IF NOT EXISTS bit SMALLINT;
+UPDATE dim_pendencias d
+   SET bit = n.base + n.rn
+  FROM (SELECT documento,
+               row_number() OVER (ORDER BY documento) AS rn,
+               (SELECT COALESCE(MAX(bit), -1) FROM dim_pendencias) AS base
+          FROM dim_pendencias WHERE bit IS NULL) n
+ WHERE d.documento = n.documento;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_dim_pendencias_bit ON dim_pendencias(bit);
+DO $$
+BEGIN
+    ALTER TABLE dim_pendencias ADD CONSTRAINT ck_dim_pendencias_bit CHECK (bit BETWEEN 0 AND 62);
+EXCEPTION WHEN duplicate_object THEN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION trg_bit_dim_pendencias() RETURNS trigger AS $$
+BEGIN
+    IF NEW.bit IS NULL THEN
+        SELECT COALESCE(MAX(bit), -1) + 1 INTO NEW.bit FROM dim_pendencias;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_bit_dim_pendencias ON dim_pendencias;
+CREATE TRIGGER trg_bit_dim_pendencias BEFORE INSERT ON dim_pendencias
+FOR EACH ROW EXECUTE FUNCTION trg_bit_dim_pendencias();
+
+CREATE OR REPLACE FUNCTION trg_mascara_pendencias() RETURNS trigger AS $$
+DECLARE
+    b bigint;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT 1::bigint << bit INTO b FROM dim_pendencias WHERE documento = OLD.documento;
+        IF b IS NOT NULL THEN
+            UPDATE analise_credito
+               SET pendentes_mask = pendentes_mask & ~b,
+                   recebidos_mask = recebidos_mask & ~b
+             WHERE empresa = OLD.empresa;
+        ELSIF OLD.status = 'pendente' THEN
+            UPDATE analise_credito SET pendentes_fora_dim = pendentes_fora_dim - 1 WHERE empresa = OLD.empresa;
+        END IF;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        SELECT 1::bigint << bit INTO b FROM dim_pendencias WHERE documento = NEW.documento;
+        IF b IS NOT NULL THEN
+            UPDATE analise_credito
+               SET pendentes_mask = CASE WHEN NEW.status = 'pendente' THEN pendentes_mask | b ELSE pendentes_mask & ~b END,
+                   recebidos_mask = CASE WHEN NEW.status = 'recebido' THEN recebidos_mask | b ELSE recebidos_mask & ~b END
+             WHERE empresa = NEW.empresa;
+        ELSIF NEW.status = 'pendente' THEN
+            UPDATE analise_credito SET pendentes_fora_dim = pendentes_fora_dim + 1 WHERE empresa = NEW.empresa;
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'analise_credito'
+                  AND column_name = 'pendentes_mask') THEN
+        RETURN;
+    END IF;
+    LOCK TABLE pendencias_empresa IN SHARE MODE;
+    ALTER TABLE analise_credito ADD COLUMN pendentes_mask BIGINT NOT NULL DEFAULT 0;
+    ALTER TABLE analise_credito ADD COLUMN recebidos_mask BIGINT NOT NULL DEFAULT 0;
+    ALTER TABLE IF EXISTS analise_credito_arquivo ADD COLUMN IF NOT EXISTS pendentes_mask BIGINT NOT NULL DEFAULT 0;
+    ALTER TABLE IF EXISTS analise_credito_arquivo ADD COLUMN IF NOT EXISTS recebidos_mask BIGINT NOT NULL DEFAULT 0;
+    UPDATE analise_credito ac
+       SET pendentes_mask = m.pend, recebidos_mask = m.rec
+      FROM (SELECT p.empresa,
+                   COALESCE(bit_or(1::bigint << d.bit) FILTER (WHERE p.status = 'pendente'), 0) AS pend,
+                   COALESCE(bit_or(1::bigint << d.bit) FILTER (WHERE p.status = 'recebido'), 0) AS rec
+              FROM pendencias_empresa p
+              JOIN dim_pendencias d ON d.documento = p.documento
+             GROUP BY p.empresa) m
+     WHERE ac.empresa = m.empresa;
+    IF to_regclass('analise_credito_arquivo') IS NOT NULL THEN
+        UPDATE analise_credito_arquivo ac
+           SET pendentes_mask = m.pend, recebidos_mask = m.rec
+          FROM (SELECT p.empresa,
+                       COALESCE(bit_or(1::bigint << d.bit) FILTER (WHERE p.status = 'pendente'), 0) AS pend,
+                       COALESCE(bit_or(1::bigint << d.bit) FILTER (WHERE p.status = 'recebido'), 0) AS rec
+                  FROM pendencias_empresa_arquivo p
+                  JOIN dim_pendencias d ON d.documento = p.documento
+                 GROUP BY p.empresa) m
+         WHERE ac.empresa = m.empresa;
+    END IF;
+    DROP TRIGGER IF EXISTS trg_mascara_pendencias ON pendencias_empresa;
+    CREATE TRIGGER trg_mascara_pendencias
+    AFTER INSERT OR DELETE OR UPDATE OF empresa, documento, status ON pendencias_empresa
+    FOR EACH ROW EXECUTE FUNCTION trg_mascara_pendencias();
+END;
+$$;
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'analise_credito'
+                  AND column_name = 'pendentes_fora_dim') THEN
+        RETURN;
+    END IF;
+    LOCK TABLE pendencias_empresa IN SHARE MODE;
+    ALTER TABLE analise_credito ADD COLUMN pendentes_fora_dim INT NOT NULL DEFAULT 0;
+    ALTER TABLE IF EXISTS analise_credito_arquivo ADD COLUMN IF NOT EXISTS pendentes_fora_dim INT NOT NULL DEFAULT 0;
+    UPDATE analise_credito ac
+       SET pendentes_fora_dim = m.qtd
+      FROM (SELECT p.empresa, COUNT(*) AS qtd
+              FROM pendencias_empresa p
+             WHERE p.status = 'pendente'
+               AND NOT EXISTS (SELECT 1 FROM dim_pendencias d WHERE d.documento = p.documento AND d.bit IS NOT NULL)
+             GROUP BY p.empresa) m
+     WHERE ac.empresa = m.empresa;
+    IF to_regclass('analise_credito_arquivo') IS NOT NULL THEN
+        UPDATE analise_credito_arquivo ac
+           SET pendentes_fora_dim = m.qtd
+          FROM (SELECT p.empresa, COUNT(*) AS qtd
+                  FROM pendencias_empresa_arquivo p
+                 WHERE p.status = 'pendente'
+                   AND NOT EXISTS (SELECT 1 FROM dim_pendencias d WHERE d.documento = p.documento AND d.bit IS NOT NULL)
+                 GROUP BY p.empresa) m
+         WHERE ac.empresa = m.empresa;
+    END IF;
+END;
+$$;
+
+-- documento entrando/saindo da dim: as pendências dele passam do contador para o bit (e vice-versa)
+CREATE OR REPLACE FUNCTION trg_dim_pendencias_mascara() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.bit IS NOT NULL THEN
+        UPDATE analise_credito ac
+           SET pendentes_mask = ac.pendentes_mask & ~(1::bigint << OLD.bit),
+               recebidos_mask = ac.recebidos_mask & ~(1::bigint << OLD.bit),
+               pendentes_fora_dim = ac.pendentes_fora_dim + m.qtd
+          FROM (SELECT empresa, COUNT(*) FILTER (WHERE status = 'pendente') AS qtd
+                  FROM pendencias_empresa WHERE documento = OLD.documento GROUP BY empresa) m
+         WHERE ac.empresa = m.empresa;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') AND NEW.bit IS NOT NULL THEN
+        UPDATE analise_credito ac
+           SET pendentes_mask = ac.pendentes_mask | CASE WHEN m.qtd > 0 THEN 1::bigint << NEW.bit ELSE 0 END,
+               recebidos_mask = ac.recebidos_mask | CASE WHEN m.rec THEN 1::bigint << NEW.bit ELSE 0 END,
+               pendentes_fora_dim = ac.pendentes_fora_dim - m.qtd
+          FROM (SELECT empresa, COUNT(*) FILTER (WHERE status = 'pendente') AS qtd,
+                       bool_or(status = 'recebido') AS rec
+                  FROM pendencias_empresa WHERE documento = NEW.documento GROUP BY empresa) m
+         WHERE ac.empresa = m.empresa;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+DROP TRIGGER IF EXISTS trg_dim_pendencias_mascara ON dim_pendencias;
+CREATE TRIGGER trg_dim_pendencias_mascara
+AFTER INSERT OR DELETE OR UPDATE OF documento, bit ON dim_pendencias
+FOR EACH ROW EXECUTE FUNCTION trg_dim_pendencias_mascara();
+"""
+
+@st.cache_resource(show_spinner=False)
+def ensure_mascara_pendencias():
+    """Bits da dim_pendencias + máscaras em analise_credito, com carga inicial (roda uma vez)."""
+    try:
+        run_exec(SQL_MASCARA_PENDENCIAS, classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar a máscara de pendências: {e}")
+ensure_mascara_pendencias()
+
+def documentos_bits():
+    """Documentos da dim_pendencias com sua posição de bit (invalidado por escrita na dim)."""
+    return run_query_df_cache("SELECT documento, bit FROM dim_pendencias WHERE bit IS NOT NULL ORDER BY bit",
+                              tabelas=("dim_pendencias",))
+
+def matriz_documentos(filtro_agente=None, faltando=()):
+    """
+    Matriz empresa × documento a partir das máscaras (✅ recebido / ❌ pendente).
+    `faltando`: documentos que precisam estar TODOS pendentes para a empresa entrar.
+    """
+    docs = documentos_bits()
+    bits = dict(zip(docs["documento"], docs["bit"].astype(int)))
+    alvo = 0
+    for d in faltando:
+        alvo |= 1 << bits[d]
+    sql = """
+        SELECT empresa, agente, pendentes_mask, recebidos_mask
+          FROM analise_credito
+         WHERE (pendentes_mask & %s) = %s
+    """
+    params = [alvo, alvo]
+    if filtro_agente:
+        sql += " AND agente = %s"
+        params.append(filtro_agente)
+    sql += " ORDER BY empresa"
+    df = run_query_df_cache(sql, params, tabelas=("analise_credito",), classe="carteira")
+    pend = df["pendentes_mask"].to_numpy(dtype="int64")
+    rec = df["recebidos_mask"].to_numpy(dtype="int64")
+    matriz = df[["empresa", "agente"]].copy()
+    for doc, b in bits.items():
+        matriz[doc] = np.where(pend & (1 << b), "❌", np.where(rec & (1 << b), "✅", ""))
+    return matriz
+
+# =========================================================
+# 🔢 VERSÃO DA LINHA (edição concorrente)
+# =========================================================
+# `versao` só sobe em atualizar_campos_empresa: o UPDATE exige a versão que o
+# usuário carregou, então duas edições simultâneas não se sobrescrevem em silêncio.
+SQL_VERSAO_EMPRESA = """
+ALTER TABLE analise_credito ADD COLUMN IF NOT EXISTS versao INT NOT NULL DEFAULT 0;
+ALTER TABLE IF EXISTS analise_credito_arquivo ADD COLUMN IF NOT EXISTS versao INT NOT NULL DEFAULT 0;
+"""
+
+@st.cache_resource(show_spinner=False)
+def ensure_versao_empresa():
+    try:
+        run_exec(SQL_VERSAO_EMPRESA, classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar o controle de versão: {e}")
+ensure_versao_empresa()
+
+# =========================================================
+# 🕑 ÚLTIMA TRANSIÇÃO (em analise_credito)
+# =========================================================
+# A carteira e a sync da planilha leem a última transição de cada empresa daqui,
+# gravada por registrar_transicao junto com o log: buscar a mais recente no
+# log_workflow, por empresa, passa por todas as partições mensais.
+SQL_ULTIMA_TRANSICAO = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = 'analise_credito'
+                  AND column_name = 'ultima_transicao_em') THEN
+        RETURN;
+    END IF;
+    LOCK TABLE log_workflow IN SHARE MODE;
+    ALTER TABLE analise_credito ADD COLUMN ultima_transicao_em TIMESTAMPTZ, ADD COLUMN prazo_dias INT;
+    ALTER TABLE IF EXISTS analise_credito_arquivo ADD COLUMN IF NOT EXISTS ultima_transicao_em TIMESTAMPTZ,
+                                                 ADD COLUMN IF NOT EXISTS prazo_dias INT;
+    UPDATE analise_credito ac
+       SET ultima_transicao_em = l.created_at, prazo_dias = l.prazo_dias
+      FROM (SELECT DISTINCT ON (empresa) empresa, created_at, prazo_dias
+              FROM log_workflow ORDER BY empresa, created_at DESC) l
+     WHERE ac.empresa = l.empresa;
+    IF to_regclass('analise_credito_arquivo') IS NOT NULL THEN
+        UPDATE analise_credito_arquivo ac
+           SET ultima_transicao_em = l.created_at, prazo_dias = l.prazo_dias
+          FROM (SELECT DISTINCT ON (empresa) empresa, created_at, prazo_dias
+                  FROM log_workflow_arquivo ORDER BY empresa, created_at DESC) l
+         WHERE ac.empresa = l.empresa;
+    END IF;
+END;
+$$;
+"""
+
+@st.cache_resource(show_spinner=False)
+def ensure_ultima_transicao():
+    """Colunas da última transição em analise_credito, com carga inicial do log (roda uma vez)."""
+    try:
+        run_exec(SQL_ULTIMA_TRANSICAO, classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar a última transição das empresas: {e}")
+ensure_ultima_transicao()
+
+# =========================================================
+# 🗄️ ARQUIVO DE EMPRESAS ENCERRADAS
+# =========================================================
+# Empresas finalizadas/reprovadas saem das tabelas "quentes" depois da carência;
+# as views *_todas juntam ativo + arquivo para o toggle "Incluir arquivadas"
+# (tabelas e funções em arquivo_empresas.py).
+ARQUIVO_CARENCIA_DIAS = int(st.secrets.get("arquivo_carencia_dias", 30))
+
+@st.cache_resource(show_spinner=False)
+def ensure_arquivo():
+    """Tabelas/funções de arquivo + views ativo ∪ arquivo (roda uma vez)."""
+    try:
+        run_exec(SQL_FUNCOES_ARQUIVO, classe="manutencao")
+        for t in TABELAS_ARQUIVAVEIS:
+            run_exec("SELECT recriar_view_todas(%s)", (t,), classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar o arquivo de empresas: {e}")
+ensure_arquivo()
+
+@st.cache_resource(show_spinner=False, ttl=6 * 3600)
+def rotina_arquivamento():
+    """Arquiva as empresas encerradas (no máximo a cada 6h por processo)."""
+    if ARQUIVO_CARENCIA_DIAS <= 0:
+        return
+    try:
+        linhas = run_exec("SELECT arquivar_empresas_encerradas(%s) AS n;", (ARQUIVO_CARENCIA_DIAS,), classe="manutencao")
+        if linhas and linhas[0]["n"]:
+            invalidar_compartilhado(TABELAS_ARQUIVAVEIS)
+    except Exception:
+        pass
+rotina_arquivamento()
+
+def tabela_fonte(tabela, incluir_arquivadas=False):
+    """Nome da tabela (só ativas) ou da view ativo ∪ arquivo."""
+    return f"{tabela}_todas" if incluir_arquivadas else tabela
+
+def listar_arquivadas():
+    return run_query_df("SELECT empresa, arquivado_em FROM empresas_arquivadas ORDER BY arquivado_em DESC")
+
+def restaurar_empresa(empresa):
+    linhas = run_exec("SELECT restaurar_empresa_arquivada(%s) AS ok", (empresa,), empresa=empresa)
+    restaurada = bool(linhas and linhas[0]["ok"])
+    if restaurada:
+        versoes_dados().invalidar_tudo()
+        invalidar_compartilhado(TABELAS_ARQUIVAVEIS)
+    return restaurada
+
+# =========================================================
+# 🔔 MUDANÇAS (LISTEN/NOTIFY) + CACHE DE LEITURAS
+# =========================================================
+@st.cache_resource(show_spinner=False)
+def ensure_gatilhos_mudancas():
+    """Cria a função/triggers que publicam as escritas no canal de NOTIFY (roda uma vez)."""
+    ddl = [SQL_FUNCAO_AVISO]
+    for tabela in TABELAS_MONITORADAS:
+        ddl += ddl_gatilhos(tabela, por_empresa=tabela not in TABELAS_SEM_EMPRESA)
+    for q in ddl:
+        try:
+            run_exec(q, classe="manutencao")
+        except Exception:
+            pass
+ensure_gatilhos_mudancas()
+
+@st.cache_resource(show_spinner=False)
+def iniciar_listener_mudancas():
+    """Uma thread de LISTEN por processo."""
+    t = threading.Thread(target=ouvir_mudancas, args=(DB_CONFIG, versoes_dados()),
+                         name="listener-mudancas", daemon=True)
+    t.start()
+    return t
+iniciar_listener_mudancas()
+
+@st.cache_data(show_spinner=False, ttl=600, max_entries=512)
+def _consulta_cacheada(sql, params, token, motor, tabelas_compartilhadas=None, classe="rapida", alvo="primario"):
+    consultar = lambda: run_query_df(sql, list(params) if params is not None else None,
+                                     alvo=alvo, motor=motor, classe=classe)
+    cache = cache_compartilhado() if tabelas_compartilhadas else None
+    if cache is None:
+        return consultar()
+    # backend fora do ar não derruba a tela (obter vira cache miss); erro da consulta sobe
+    return cache.obter((sql, params, motor), tabelas_compartilhadas, consultar)
+
+def run_query_df_cache(sql, params=None, tabelas=TABELAS_MONITORADAS, empresa=None, motor="tuplas", classe="rapida"):
+    """
+    Igual ao run_query_df, mas cacheado até a próxima mudança em `tabelas`.
+    Com `empresa`, só mudanças dessa empresa invalidam a leitura.
+    Leituras da carteira inteira (sem `empresa`) também passam pelo cache
+    compartilhado entre processos, quando configurado.
+    """
+    # O resultado fica guardado sob o token atual, então precisa refletir as escritas
+    # que o geraram: logo depois de uma mudança a leitura vai ao primário, e réplica
+    # com atraso é lida sem cachear (senão o dado velho ficaria preso ao token novo).
+    alvo = _alvo_leitura()
+    if alvo != "primario":
+        if time.time() - versoes_dados().mudou_em(tabelas) < JANELA_PRIMARIO_S:
+            alvo = "primario"
+        elif next((r["lag_s"] for r in status_replicas() if r["alvo"] == alvo), None) != 0:
+            return run_query_df(sql, params, alvo=alvo, motor=motor, classe=classe)
+    token = versoes_dados().token(tabelas, empresa)
+    compartilhadas = None
+    cache = cache_compartilhado()
+    if cache is not None and empresa is None:
+        compartilhadas = tuple(tabelas)
+        try:
+            token += cache.versoes(compartilhadas)
+        except ERROS_BACKEND:
+            compartilhadas = None
+    return _consulta_cacheada(sql, tuple(params) if params is not None else None, token, motor,
+                              compartilhadas, classe, alvo)
+
+# =========================================================
+# 📋 CONSULTA DA CARTEIRA (Overview / Detalhada)
+# =========================================================
+@st.cache_resource(show_spinner=False)
+def ensure_consulta_carteira():
+    try:
+        run_exec(sql_funcao_carteira(), classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível criar a consulta da carteira: {e}")
+ensure_consulta_carteira()
+
+# =========================================================
+# 📈 ROLLUP DE LIMITES (agente × situação × etapa × mês de entrada)
+# =========================================================
+# rollup_limites guarda o CUBE das quatro dimensões com o agente sempre aberto:
+# `nivel` é o GROUPING() (bit 1 = dimensão agregada, gravada como ''); valores
+# nulos viram '—'. Os níveis sem agente (total geral, por situação...) seriam
+# linhas tocadas por toda escrita — disputa de lock entre todos os usuários —,
+# então saem na leitura, somando as linhas por agente (dezenas de linhas).
+# A manutenção é incremental: o trigger em analise_credito subtrai a linha
+# antiga e soma a nova (8 upserts por empresa tocada), sem varrer a tabela.
+DIMENSOES_ROLLUP = ["agente", "situacao", "etapa_atual", "mes_entrada"]
+
+SQL_ROLLUP_LIMITES = """
+CREATE TABLE IF NOT EXISTS rollup_limites (
+    nivel        INT     NOT NULL,
+    agente       TEXT    NOT NULL,
+    situacao     TEXT    NOT NULL,
+    etapa_atual  TEXT    NOT NULL,
+    mes_entrada  TEXT    NOT NULL,
+    qtd_empresas BIGINT  NOT NULL DEFAULT 0,
+    limite_total NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (nivel, agente, situacao, etapa_atual, mes_entrada)
+);
+
+CREATE OR REPLACE FUNCTION aplicar_delta_rollup(
+    p_agente text, p_situacao text, p_etapa text, p_entrada date, p_limite numeric, p_sinal int
+) RETURNS void AS $$
+    INSERT INTO rollup_limites AS r (nivel, agente, situacao, etapa_atual, mes_entrada, qtd_empresas, limite_total)
+    SELECT GROUPING(d.agente, d.situacao, d.etapa, d.mes),
+           COALESCE(d.agente, ''), COALESCE(d.situacao, ''), COALESCE(d.etapa, ''), COALESCE(d.mes, ''),
+           SUM(d.sinal), SUM(d.sinal * d.limite)
+      FROM (SELECT COALESCE(NULLIF(p_agente, ''), '—')          AS agente,
+                   COALESCE(NULLIF(p_situacao, ''), '—')        AS situacao,
+                   COALESCE(NULLIF(p_etapa, ''), '—')           AS etapa,
+                   COALESCE(to_char(p_entrada, 'YYYY-MM'), '—') AS mes,
+                   p_sinal                                      AS sinal,
+                   COALESCE(p_limite, 0)                        AS limite) d
+     GROUP BY d.agente, CUBE (d.situacao, d.etapa, d.mes)
+    ON CONFLICT (nivel, agente, situacao, etapa_atual, mes_entrada) DO UPDATE
+       SET qtd_empresas = r.qtd_empresas + EXCLUDED.qtd_empresas,
+           limite_total = r.limite_total + EXCLUDED.limite_total;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION reconstruir_rollup_limites() RETURNS void AS $$
+BEGIN
+    LOCK TABLE analise_credito IN SHARE MODE;
+    TRUNCATE rollup_limites;
+    INSERT INTO rollup_limites (nivel, agente, situacao, etapa_atual, mes_entrada, qtd_empresas, limite_total)
+    SELECT GROUPING(d.agente, d.situacao, d.etapa, d.mes),
+           COALESCE(d.agente, ''), COALESCE(d.situacao, ''), COALESCE(d.etapa, ''), COALESCE(d.mes, ''),
+           COUNT(*), SUM(d.limite)
+      FROM (SELECT COALESCE(NULLIF(agente::text, ''), '—')            AS agente,
+                   COALESCE(NULLIF(situacao::text, ''), '—')          AS situacao,
+                   COALESCE(NULLIF(etapa_atual::text, ''), '—')       AS etapa,
+                   COALESCE(to_char(entrada::date, 'YYYY-MM'), '—')   AS mes,
+                   COALESCE(limite, 0)::numeric                       AS limite
+              FROM analise_credito) d
+     GROUP BY d.agente, CUBE (d.situacao, d.etapa, d.mes);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION trg_rollup_limites() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND (OLD.agente, OLD.situacao, OLD.etapa_atual, OLD.entrada, OLD.limite)
+           IS NOT DISTINCT FROM (NEW.agente, NEW.situacao, NEW.etapa_atual, NEW.entrada, NEW.limite) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM aplicar_delta_rollup(OLD.agente::text, OLD.situacao::text, OLD.etapa_atual::text,
+                                     OLD.entrada::date, OLD.limite::numeric, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM aplicar_delta_rollup(NEW.agente::text, NEW.situacao::text, NEW.etapa_atual::text,
+                                     NEW.entrada::date, NEW.limite::numeric, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_rollup_limites ON analise_credito;
+CREATE TRIGGER trg_rollup_limites
+AFTER INSERT OR DELETE OR UPDATE OF agente, situacao, etapa_atual, entrada, limite ON analise_credito
+FOR EACH ROW EXECUTE FUNCTION trg_rollup_limites();
+
+-- níveis sem agente (versão anterior) agora saem na leitura
+DELETE FROM rollup_limites WHERE nivel >= 8;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM rollup_limites) THEN
+        PERFORM reconstruir_rollup_limites();
+    END IF;
+END;
+$$;
+"""
+
+@st.cache_resource(show_spinner=False)
+def ensure_rollup_limites():
+    """Tabela + trigger do rollup; carga inicial completa se estiver vazia (roda uma vez)."""
+    try:
+        run_exec(SQL_ROLLUP_LIMITES, classe="manutencao")
+    except Exception as e:
+        st.warning(f"Não foi possível preparar o rollup de limites: {e}")
+ensure_rollup_limites()
+
+def rollup_limites(dims, agente=None):
+    """
+    Lê um recorte do rollup: `dims` são as dimensões abertas, as demais vêm agregadas.
+    Com `agente`, o recorte é restrito àquele comercial.
+    """
+    dims = list(dims)
+    params = []
+    filtro = ""
+    if agente:
+        if "agente" not in dims:
+            dims.append("agente")
+        filtro = " AND agente = %s"
+        params.append(agente)
+    nivel = sum(1 << (3 - i) for i, d in enumerate(DIMENSOES_ROLLUP) if d not in dims)
+    if "agente" in dims:
+        sql = f"""
+            SELECT {', '.join(dims)}, qtd_empresas, limite_total::float AS limite_total
+              FROM rollup_limites
+             WHERE nivel = %s AND qtd_empresas > 0{filtro}
+             ORDER BY {', '.join(dims)}
+        """
+    else:
+        # agregado sobre os agentes: soma as linhas do nível com o agente aberto
+        nivel -= 8
+        agrupar = f" GROUP BY {', '.join(dims)}" if dims else ""
+        sql = f"""
+            SELECT {', '.join(dims) + ',' if dims else ''}
+                   SUM(qtd_empresas)::bigint AS qtd_empresas, SUM(limite_total)::float AS limite_total
+              FROM rollup_limites
+             WHERE nivel = %s{agrupar}
+            HAVING SUM(qtd_empresas) > 0
+            {'ORDER BY ' + ', '.join(dims) if dims else ''}
+        """
+    return run_query_df_cache(sql, [nivel] + params, tabelas=("analise_credito",), classe="carteira")
+
 def registrar_transicao(empresa, nova_etapa, novo_responsavel, prazo_dias):
     """
     Registra uma nova transição no fluxo de crédito.
@@ -203,23 +1075,27 @@ def registrar_transicao(empresa, nova_etapa, novo_responsavel, prazo_dias):
         # 🕒 Status de prazo inicial
         status_prazo = "Dentro do prazo" if prazo_int > 0 else "Sem prazo"
 
-        # 💾 Registro no log_workflow
-        run_exec("""
-            INSERT INTO log_workflow (empresa, etapa, responsavel, prazo_dias, status_prazo, created_at)
-            VALUES (%s, %s, %s, %s, %s, NOW());
-        """, (empresa, nova_etapa, novo_responsavel, prazo_int, status_prazo))
-
-        # 🔄 Atualização na tabela principal
+        # 💾 Registro no log_workflow + 🔄 tabela principal, no mesmo comando (mesma transação
+        # e mesmo instante): a última transição e o prazo vigente ficam também em analise_credito
         run_exec("""
-            UPDATE analise_credito
+            WITH t AS (
+                INSERT INTO log_workflow (empresa, etapa, responsavel, prazo_dias, status_prazo, created_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                RETURNING empresa, created_at, prazo_dias
+            )
+            UPDATE analise_credito ac
                SET etapa_atual = %s,
                    responsavel_atual = %s,
-                   data_ultima_movimentacao = NOW()
-             WHERE empresa = %s;
-        """, (nova_etapa, novo_responsavel, empresa))
+                   data_ultima_movimentacao = t.created_at,
+                   ultima_transicao_em = t.created_at,
+                   prazo_dias = t.prazo_dias
+              FROM t
+             WHERE ac.empresa = t.empresa;
+        """, (empresa, nova_etapa, novo_responsavel, prazo_int, status_prazo,
+              nova_etapa, novo_responsavel), empresa=empresa)
 
         st.toast(
-            f"🚀 Etapa '{nova_etapa}' registrada com sucesso! Responsável: {novo_responsavel} | Prazo: {prazo_int} dia(s)",
+            f"🚀 Etapa '{nova_etapa}' registrada com sucesso! Responsável: {novo_responsavel} | Prazo: {prazo_int} dia(s) útil(eis)",
             icon="✅"
         )
 
@@ -260,6 +1136,9 @@ def login_box():
                 st.session_state.user = key
                 st.session_state.tipo = USERS[key]["tipo"]
                 st.session_state.agente = USERS[key]["agente"]
+                st.session_state["_login_em"] = time.perf_counter()
+                if AQUECIMENTO_LOGIN:
+                    iniciar_aquecimento(USERS[key]["tipo"], USERS[key]["agente"])
                 st.rerun()
             else:
                 st.error("Usuário/senha inválidos")
@@ -269,6 +1148,26 @@ def login_box():
 # =========================================================
 SITUACOES = ["Em análise", "Aprovada", "Reprovada", "Stand by"]
 SIM_NAO = ["Não", "Sim"]
+ETAPAS = [
+    "Cadastro", "Pendência de Posicionamento", "Aguardando Documentos", "Em Análise",
+    "Aguardando Documentos Finais", "Elaboração Contrato", "Assinatura Cliente",
+    "Formalização Gestora", "Finalizado"
+]
+RESPONSAVEIS = ["Analista", "Comercial", "Gestora"]
+STATUS_PRAZO = ["Dentro do prazo", "Atrasado", "Sem prazo"]
+
+@st.cache_resource(show_spinner=False)
+def calendario_uteis():
+    """Feriados nacionais + `feriados_extras` dos secrets ('AAAA-MM-DD' ou 'MM-DD'), montado 1x por processo."""
+    return CalendarioUteis(extras=st.secrets.get("feriados_extras", []))
+
+CATEGORIAS_CARTEIRA = {
+    "agente": sorted({u["agente"] for u in USERS.values() if u["agente"]}),
+    "situacao": SITUACOES,
+    "etapa_atual": ETAPAS,
+    "responsavel_atual": RESPONSAVEIS,
+    "status_prazo": STATUS_PRAZO,
+}
 
 def _norm_status(s):
     s = (s or "").strip().lower()
@@ -287,16 +1186,20 @@ def ensure_pendencias_empresa(empresa):
                   AND pe.documento = d.documento
          );
         """
-        run_exec(sql, [str(empresa).strip(), str(empresa).strip()])
+        run_exec(sql, [str(empresa).strip(), str(empresa).strip()], empresa=empresa)
     except Exception as e:
         st.error(f"Erro ao garantir pendências: {e}")
 
 def seed_empresa_if_missing(empresa, agente):
+    """Cria o registro base; empresa arquivada volta com o histórico em vez de ganhar um cadastro duplicado."""
+    if restaurar_empresa(empresa):
+        st.info(f"♻️ **{empresa}** estava arquivada e foi restaurada com o histórico.")
     run_exec("""
         INSERT INTO analise_credito (empresa, agente, entrada, situacao)
         SELECT %s, %s, CURRENT_DATE, 'Em análise'
-         WHERE NOT EXISTS (SELECT 1 FROM analise_credito WHERE empresa = %s);
-    """, (empresa, agente, empresa))
+         WHERE NOT EXISTS (SELECT 1 FROM analise_credito WHERE empresa = %s)
+           AND NOT EXISTS (SELECT 1 FROM empresas_arquivadas WHERE empresa = %s);
+    """, (empresa, agente, empresa, empresa), empresa=empresa)
     ensure_pendencias_empresa(empresa)
 
 def kpi(label, value):
@@ -308,186 +1211,215 @@ def kpi(label, value):
     """, unsafe_allow_html=True)
 
 def safe_count(sql, params=None):
-    df = run_query_df(sql, params)
+    df = run_query_df_cache(sql, params)
     return int(df.iloc[0, 0]) if not df.empty else 0
 
-def conta_kpis(filtro_agente=None):
+def conta_kpis(filtro_agente=None, incluir_arquivadas=False):
+    ac = tabela_fonte("analise_credito", incluir_arquivadas)
     where = "WHERE 1=1"
     params = []
     if filtro_agente:
         where += " AND agente = %s"
         params.append(filtro_agente)
 
-    tot_emp = safe_count(f"SELECT COUNT(*) FROM analise_credito {where}", params)
-    aprov  = safe_count(f"SELECT COUNT(*) FROM analise_credito {where} AND situacao='Aprovada'", params)
-    reprov = safe_count(f"SELECT COUNT(*) FROM analise_credito {where} AND situacao='Reprovada'", params)
-
-    where_p = "WHERE 1=1"
-    params_p = []
-    if filtro_agente:
-        where_p += " AND empresa IN (SELECT empresa FROM analise_credito WHERE agente = %s)"
-        params_p.append(filtro_agente)
-    pend = safe_count(f"SELECT COUNT(*) FROM pendencias_empresa {where_p} AND status='pendente'", params_p)
+    tot_emp = safe_count(f"SELECT COUNT(*) FROM {ac} {where}", params)
+    aprov  = safe_count(f"SELECT COUNT(*) FROM {ac} {where} AND situacao='Aprovada'", params)
+    reprov = safe_count(f"SELECT COUNT(*) FROM {ac} {where} AND situacao='Reprovada'", params)
+    pend   = safe_count(f"SELECT COALESCE(SUM(qtd_bits(pendentes_mask) + pendentes_fora_dim), 0) FROM {ac} {where}", params)
     return tot_emp, aprov, reprov, pend
 
-def tabela_status_empresas(filtro_agente=None, data_ini=None, data_fim=None):
-    wheres, params = [], []
+def tabela_status_empresas(filtro_agente=None, data_ini=None, data_fim=None, incluir_arquivadas=False):
+    if not incluir_arquivadas:
+        # caminho quente: função com plano em cache (ver ensure_consulta_carteira)
+        df = run_query_df_cache("SELECT * FROM carteira_empresas(%s, %s, %s)",
+                                (filtro_agente or None, data_ini or None, data_fim or None),
+                                motor="copy", classe="carteira")
+        return tipar_carteira(df, CATEGORIAS_CARTEIRA)
+
+    where_sql, params = filtros_carteira(filtro_agente, data_ini, data_fim)
+    sql = SQL_CARTEIRA.format(
+        ac="analise_credito_todas", arquivada="ac.arquivada", where=where_sql
+    )
+    df = run_query_df_cache(sql, params, motor="copy", classe="carteira")
+    return tipar_carteira(df, CATEGORIAS_CARTEIRA)
+
+def fmt_data(valor, padrao="—"):
+    return valor.strftime("%d/%m/%Y") if pd.notnull(valor) else padrao
+
+def fmt_txt(valor, padrao="—"):
+    return padrao if pd.isna(valor) or valor == "" else str(valor)
+
+def fmt_duracao(segundos, padrao="—"):
+    if segundos is None or pd.isna(segundos):
+        return padrao
+    dias, resto = divmod(int(segundos), 86400)
+    horas = resto // 3600
+    return f"{dias}d {horas}h" if dias else f"{horas}h {(resto % 3600) // 60}min"
+
+def listar_empresas(filtro_agente=None):
+    """Só os nomes (seletor da Detalhada), na mesma ordem da carteira — sem montar a carteira inteira."""
+    sql = "SELECT empresa FROM analise_credito"
+    params = None
     if filtro_agente:
-        wheres.append("ac.agente = %s")
-        params.append(filtro_agente)
-    if data_ini:
-        wheres.append("ac.entrada >= %s")
-        params.append(data_ini)
-    if data_fim:
-        wheres.append("ac.entrada <= %s")
-        params.append(data_fim)
-
-    where_sql = f"WHERE {' AND '.join(wheres)}" if wheres else ""
-
-    sql = f"""
-    SELECT
-    ac.empresa,
-    ac.agente,
-    ac.entrada,
-    ac.situacao,
-    COALESCE(ac.limite,0) AS limite,
-    ac.etapa_atual,
-    ac.responsavel_atual,
-    ac.data_ultima_movimentacao,
-
-    -- 🔹 Campo novo essencial pra barrinha funcionar
-    (SELECT created_at
-       FROM log_workflow lw
-      WHERE lw.empresa = ac.empresa
-      ORDER BY lw.created_at DESC
-      LIMIT 1) AS ultima_transicao_em,
-
-    -- 🔹 Prazo mais recente do workflow
-    (SELECT prazo_dias
-       FROM log_workflow lw
-      WHERE lw.empresa = ac.empresa
-      ORDER BY lw.created_at DESC
-      LIMIT 1) AS prazo_dias,
-
-    -- 🔹 Quantidade de pendências abertas
-    (SELECT COUNT(*)
-       FROM pendencias_empresa p
-      WHERE p.empresa = ac.empresa
-        AND p.status='pendente') AS pendentes_restantes
-
-    FROM analise_credito ac
-    {where_sql}
-    ORDER BY ac.entrada DESC, ac.empresa;
-     """
-    df = run_query_df(sql, params)
-    if not df.empty:
-        try:
-            df["entrada_fmt"] = pd.to_datetime(df["entrada"]).dt.strftime("%d/%m/%Y")
-        except Exception:
-            df["entrada_fmt"] = df["entrada"].astype(str)
-
-        try:
-            df["ultima_movimentacao_fmt"] = pd.to_datetime(df["data_ultima_movimentacao"]).dt.strftime("%d/%m/%Y")
-        except Exception:
-            df["ultima_movimentacao_fmt"] = df["data_ultima_movimentacao"].astype(str)
-    return df
+        sql += " WHERE agente = %s"
+        params = [filtro_agente]
+    sql += " ORDER BY entrada DESC, empresa"
+    return run_query_df_cache(sql, params, tabelas=("analise_credito",))["empresa"].tolist()
+
+def carregando(erro, chave):
+    """Fallback quando uma consulta cara estoura o tempo ou a fila: avisa e oferece nova tentativa."""
+    st.info(f"⏳ Ainda carregando — {erro}. O restante da tela já está disponível.")
+    if st.button("🔄 Tentar de novo", key=f"tentar_{chave}"):
+        st.rerun()
 
 def listar_agentes():
     try:
-        d = run_query_df("SELECT DISTINCT agente FROM analise_credito WHERE agente IS NOT NULL ORDER BY agente")
+        d = run_query_df_cache("SELECT DISTINCT agente FROM analise_credito WHERE agente IS NOT NULL ORDER BY agente",
+                               tabelas=("analise_credito",))
         ops = d["agente"].dropna().tolist()
         return ["Todos"] + ops if ops else ["Todos"]
     except Exception:
         return ["Todos"]
 
-def pendencias_df(empresa, apenas_pendentes=False):
-    sql = "SELECT id, documento, status, data_ultima_atualizacao FROM pendencias_empresa WHERE empresa = %s"
+def pendencias_df(empresa, apenas_pendentes=False, incluir_arquivadas=False):
+    if not incluir_arquivadas:
+        nome = "pendencias_abertas_empresa" if apenas_pendentes else "pendencias_da_empresa"
+        return run_query_df_cache(nome, [empresa], tabelas=("pendencias_empresa",),
+                                  empresa=empresa, motor="preparada")
+    sql = "SELECT id, documento, status, data_ultima_atualizacao FROM pendencias_empresa_todas WHERE empresa = %s"
     params = [empresa]
     if apenas_pendentes:
         sql += " AND status='pendente'"
     sql += " ORDER BY documento"
-    return run_query_df(sql, params)
+    return run_query_df_cache(sql, params, tabelas=("pendencias_empresa",), empresa=empresa)
 
-def atualizar_campos_empresa(empresa, payload):
-    """Atualiza campos arbitrários em analise_credito com segurança."""
+def atualizar_campos_empresa(empresa, payload, versao=None):
+    """
+    Atualiza só os campos informados em analise_credito.
+    Com `versao`, o UPDATE só acontece se a linha ainda estiver nessa versão;
+    devolve a nova versão, ou None se outra pessoa salvou antes (conflito).
+    """
     if not payload:
-        return
+        return versao
     sets, params = [], []
     for col, val in payload.items():
         sets.append(f"{col} = %s")
         params.append(val)
+    sql = f"UPDATE analise_credito SET {', '.join(sets)}, versao = versao + 1 WHERE empresa = %s"
     params.append(empresa)
-    run_exec(f"UPDATE analise_credito SET {', '.join(sets)} WHERE empresa = %s", params)
+    if versao is not None:
+        sql += " AND versao = %s"
+        params.append(int(versao))
+    linhas = run_exec(sql + " RETURNING versao", params, empresa=empresa)
+    return linhas[0]["versao"] if linhas else None
 
 def atualizar_pendencias(empresa, updates):
+    """
+    Aplica todas as mudanças de status num único UPDATE ... FROM (VALUES ...)
+    (uma ida ao banco, qualquer que seja o nº de documentos) e devolve as linhas novas.
+    """
     if not updates:
-        return
+        return []
     sql = """
-       UPDATE pendencias_empresa
-          SET status = %s, data_ultima_atualizacao = NOW()
-        WHERE id = %s AND empresa = %s
+       UPDATE pendencias_empresa p
+          SET status = v.status, data_ultima_atualizacao = NOW()
+         FROM (VALUES %s) AS v(id, status, empresa)
+        WHERE p.id = v.id
+          AND p.empresa = v.empresa
+          AND p.status IS DISTINCT FROM v.status
+    RETURNING p.id, p.documento, p.status, p.data_ultima_atualizacao
     """
-    params = [(_norm_status(stt), pid, empresa) for (pid, stt) in updates]
-    run_exec(sql, params, many=True)
-
-def calcular_status_prazo(data_str_ddmmyyyy, prazo_dias):
-    if not data_str_ddmmyyyy or prazo_dias in [None, "", " ", 0]:
-        return "Sem prazo"
-    try:
-        prazo_int = int(float(prazo_dias)) if str(prazo_dias).strip() else 0
-    except ValueError:
-        prazo_int = 0
-    if prazo_int <= 0:
-        return "Sem prazo"
-
-    try:
-        dt = datetime.strptime(str(data_str_ddmmyyyy), "%d/%m/%Y")
-    except Exception:
-        return "Sem prazo"
+    params = [(int(pid), _norm_status(stt), empresa) for (pid, stt) in updates]
+    return run_exec(sql, params, values=True, empresa=empresa)
 
-    limite = pd.Timestamp(dt) + pd.Timedelta(days=prazo_int)
-    if hasattr(limite, "to_pydatetime"):
-        limite = limite.to_pydatetime()
-    return "Atrasado" if datetime.now() > limite else "Dentro do prazo"
-
-def calcular_progresso(prazo_dias, ultima_transicao_em):
+def calcular_status_prazo_df(df):
     """
-    Retorna (percentual, cor_hex, dias_restantes, status_avaliado)
-    - percentual: 0..100
-    - cor: verde / amarelo / vermelho conforme % e atraso
+    status_prazo da carteira inteira de uma vez (sem apply por linha):
+    data da última movimentação + prazo_dias em dias úteis contra hoje.
     """
-    try:
-        p = int(float(prazo_dias)) if str(prazo_dias).strip() not in ["", "None", "nan", "NaN"] else 0
-    except Exception:
-        p = 0
+    prazos = calendario_uteis().avaliar(df["data_ultima_movimentacao"], df["prazo_dias"])
+    return categoria(prazos["status"], STATUS_PRAZO)
 
-    if not ultima_transicao_em or p <= 0:
-        return 0, "#2E7D32", None, "Sem prazo"  # verde discreto
+def calcular_progresso_df(df):
+    """
+    Progresso do prazo (dias úteis desde a última transição) para todas as linhas:
+    percentual (0..100), dias_restantes, status e cor da barra
+    (verde / amarelo a partir de 80% / vermelho se atrasado).
+    """
+    prog = calendario_uteis().avaliar(df["ultima_transicao_em"], df["prazo_dias"])
+    prog["cor"] = np.select(
+        [prog["status"] == "Atrasado", prog["percentual"] >= 80],
+        ["#C62828", "#F9A825"],
+        default="#2E7D32",
+    )
+    return prog
 
+# =========================================================
+# 🔥 AQUECIMENTO PÓS-LOGIN
+# =========================================================
+# Logo após o login, uma thread busca o recorte do usuário (agentes, KPIs,
+# carteira no período padrão e pendências de cada card) para o st.cache_data,
+# com as consultas independentes em paralelo. A 1ª renderização do Overview
+# espera esse aquecimento (um Future por sessão) em vez de disparar as mesmas
+# consultas ao mesmo tempo — mesma chave de cache, conexões do mesmo pool — e
+# encontra tudo quente. Comercial só aquece o próprio agente.
+AQUECIMENTO_LOGIN = bool(st.secrets.get("aquecimento_login", True))
+AQUECIMENTO_WORKERS = int(st.secrets.get("aquecimento_workers", 2))  # cada um segura 1 conexão do pool
+ESPERA_AQUECIMENTO_S = float(st.secrets.get("espera_aquecimento_s", 10))
+
+def periodo_padrao_overview():
+    hoje = pd.Timestamp.today()
+    return (hoje - pd.Timedelta(days=30)).date(), hoje.date()
+
+def _aquecer_carteira(tipo, agente, ctx):
+    filtro_agente = agente if tipo == "comercial" else None
+    data_ini, data_fim = periodo_padrao_overview()
     try:
-        start = pd.to_datetime(ultima_transicao_em)
+        with ThreadPoolExecutor(max_workers=AQUECIMENTO_WORKERS, thread_name_prefix="aquecimento",
+                                initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as ex:
+            paralelas = [ex.submit(listar_agentes), ex.submit(conta_kpis, filtro_agente, False),
+                         ex.submit(calendario_uteis)]
+            df = tabela_status_empresas(filtro_agente, data_ini, data_fim)
+            list(ex.map(lambda e: pendencias_df(e, apenas_pendentes=(tipo == "comercial")), df["empresa"]))
+            for f in paralelas:
+                f.result()
     except Exception:
-        return 0, "#2E7D32", None, "Sem prazo"
-
-    hoje = pd.Timestamp.now()
-    dias_passados = max(0, (hoje.normalize() - start.normalize()).days)
-    dias_restantes = p - dias_passados
-    frac = dias_passados / p if p > 0 else 0
-    perc = max(0, min(1, frac)) * 100
-
-    if dias_restantes < 0:
-        # atrasado
-        return 100, "#C62828", dias_restantes, "Atrasado"
-    elif perc >= 80:
-        return perc, "#F9A825", dias_restantes, "Dentro do prazo"
-    else:
-        return perc, "#2E7D32", dias_restantes, "Dentro do prazo"
+        pass  # aquecimento é só otimização: a tela busca o que faltar
+
+def iniciar_aquecimento(tipo, agente):
+    """Dispara o aquecimento e guarda o Future na sessão (só quando a 1ª tela é o Overview)."""
+    if st.session_state.get("tab", "Overview") != "Overview":
+        return None  # a tela de destino não usa o recorte: ela mesma consulta o que precisa
+    ctx = get_script_run_ctx()
+    futuro = Future()
+
+    def rodar():
+        futuro.set_running_or_notify_cancel()
+        _aquecer_carteira(tipo, agente, ctx)
+        futuro.set_result(None)
+
+    t = threading.Thread(target=rodar, name="aquecimento-login", daemon=True)
+    add_script_run_ctx(t, ctx)
+    t.start()
+    st.session_state["_aquecimento"] = futuro
+    return futuro
+
+def esperar_aquecimento():
+    """Espera o aquecimento em voo da sessão (uma vez); passado ESPERA_AQUECIMENTO_S, a tela segue sozinha."""
+    futuro = st.session_state.pop("_aquecimento", None)
+    if futuro is None:
+        return
+    try:
+        futuro.result(timeout=ESPERA_AQUECIMENTO_S)
+    except FuturoTimeout:
+        pass
 
 # =========================================================
 # OVERVIEW (Cards + filtros + botão "Ver no Workflow")
 # =========================================================
 
 def overview(tipo, agente_logado):
+    esperar_aquecimento()
     st.markdown("### 🎛️ Filtros")
     c1, c2, c3, c4 = st.columns([0.25, 0.25, 0.25, 0.25])
 
@@ -501,17 +1433,23 @@ def overview(tipo, agente_logado):
         if tipo == "comercial":
             filtro_agente = agente_logado  # força filtro do comercial logado
 
+    ini_padrao, fim_padrao = periodo_padrao_overview()
     with c2:
-        data_inicio = st.date_input("Data inicial", value=pd.Timestamp.today() - pd.Timedelta(days=30), format="DD/MM/YYYY")
+        data_inicio = st.date_input("Data inicial", value=ini_padrao, format="DD/MM/YYYY")
 
     with c3:
-        data_fim = st.date_input("Data final", value=pd.Timestamp.today(), format="DD/MM/YYYY")
+        data_fim = st.date_input("Data final", value=fim_padrao, format="DD/MM/YYYY")
 
     with c4:
         modo_tabela = st.toggle("Modo tabela", value=False, help="Alterna para a visão tabular clássica")
+        incluir_arquivadas = st.toggle("Incluir arquivadas", value=False,
+                                       help="Inclui empresas finalizadas/reprovadas já arquivadas")
 
-    # KPIs
-    t, a, r, p = conta_kpis(filtro_agente)
+    # KPIs (se estourarem o tempo, mostram "…" e a grade segue)
+    try:
+        t, a, r, p = conta_kpis(filtro_agente, incluir_arquivadas)
+    except ConsultaIndisponivel:
+        t = a = r = p = "…"
     k1, k2, k3, k4 = st.columns(4)
     with k1: kpi("Empresas", t)
     with k2: kpi("Aprovadas", a)
@@ -519,37 +1457,41 @@ def overview(tipo, agente_logado):
     with k4: kpi("Pendências totais", p)
 
     # Dados
-    df = tabela_status_empresas(
-        filtro_agente=filtro_agente,
-        data_ini=pd.to_datetime(data_inicio).date(),
-        data_fim=pd.to_datetime(data_fim).date()
-    )
+    try:
+        df = tabela_status_empresas(
+            filtro_agente=filtro_agente,
+            data_ini=pd.to_datetime(data_inicio).date(),
+            data_fim=pd.to_datetime(data_fim).date(),
+            incluir_arquivadas=incluir_arquivadas
+        )
+    except ConsultaIndisponivel as e:
+        carregando(e, "overview")
+        return
     if df.empty:
         st.info("Sem empresas no período/filtro selecionado.")
         return
 
     # status_prazo calculado a partir da última movimentação + prazo_dias
-    df = df.copy()
-    df["status_prazo"] = df.apply(
-        lambda r: calcular_status_prazo(
-            (pd.to_datetime(r.get("data_ultima_movimentacao")).strftime("%d/%m/%Y")
-             if pd.notnull(r.get("data_ultima_movimentacao")) else None),
-            r.get("prazo_dias")
-        ),
-        axis=1
-    )
+    df["status_prazo"] = calcular_status_prazo_df(df)
 
     # === Tabela clássica ===
     if modo_tabela:
         cols = ["empresa","agente","situacao","etapa_atual","responsavel_atual",
-                "prazo_dias","status_prazo","entrada_fmt","ultima_movimentacao_fmt",
-                "pendentes_restantes","limite"]
+                "prazo_dias","status_prazo","entrada","data_ultima_movimentacao",
+                "pendentes_restantes","limite"] + (["arquivada"] if incluir_arquivadas else [])
         show = [c for c in cols if c in df.columns]
-        st.dataframe(df[show], use_container_width=True, height=min(640, 80 + len(df)*28))
+        st.dataframe(
+            df[show], use_container_width=True, height=min(640, 80 + len(df)*28),
+            column_config={
+                "entrada": st.column_config.DateColumn("entrada", format="DD/MM/YYYY"),
+                "data_ultima_movimentacao": st.column_config.DateColumn("última movimentação", format="DD/MM/YYYY"),
+            }
+        )
         return
 
     # === Cards (visão visual e organizada) ===
     st.markdown("### 📋 Empresas (visão compacta)")
+    progresso = calcular_progresso_df(df)
     n_cols = 3
     rows = (len(df) + n_cols - 1) // n_cols
 
@@ -562,30 +1504,19 @@ def overview(tipo, agente_logado):
             row = df.iloc[idx]
 
             # chips e campos
-            etapa = row.get("etapa_atual") or "—"
-            resp = row.get("responsavel_atual") or "—"
+            etapa = fmt_txt(row.get("etapa_atual"))
+            resp = fmt_txt(row.get("responsavel_atual"))
             pend = safe_int(row.get("pendentes_restantes"))
             prazo = safe_int(row.get("prazo_dias"))
-            entrada = row.get("entrada_fmt") or "—"
-            ult = row.get("ultima_movimentacao_fmt") or "—"
+            entrada = fmt_data(row.get("entrada"))
+            ult = fmt_data(row.get("data_ultima_movimentacao"))
             limite = float(row.get("limite") or 0.0)
-            agente = row.get("agente") or "—"
-
-            # 🔄 Converte a data de última transição em datetime
-            ultima_transicao = row.get("ultima_transicao_em")
-            if pd.notnull(ultima_transicao) and ultima_transicao not in [None, "None", "NaT", ""]:
-                try:
-                    ultima_transicao = pd.to_datetime(ultima_transicao)
-                except Exception:
-                    ultima_transicao = None
-            else:
-                ultima_transicao = None
+            agente = fmt_txt(row.get("agente"))
 
-            # 🚦 Calcula progresso e status com base no prazo e última transição
-            perc, cor_barra, dias_rest, status_calc = calcular_progresso(
-                safe_int(row.get("prazo_dias")),
-                ultima_transicao
-            )
+            # 🚦 Progresso e status (dias úteis) já calculados para o frame inteiro
+            prog = progresso.iloc[idx]
+            perc, cor_barra, status_calc = prog["percentual"], prog["cor"], prog["status"]
+            dias_rest = None if pd.isna(prog["dias_restantes"]) else int(prog["dias_restantes"])
 
             # 🟡 Chip de status
             status_chip = (
@@ -616,7 +1547,7 @@ def overview(tipo, agente_logado):
                     <div style="margin-top:8px;font-size:.9rem;color:#FFF4E3CC;">
                         <div>📍 Etapa: <b>{etapa}</b> | Resp.: <b>{resp}</b></div>
                         <div>📅 Entrada: <b>{entrada}</b> | Última mov.: <b>{ult}</b></div>
-                        <div>🧾 Pendências: <b>{pend}</b> | ⏱ Prazo: <b>{prazo}</b> dias | <b>{prazo_label}</b></div>
+                        <div>🧾 Pendências: <b>{pend}</b> | ⏱ Prazo: <b>{prazo}</b> dias úteis | <b>{prazo_label}</b></div>
                         <div>💰 Limite: <b>R$ {limite:,.2f}</b></div>
                     </div>
                     <div style="margin-top:10px;">
@@ -633,11 +1564,14 @@ def overview(tipo, agente_logado):
 
                 # 📎 Expander com pendências
                 with st.expander("Ver pendências"):
-                    dpend = pendencias_df(row["empresa"], apenas_pendentes=(tipo == "comercial"))
+                    dpend = pendencias_df(row["empresa"], apenas_pendentes=(tipo == "comercial"),
+                                          incluir_arquivadas=bool(row.get("arquivada")))
                     st.dataframe(dpend, use_container_width=True, height=200)
 
-                # 🧭 Botão direto pro Workflow
-                if st.button(f"🧭 Ver no Workflow — {row['empresa']}", key=f"go_{row['empresa']}"):
+                # 🧭 Botão direto pro Workflow (arquivadas precisam ser restauradas antes)
+                if row.get("arquivada"):
+                    st.caption("🗄️ Empresa arquivada")
+                elif st.button(f"🧭 Ver no Workflow — {row['empresa']}", key=f"go_{row['empresa']}"):
                     st.session_state.selected_empresa = row["empresa"]
                     st.session_state.tab = "Workflow"
                     st.rerun()
@@ -678,51 +1612,84 @@ def detalhada(tipo, agente):
                 st.info("📨 Fluxo iniciado: o analista tem **1 dia** para posicionar o cliente.")
                 st.rerun()
 
+    # 🗄️ Restauração de empresas arquivadas (analista/liderança)
+    if tipo in ["analista", "Diretor", "CEO"]:
+        with st.expander("🗄️ Empresas arquivadas", expanded=False):
+            arq = listar_arquivadas()
+            if arq.empty:
+                st.caption("Nenhuma empresa arquivada.")
+            else:
+                emp_arq = st.selectbox("Empresa arquivada", arq["empresa"].tolist())
+                if st.button("♻️ Restaurar empresa", use_container_width=True):
+                    try:
+                        if restaurar_empresa(emp_arq):
+                            st.success(f"Empresa '{emp_arq}' restaurada para a carteira ativa.")
+                            st.rerun()
+                        else:
+                            st.warning("Empresa não encontrada no arquivo.")
+                    except Exception as e:
+                        st.error(f"Erro ao restaurar empresa: {e}")
+
     # 👇 lista de empresas para o selectbox
-    df = tabela_status_empresas(None if tipo != "comercial" else agente)
-    if df.empty:
+    empresas = listar_empresas(None if tipo != "comercial" else agente)
+    if not empresas:
         st.info("Sem empresas para exibir.")
         return
 
-    empresa = st.selectbox("Escolha a empresa:", df["empresa"].tolist())
+    empresa = st.selectbox("Escolha a empresa:", empresas)
 
     # Garante pendências base
     ensure_pendencias_empresa(empresa)
 
     # Carrega dados atuais
-    dados = run_query_df("SELECT * FROM analise_credito WHERE empresa = %s", (empresa,))
+    dados = run_query_df_cache("dados_empresa", (empresa,), tabelas=("analise_credito",),
+                               empresa=empresa, motor="preparada")
     if dados.empty:
         st.warning("Empresa não encontrada.")
         return
     row = dados.iloc[0].to_dict()
 
+    # Foto da linha como o usuário a abriu: base do diff e da checagem de versão ao salvar
+    chave_foto = "_foto_empresa"
+    foto = st.session_state.get(chave_foto)
+    if not foto or foto.get("empresa") != empresa:
+        foto = st.session_state[chave_foto] = row
+    if int(row.get("versao") or 0) != int(foto.get("versao") or 0):
+        st.warning("⚠️ Esta empresa foi alterada por outra pessoa depois que você a abriu.")
+        if st.button("🔄 Recarregar dados atuais", key=f"recarregar_{empresa}"):
+            st.session_state.pop(chave_foto, None)
+            st.rerun()
+
     st.markdown("### 🧰 Edição Completa" if tipo != "comercial" else "### 📄 Detalhe da Empresa")
 
     # Formulário (analista/liderança pode editar; comercial só vê)
     editable = (tipo in ["analista", "Diretor", "CEO"])
     col1, col2, col3 = st.columns([0.33, 0.34, 0.33])
+    # valores como o formulário mostra (mesma normalização do diff ao salvar)
+    form = valores_formulario(row, SITUACOES)
 
     with col1:
         situacao = st.selectbox(
             "Situação",
             SITUACOES,
-            index=SITUACOES.index(row.get("situacao","Em análise")) if row.get("situacao") in SITUACOES else 0,
+            index=SITUACOES.index(form["situacao"]),
             disabled=not editable
         )
         limite = st.number_input("Limite (R$)", min_value=0.0, format="%.2f",
-                                 value=float(row.get("limite") or 0), disabled=not editable)
+                                 value=form["limite"], disabled=not editable)
         saida_credito = st.text_input("Saída Crédito (DD-MM-YYYY)",
-                                      value=(row.get("saida_credito") or ""), disabled=not editable)
+                                      value=form["saida_credito"].strftime("%d-%m-%Y") if form["saida_credito"] else "",
+                                      disabled=not editable)
 
     with col2:
         comentario_interno = st.text_area("Comentário Interno",
-                                          value=row.get("comentario_interno") or "",
+                                          value=form["comentario_interno"],
                                           height=120, disabled=not editable)
 
     with col3:
-        pend_count = run_query_df(
-            "SELECT COUNT(*) FROM pendencias_empresa WHERE empresa=%s AND status='pendente'",
-            (empresa,)
+        pend_count = run_query_df_cache(
+            "qtd_pendentes_empresa", (empresa,), tabelas=("pendencias_empresa", "analise_credito"),
+            empresa=empresa, motor="preparada"
         ).iloc[0,0]
         st.markdown(
             f"""
@@ -737,23 +1704,23 @@ def detalhada(tipo, agente):
     c1, c2, c3, c4, c5 = st.columns(5)
     with c1:
         envio_das = st.selectbox("Envio DAS", SIM_NAO,
-                                 index=SIM_NAO.index("Sim" if (row.get("envio_das") or "").lower()=="sim" else "Não"),
+                                 index=SIM_NAO.index(form["envio_das"]),
                                  disabled=not editable)
     with c2:
         emissao_contrato = st.selectbox("Emissão contrato", SIM_NAO,
-                                        index=SIM_NAO.index("Sim" if (row.get("emissao_contrato") or "").lower()=="sim" else "Não"),
+                                        index=SIM_NAO.index(form["emissao_contrato"]),
                                         disabled=not editable)
     with c3:
         assinatura = st.selectbox("Assinatura", SIM_NAO,
-                                  index=SIM_NAO.index("Sim" if (row.get("assinatura") or "").lower()=="sim" else "Não"),
+                                  index=SIM_NAO.index(form["assinatura"]),
                                   disabled=not editable)
     with c4:
         homologacao = st.selectbox("Homologação", SIM_NAO,
-                                   index=SIM_NAO.index("Sim" if (row.get("homologacao") or "").lower()=="sim" else "Não"),
+                                   index=SIM_NAO.index(form["homologacao"]),
                                    disabled=not editable)
     with c5:
         apto_a_operar = st.selectbox("Apto a operar", SIM_NAO,
-                                     index=SIM_NAO.index("Sim" if (row.get("apto_a_operar") or "").lower()=="sim" else "Não"),
+                                     index=SIM_NAO.index(form["apto_a_operar"]),
                                      disabled=not editable)
 
     # PENDÊNCIAS
@@ -761,28 +1728,31 @@ def detalhada(tipo, agente):
     if editable:
         st.caption("Marque **Recebido** quando o documento chegar.")
         ptable = pendencias_df(empresa, apenas_pendentes=False)
-        df_edit = ptable.copy()
-        for i, r in df_edit.iterrows():
-            c1x, c2x, c3x, c4x = st.columns([0.08, 0.52, 0.2, 0.2])
-            c1x.write(int(r["id"]))
-            c2x.write(r["documento"])
-            novo = c3x.selectbox(
-                "Status",
-                ["Pendente","Recebido"],
-                index=(0 if r["status"]!="recebido" else 1),
-                key=f"pend_{empresa}_{int(r['id'])}"
-            )
-            c4x.write(r["data_ultima_atualizacao"])
-            df_edit.loc[i, "status"] = "recebido" if novo == "Recebido" else "pendente"
+        ptable["status"] = ptable["status"].map(lambda s: "Recebido" if s == "recebido" else "Pendente")
+
+        # Um único grid (nº de widgets constante, qualquer que seja o nº de documentos)
+        chave_editor = f"pend_editor_{empresa}"
+        editado = st.data_editor(
+            ptable,
+            key=chave_editor,
+            hide_index=True,
+            use_container_width=True,
+            disabled=["id", "documento", "data_ultima_atualizacao"],
+            column_config={
+                "id": st.column_config.NumberColumn("ID", width="small"),
+                "documento": st.column_config.TextColumn("Documento", width="large"),
+                "status": st.column_config.SelectboxColumn("Status", options=["Pendente", "Recebido"], required=True),
+                "data_ultima_atualizacao": st.column_config.DatetimeColumn("Última atualização", format="DD/MM/YYYY HH:mm"),
+            },
+        )
 
         if st.button("💾 Salvar pendências", use_container_width=True, type="primary"):
-            ups = []
-            for i, r in df_edit.iterrows():
-                if r["status"] != ptable.loc[i,"status"]:
-                    ups.append( (int(r["id"]), r["status"]) )
+            mudou = editado["status"] != ptable["status"]
+            ups = list(zip(editado.loc[mudou, "id"], editado.loc[mudou, "status"]))
             if ups:
-                atualizar_pendencias(empresa, ups)
-                st.success("Pendências atualizadas!")
+                novas = atualizar_pendencias(empresa, ups)
+                st.session_state.pop(chave_editor, None)
+                st.success(f"Pendências atualizadas! ({len(novas or [])} documento(s))")
                 st.rerun()
             else:
                 st.info("Nenhuma alteração a salvar.")
@@ -814,16 +1784,40 @@ def detalhada(tipo, agente):
             else:
                 payload["saida_credito"] = None
 
+            payload = campos_alterados(foto, payload, SITUACOES)
+            if not payload:
+                st.info("Nenhuma alteração a salvar.")
+                st.stop()
             try:
-                atualizar_campos_empresa(empresa, payload)
-                st.success("Empresa atualizada com sucesso!")
-                st.rerun()
+                nova_versao = atualizar_campos_empresa(empresa, payload, versao=foto.get("versao") or 0)
             except Exception as e:
                 st.error(f"Erro ao salvar no banco: {e}")
+                st.stop()
+            if nova_versao is None:
+                st.error("Conflito: outra pessoa salvou esta empresa enquanto você editava. "
+                         "Recarregue os dados atuais e refaça as alterações: "
+                         + ", ".join(payload))
+            else:
+                st.session_state.pop(chave_foto, None)
+                st.success("Empresa atualizada com sucesso!")
+                st.rerun()
 
 # =========================================================
 # 🧭 WORKFLOW – com restrição por tipo de usuário
 # =========================================================
+LOG_POR_PAGINA = 20
+
+def pagina_log(empresa, cursor=None):
+    """
+    Uma página do histórico (+1 linha para saber se há próxima).
+    `cursor` = (created_at, id) da última linha da página anterior; None = mais recentes.
+    """
+    if cursor is None:
+        return run_query_df_cache("log_empresa_inicio", (empresa, LOG_POR_PAGINA + 1),
+                                  tabelas=("log_workflow",), empresa=empresa, motor="preparada")
+    return run_query_df_cache("log_empresa_apos", (empresa, *cursor, LOG_POR_PAGINA + 1),
+                              tabelas=("log_workflow",), empresa=empresa, motor="preparada")
+
 def workflow(tipo, agente):
     st.markdown("## 🧭 Controle de Workflow")
     st.caption("Gerencie as etapas, prazos e responsáveis das análises de crédito de forma visual e organizada.")
@@ -835,13 +1829,14 @@ def workflow(tipo, agente):
 
     # 🔒 Restrição de acesso para comerciais
     if tipo == "comercial":
-        df_emp = run_query_df(
+        df_emp = run_query_df_cache(
             "SELECT empresa, etapa_atual, responsavel_atual FROM analise_credito WHERE agente = %s ORDER BY empresa",
-            (agente,)
+            (agente,), tabelas=("analise_credito",)
         )
     else:
-        df_emp = run_query_df(
-            "SELECT empresa, etapa_atual, responsavel_atual FROM analise_credito ORDER BY empresa"
+        df_emp = run_query_df_cache(
+            "SELECT empresa, etapa_atual, responsavel_atual FROM analise_credito ORDER BY empresa",
+            tabelas=("analise_credito",)
         )
 
     if df_emp.empty:
@@ -855,11 +1850,14 @@ def workflow(tipo, agente):
     empresa = st.selectbox("Selecione uma empresa", empresas_lista, index=idx_default)
     st.session_state.selected_empresa = empresa
 
-    dados = run_query_df("SELECT * FROM analise_credito WHERE empresa = %s", (empresa,))
+    dados = run_query_df_cache("dados_empresa", (empresa,), tabelas=("analise_credito",),
+                               empresa=empresa, motor="preparada")
     if dados.empty:
         st.warning("Empresa não encontrada.")
         return
     row = dados.iloc[0].to_dict()
+    resumo = run_query_df_cache("resumo_log_empresa", (empresa,), tabelas=("log_workflow",),
+                                empresa=empresa, motor="preparada").iloc[0]
 
     # Cabeçalho
     st.markdown(f"""
@@ -870,15 +1868,16 @@ def workflow(tipo, agente):
         <b>Responsável:</b> {row.get('responsavel_atual','Analista')} |
         <b>Última atualização:</b> {row.get('data_ultima_movimentacao')}
         </p>
+        <p style="margin:4px 0 0 0;">
+        <b>Transições:</b> {int(resumo['transicoes'])} |
+        <b>Na etapa atual há:</b> {fmt_duracao(resumo['seg_etapa_atual'])} |
+        <b>Tempo total:</b> {fmt_duracao(resumo['seg_total'])}
+        </p>
     </div>
     """, unsafe_allow_html=True)
 
     # Timeline
-    etapas = [
-        "Cadastro", "Pendência de Posicionamento", "Aguardando Documentos", "Em Análise",
-        "Aguardando Documentos Finais", "Elaboração Contrato", "Assinatura Cliente",
-        "Formalização Gestora", "Finalizado"
-    ]
+    etapas = ETAPAS
     etapa_atual = row.get("etapa_atual", "Cadastro")
     st.markdown("### 📜 Etapas do Processo")
     timeline = []
@@ -895,29 +1894,45 @@ def workflow(tipo, agente):
     if tipo in ["analista", "Diretor", "CEO"]:
         st.markdown("### 🔄 Atualizar Workflow")
         nova_etapa = st.selectbox("Nova Etapa", etapas, index=etapas.index(etapa_atual))
-        novo_resp = st.selectbox("Novo Responsável", ["Analista", "Comercial", "Gestora"])
-        prazo_dias = st.number_input("Prazo (dias)", min_value=0, step=1, value=2)
+        novo_resp = st.selectbox("Novo Responsável", RESPONSAVEIS)
+        prazo_dias = st.number_input("Prazo (dias úteis)", min_value=0, step=1, value=2)
 
         if st.button("💾 Registrar Transição", use_container_width=True, type="primary"):
             try:
                 registrar_transicao(empresa, nova_etapa, novo_resp, prazo_dias)
+                st.session_state.pop(f"log_paginas_{empresa}", None)
                 st.success(f"✅ Etapa '{nova_etapa}' atualizada com sucesso! Responsável: {novo_resp}")
                 st.rerun()
             except Exception as e:
                 st.error(f"Erro ao registrar transição: {e}")
 
-    # Log
-    df_log = run_query_df("""
-        SELECT etapa, responsavel, created_at, prazo_dias, status_prazo
-          FROM log_workflow
-         WHERE empresa = %s
-         ORDER BY created_at DESC;
-    """, (empresa,))
+    # Log (uma página por vez; a pilha guarda o cursor de cada página já visitada)
     st.markdown("### 🕒 Histórico de Movimentações")
-    if df_log.empty:
+    chave_pag = f"log_paginas_{empresa}"
+    paginas = st.session_state.setdefault(chave_pag, [None])
+    df_log = pagina_log(empresa, paginas[-1])
+    tem_mais = len(df_log) > LOG_POR_PAGINA
+    df_log = df_log.head(LOG_POR_PAGINA)
+    if df_log.empty and len(paginas) == 1:
         st.info("Nenhuma transição registrada ainda.")
     else:
-        st.dataframe(df_log, use_container_width=True, height=300)
+        if df_log.empty:
+            # página vazia (o histórico mudou depois do clique): a navegação continua na tela
+            st.info("Nenhuma transição nesta página — o histórico mudou desde a página anterior.")
+            if st.button("⏮️ Voltar às mais recentes", use_container_width=True):
+                paginas[:] = [None]
+                st.rerun()
+        else:
+            st.dataframe(df_log.drop(columns="id"), use_container_width=True, hide_index=True)
+        p1, p2, p3 = st.columns([0.3, 0.4, 0.3])
+        if p1.button("⬅️ Mais recentes", disabled=len(paginas) == 1, use_container_width=True):
+            paginas.pop()
+            st.rerun()
+        p2.caption(f"Página {len(paginas)} · {LOG_POR_PAGINA} por página · {int(resumo['transicoes'])} no total")
+        if p3.button("Mais antigas ➡️", disabled=not tem_mais, use_container_width=True):
+            ultima = df_log.iloc[-1]
+            paginas.append((pd.Timestamp(ultima["created_at"]).to_pydatetime(), int(ultima["id"])))
+            st.rerun()
 
         # Excluir (somente analista)
         if tipo == "analista":
@@ -927,9 +1942,9 @@ def workflow(tipo, agente):
             if confirmar:
                 if st.button(f"🗑️ Excluir empresa '{empresa}'", type="secondary", use_container_width=True):
                     try:
-                        run_exec("DELETE FROM pendencias_empresa WHERE empresa = %s", (empresa,))
-                        run_exec("DELETE FROM log_workflow WHERE empresa = %s", (empresa,))
-                        run_exec("DELETE FROM analise_credito WHERE empresa = %s", (empresa,))
+                        run_exec("DELETE FROM pendencias_empresa WHERE empresa = %s", (empresa,), empresa=empresa)
+                        run_exec("DELETE FROM log_workflow WHERE empresa = %s", (empresa,), empresa=empresa)
+                        run_exec("DELETE FROM analise_credito WHERE empresa = %s", (empresa,), empresa=empresa)
                         st.success(f"✅ Empresa '{empresa}' e seus registros foram removidos com sucesso!")
                         st.rerun()
                     except Exception as e:
@@ -938,6 +1953,73 @@ def workflow(tipo, agente):
                 st.info("Marque a caixa de confirmação para habilitar o botão de exclusão.")
 
 
+# =========================================================
+# 📈 CARTEIRA (exposição por agente / situação / etapa / mês)
+# =========================================================
+def carteira(tipo, agente):
+    st.markdown("## 📈 Carteira — Exposição de Limites")
+    st.caption("Agregados pré-calculados (rollup_limites); empresas arquivadas não entram.")
+
+    filtro_agente = agente if tipo == "comercial" else None
+    if tipo != "comercial":
+        agentes = ["Todos"] + rollup_limites(["agente"])["agente"].tolist()
+        agente_sel = st.selectbox("Comercial", agentes, key="carteira_agente")
+        filtro_agente = None if agente_sel == "Todos" else agente_sel
+
+    tot = rollup_limites([], agente=filtro_agente)
+    qtd = int(tot["qtd_empresas"].sum()) if not tot.empty else 0
+    exp = float(tot["limite_total"].sum()) if not tot.empty else 0.0
+    k1, k2, k3 = st.columns(3)
+    with k1: kpi("Empresas ativas", qtd)
+    with k2: kpi("Limite total", f"R$ {exp:,.0f}")
+    with k3: kpi("Limite médio", f"R$ {exp / qtd:,.0f}" if qtd else "—")
+
+    if not qtd:
+        st.info("Sem empresas na carteira para o filtro selecionado.")
+        return
+
+    g1, g2 = st.columns(2)
+    with g1:
+        if filtro_agente:
+            por_sit = rollup_limites(["situacao"], agente=filtro_agente)
+            fig = px.pie(por_sit, names="situacao", values="limite_total", hole=0.5,
+                         title="Limite por situação")
+        else:
+            por_ag = rollup_limites(["agente", "situacao"])
+            fig = px.bar(por_ag, x="agente", y="limite_total", color="situacao",
+                         title="Limite por comercial e situação")
+        st.plotly_chart(_tema_grafico(fig), use_container_width=True)
+    with g2:
+        por_etapa = rollup_limites(["etapa_atual"], agente=filtro_agente)
+        fig = px.bar(por_etapa, x="limite_total", y="etapa_atual", orientation="h",
+                     category_orders={"etapa_atual": ETAPAS}, text="qtd_empresas",
+                     title="Limite por etapa (rótulo = nº de empresas)")
+        st.plotly_chart(_tema_grafico(fig), use_container_width=True)
+
+    por_mes = rollup_limites(["mes_entrada", "situacao"], agente=filtro_agente)
+    por_mes = por_mes[por_mes["mes_entrada"] != "—"]
+    fig = px.bar(por_mes, x="mes_entrada", y="limite_total", color="situacao",
+                 title="Limite por mês de entrada")
+    st.plotly_chart(_tema_grafico(fig), use_container_width=True)
+
+    # 🧩 Completude documental (máscaras de pendências)
+    st.markdown("### 🧩 Completude documental")
+    docs = documentos_bits()["documento"].tolist()
+    faltando = st.multiselect("Somente empresas com pendente:", docs,
+                              placeholder="ex.: Contrato social")
+    matriz = matriz_documentos(filtro_agente, faltando)
+    st.caption(f"{len(matriz)} empresa(s) | ❌ pendente · ✅ recebido")
+    st.dataframe(matriz, use_container_width=True, hide_index=True,
+                 height=min(640, 80 + len(matriz) * 35))
+
+def _tema_grafico(fig):
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)", plot_bgcolor="rgba(0,0,0,0)",
+        font_color=HONEYDEW, legend_title_text="", xaxis_title=None, yaxis_title=None,
+        colorway=[HARVEST_GOLD, "#2E7D32", "#C62828", SLATE_GRAY, "#F9A825"],
+    )
+    return fig
+
 # =========================================================
 # 📅 CALENDÁRIO DE ANOTAÇÕES PESSOAIS
 # =========================================================
@@ -1048,6 +2130,7 @@ def calendario(tipo, agente):
 # =========================================================
 # 📊 INTERFACE / ROTEAMENTO
 # =========================================================
+st.session_state["_consultas_rerun"] = 0
 header()
 if "user" not in st.session_state:
     login_box()
@@ -1058,7 +2141,7 @@ sidebar_content()
 if "tab" not in st.session_state:
     st.session_state.tab = "Overview"
 
-colA, colB, colC, colD = st.columns(4)
+colA, colB, colC, colD, colE = st.columns(5)
 with colA:
     if st.button("📊 Overview", use_container_width=True):
         st.session_state.tab = "Overview"
@@ -1071,12 +2154,17 @@ with colC:
 with colD:
     if st.button("📅 Calendário", use_container_width=True):
         st.session_state.tab = "Calendário"
-
-if st.session_state.tab == "Overview":
-    overview(st.session_state.tipo, st.session_state.agente)
-elif st.session_state.tab == "Detalhada":
-    detalhada(st.session_state.tipo, st.session_state.agente)
-elif st.session_state.tab == "Workflow":
-    workflow(st.session_state.tipo, st.session_state.agente)
-elif st.session_state.tab == "Calendário":
-    calendario(st.session_state.tipo, st.session_state.agente)
\ No newline at end of file
+with colE:
+    if st.button("📈 Carteira", use_container_width=True):
+        st.session_state.tab = "Carteira"
+
+TELAS = {"Overview": overview, "Detalhada": detalhada, "Workflow": workflow,
+         "Calendário": calendario, "Carteira": carteira}
+try:
+    TELAS[st.session_state.tab](st.session_state.tipo, st.session_state.agente)
+except ConsultaIndisponivel as e:
+    carregando(e, st.session_state.tab)
+
+# ⏱️ Tempo do clique em "Entrar" até o fim da 1ª renderização (com/sem aquecimento)
+if "_login_em" in st.session_state:
+    st.session_state["_ttfr_login_s"] = time.perf_counter() - st.session_state.pop("_login_em")
\ No newline at end of file
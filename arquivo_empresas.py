@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivo de empresas encerradas: tabelas *_arquivo, funções de arquivar/restaurar
+e as views *_todas (ativo ∪ arquivo) usadas pelo toggle "Incluir arquivadas".
+
+As linhas passam entre as tabelas ativas e as de arquivo com listas de colunas
+explícitas, casadas pelo nome (nunca pela posição): colunas acrescentadas depois
+(ALTER TABLE ... ADD COLUMN) entram no fim de cada tabela, e a ordem das duas
+pode divergir.
+"""
+
+TABELAS_ARQUIVAVEIS = ("analise_credito", "pendencias_empresa", "log_workflow")
+
+SQL_FUNCOES_ARQUIVO = """
+CREATE TABLE IF NOT EXISTS empresas_arquivadas (
+    empresa      TEXT PRIMARY KEY,
+    arquivado_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS analise_credito_arquivo    (LIKE analise_credito);
+CREATE TABLE IF NOT EXISTS pendencias_empresa_arquivo (LIKE pendencias_empresa);
+CREATE TABLE IF NOT EXISTS log_workflow_arquivo       (LIKE log_workflow);
+CREATE INDEX IF NOT EXISTS idx_aca_empresa ON analise_credito_arquivo(empresa);
+CREATE INDEX IF NOT EXISTS idx_pea_empresa ON pendencias_empresa_arquivo(empresa);
+CREATE INDEX IF NOT EXISTS idx_lwa_empresa ON log_workflow_arquivo(empresa, created_at DESC);
+
+-- "col1, col2, ..." na ordem da tabela
+CREATE OR REPLACE FUNCTION colunas_tabela(tabela regclass) RETURNS text AS $$
+    SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum)
+      FROM pg_attribute
+     WHERE attrelid = tabela AND attnum > 0 AND NOT attisdropped
+$$ LANGUAGE sql STABLE;
+
+-- Move as linhas das `empresas` de `origem` para `destino`, coluna a coluna pelo
+-- nome (todas as de origem; coluna que falte no destino é erro, não perda de dado).
+CREATE OR REPLACE FUNCTION mover_linhas_empresas(origem regclass, destino regclass, empresas text[])
+RETURNS void AS $$
+DECLARE
+    cols text := colunas_tabela(origem);
+BEGIN
+    EXECUTE format(
+        'WITH m AS (DELETE FROM %s WHERE empresa = ANY($1) RETURNING %s) INSERT INTO %s (%s) SELECT %s FROM m',
+        origem, cols, destino, cols, cols) USING empresas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- {tabela}_todas = ativas ∪ arquivo, com as colunas da tabela ativa
+CREATE OR REPLACE FUNCTION recriar_view_todas(tabela text) RETURNS void AS $$
+DECLARE
+    cols text := colunas_tabela(tabela::regclass);
+BEGIN
+    EXECUTE format('DROP VIEW IF EXISTS %I', tabela || '_todas');
+    EXECUTE format(
+        'CREATE VIEW %I AS SELECT %s, FALSE AS arquivada FROM %I UNION ALL SELECT %s, TRUE AS arquivada FROM %I',
+        tabela || '_todas', cols, tabela, cols, tabela || '_arquivo');
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION arquivar_empresas_encerradas(carencia_dias int) RETURNS int AS $$
+DECLARE
+    alvos text[];
+BEGIN
+    -- só um processo arquiva por vez; os demais simplesmente pulam
+    IF NOT pg_try_advisory_xact_lock(hashtext('arquivar_empresas')) THEN
+        RETURN 0;
+    END IF;
+    SELECT array_agg(empresa) INTO alvos
+      FROM analise_credito
+     WHERE (etapa_atual = 'Finalizado' OR situacao = 'Reprovada')
+       AND COALESCE(data_ultima_movimentacao, entrada) < NOW() - make_interval(days => carencia_dias);
+    IF alvos IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    -- analise_credito primeiro: o trigger de máscara das pendências não a toca mais
+    PERFORM mover_linhas_empresas('analise_credito', 'analise_credito_arquivo', alvos);
+    PERFORM mover_linhas_empresas('pendencias_empresa', 'pendencias_empresa_arquivo', alvos);
+    PERFORM mover_linhas_empresas('log_workflow', 'log_workflow_arquivo', alvos);
+
+    INSERT INTO empresas_arquivadas (empresa)
+    SELECT unnest(alvos)
+    ON CONFLICT (empresa) DO UPDATE SET arquivado_em = NOW();
+    RETURN cardinality(alvos);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION restaurar_empresa_arquivada(nome text) RETURNS boolean AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM empresas_arquivadas WHERE empresa = nome) THEN
+        RETURN FALSE;
+    END IF;
+    PERFORM mover_linhas_empresas('analise_credito_arquivo', 'analise_credito', ARRAY[nome]);
+    -- máscaras/contador refeitos pelo trigger ao reinserir as pendências (a dim pode ter mudado)
+    UPDATE analise_credito SET pendentes_mask = 0, recebidos_mask = 0, pendentes_fora_dim = 0
+     WHERE empresa = nome;
+    PERFORM mover_linhas_empresas('pendencias_empresa_arquivo', 'pendencias_empresa', ARRAY[nome]);
+    PERFORM mover_linhas_empresas('log_workflow_arquivo', 'log_workflow', ARRAY[nome]);
+    DELETE FROM empresas_arquivadas WHERE empresa = nome;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+"""
@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Cache compartilhado entre processos (vários Streamlit atrás de um balanceador).
+
+- BackendDisco: diretório local privado (ou em tmpfs/shm), visível aos processos do
+  mesmo usuário na máquina.
+- BackendRedis: qualquer cliente compatível com redis-py (get/set/incr/mget);
+  em teste/local pode ser trocado por um stand-in em memória (BackendMemoria).
+
+As entradas são versionadas por tabela: quem escreve chama `invalidar(tabelas)`,
+o contador da tabela sobe e a próxima leitura de cada consulta recalcula e
+substitui a entrada antiga (uma por consulta; as esquecidas expiram pelo TTL).
+Se o backend falhar ao subir um contador, a tabela fica pendente no processo:
+`versoes` tenta de novo e, até conseguir, falha também (a leitura segue sem o
+cache, em vez de servir a entrada da versão antiga como atual).
+"""
+import fcntl
+import hashlib
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+
+INTERVALO_LIMPEZA_S = 60   # varredura das entradas expiradas, no máximo uma por intervalo
+
+class ErroBackend(Exception):
+    """Backend fora do ar / inacessível (o chamador segue sem o cache)."""
+
+# erros de backend que fazem o cache ser ignorado — nunca os da própria consulta
+ERROS_BACKEND = (ErroBackend, OSError)
+
+# =========================================================
+# 💾 BACKENDS
+# =========================================================
+class BackendMemoria:
+    """Stand-in em memória (um processo só) com a mesma interface dos outros."""
+    def __init__(self, intervalo_limpeza=INTERVALO_LIMPEZA_S):
+        self._dados = {}
+        self._lock = threading.Lock()
+        self._intervalo_limpeza = intervalo_limpeza
+        self._limpo_em = time.time()
+
+    def get(self, chave):
+        with self._lock:
+            valor, expira = self._dados.get(chave, (None, None))
+            if expira is not None and expira < time.time():
+                self._dados.pop(chave, None)
+                return None
+            return valor
+
+    def mget(self, chaves):
+        return [self.get(c) for c in chaves]
+
+    def _limpar(self, agora):
+        """Tira as entradas expiradas que ninguém mais lê (chamado com o lock)."""
+        if agora - self._limpo_em < self._intervalo_limpeza:
+            return
+        self._limpo_em = agora
+        for chave in [c for c, (_, expira) in self._dados.items() if expira is not None and expira < agora]:
+            del self._dados[chave]
+
+    def set(self, chave, valor, ex=None):
+        with self._lock:
+            agora = time.time()
+            self._limpar(agora)
+            self._dados[chave] = (valor, agora + ex if ex else None)
+
+    def incr(self, chave):
+        with self._lock:
+            valor, _ = self._dados.get(chave, (b"0", None))
+            novo = int(valor) + 1
+            self._dados[chave] = (str(novo).encode(), None)
+            return novo
+
+
+class BackendDisco:
+    """
+    Um arquivo por chave; escrita atômica (os.replace) e incr sob flock.
+    O diretório é privado (0700, do próprio usuário): o conteúdo é desserializado
+    com pickle, então ninguém mais pode gravar nele.
+    """
+    def __init__(self, diretorio, intervalo_limpeza=INTERVALO_LIMPEZA_S):
+        self.diretorio = diretorio
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+        info = os.stat(diretorio)
+        if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+            raise ValueError(f"Diretório do cache {diretorio} precisa ser do próprio usuário e com permissão 0700.")
+        self._intervalo_limpeza = intervalo_limpeza
+        self._limpo_em = time.time()
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, hashlib.sha1(chave.encode()).hexdigest())
+
+    @staticmethod
+    def _expirado(f, agora):
+        expira = float(f.readline() or 0)
+        return bool(expira and expira < agora)
+
+    def get(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, "rb") as f:
+                if self._expirado(f, time.time()):
+                    return None
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def mget(self, chaves):
+        return [self.get(c) for c in chaves]
+
+    def _limpar(self, agora):
+        """Apaga os arquivos expirados (e temporários esquecidos por um processo que caiu)."""
+        if agora - self._limpo_em < self._intervalo_limpeza:
+            return
+        self._limpo_em = agora
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                if nome.startswith("tmp"):
+                    if os.path.getmtime(caminho) < agora - 3600:
+                        os.remove(caminho)
+                elif not nome.endswith(".lock"):
+                    with open(caminho, "rb") as f:
+                        expirado = self._expirado(f, agora)
+                    if expirado:
+                        os.remove(caminho)
+            except (OSError, ValueError):
+                continue  # outro processo apagou/trocou o arquivo no meio
+
+    def set(self, chave, valor, ex=None):
+        agora = time.time()
+        self._limpar(agora)
+        expira = f"{agora + ex if ex else 0}\n".encode()
+        fd, tmp = tempfile.mkstemp(dir=self.diretorio)
+        with os.fdopen(fd, "wb") as f:
+            f.write(expira)
+            f.write(valor)
+        os.replace(tmp, self._caminho(chave))
+
+    def incr(self, chave):
+        with open(self._caminho(chave) + ".lock", "a") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            novo = int(self.get(chave) or 0) + 1
+            self.set(chave, str(novo).encode())
+            return novo
+
+
+class BackendRedis:
+    """Adaptador fino para redis-py (ou qualquer cliente com a mesma interface)."""
+    def __init__(self, cliente, erros=()):
+        self.cliente = cliente
+        self._erros = tuple(erros)  # exceções do cliente que significam "backend fora do ar"
+
+    @classmethod
+    def de_url(cls, url):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Backend 'redis' requer o pacote redis (pip install redis).") from e
+        return cls(redis.Redis.from_url(url), erros=(redis.RedisError,))
+
+    def _chamar(self, metodo, *args, **kwargs):
+        try:
+            return getattr(self.cliente, metodo)(*args, **kwargs)
+        except self._erros as e:
+            raise ErroBackend(str(e)) from e
+
+    def get(self, chave):
+        return self._chamar("get", chave)
+
+    def mget(self, chaves):
+        return self._chamar("mget", chaves)
+
+    def set(self, chave, valor, ex=None):
+        self._chamar("set", chave, valor, ex=ex)
+
+    def incr(self, chave):
+        return self._chamar("incr", chave)
+
+# =========================================================
+# 🔁 CACHE VERSIONADO
+# =========================================================
+_AUSENTE = object()
+# entrada truncada/corrompida ou de outra versão do código
+_ERROS_DESSERIALIZAR = (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+                        IndexError, TypeError, ValueError)
+
+class CacheCompartilhado:
+    def __init__(self, backend, namespace="credito", ttl=600):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._pendentes = set()   # tabelas cujo contador não subiu (backend falhou)
+        self._stats = {"hits": 0, "misses": 0, "serializacao_s": 0.0,
+                       "desserializacao_s": 0.0, "bytes_gravados": 0}
+
+    def _chave_versao(self, tabela):
+        return f"{self.namespace}:v:{tabela}"
+
+    def _subir_pendentes(self):
+        with self._lock:
+            pendentes = sorted(self._pendentes)
+        for t in pendentes:
+            self.backend.incr(self._chave_versao(t))
+            with self._lock:
+                self._pendentes.discard(t)
+
+    def versoes(self, tabelas):
+        if self._pendentes:
+            self._subir_pendentes()
+        valores = self.backend.mget([self._chave_versao(t) for t in tabelas])
+        return tuple(int(v or 0) for v in valores)
+
+    def invalidar(self, tabelas):
+        with self._lock:
+            self._pendentes.update(tabelas)
+        self._subir_pendentes()
+
+    def _somar(self, campo, valor):
+        with self._lock:
+            self._stats[campo] += valor
+
+    def obter(self, chave_logica, tabelas, calcular):
+        """
+        Devolve o valor de `chave_logica` nas versões atuais de `tabelas`, calculando se faltar.
+        Uma entrada por chave lógica, marcada com as versões com que foi gravada: a
+        gravação seguinte substitui a de versão antiga. Falha do backend (ou entrada
+        ilegível) vira cache miss; exceções de `calcular` sobem como vieram.
+        """
+        assinatura = hashlib.sha1(repr(chave_logica).encode()).hexdigest()
+        chave = f"{self.namespace}:d:{assinatura}"
+        try:
+            marca = ".".join(map(str, self.versoes(tabelas))).encode()
+            bruto = self.backend.get(chave)
+        except ERROS_BACKEND:
+            return calcular()
+
+        if bruto is not None:
+            versao, _, corpo = bruto.partition(b"\n")
+            if versao == marca:
+                ini = time.perf_counter()
+                try:
+                    valor = pickle.loads(corpo)
+                except _ERROS_DESSERIALIZAR:
+                    valor = _AUSENTE
+                self._somar("desserializacao_s", time.perf_counter() - ini)
+                if valor is not _AUSENTE:
+                    self._somar("hits", 1)
+                    return valor
+
+        self._somar("misses", 1)
+        valor = calcular()
+        ini = time.perf_counter()
+        bruto = marca + b"\n" + pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        self._somar("serializacao_s", time.perf_counter() - ini)
+        try:
+            self.backend.set(chave, bruto, ex=self.ttl)
+            self._somar("bytes_gravados", len(bruto))
+        except ERROS_BACKEND:
+            pass
+        return valor
+
+    def estatisticas(self):
+        with self._lock:
+            s = dict(self._stats)
+        total = s["hits"] + s["misses"]
+        s["taxa_acerto"] = s["hits"] / total if total else 0.0
+        return s
+
+
+def criar_cache(config):
+    """
+    Monta o cache a partir de um dict de configuração, por exemplo:
+        {"backend": "disco", "diretorio": "/dev/shm/credito_cache"}   # diretório obrigatório
+        {"backend": "redis", "url": "redis://localhost:6379/0"}
+        {"backend": "memoria"}
+    """
+    tipo = config.get("backend", "disco")
+    if tipo == "disco":
+        if not config.get("diretorio"):
+            # nada de diretório compartilhado por padrão (ex. /tmp): o conteúdo passa por pickle
+            raise ValueError("Backend 'disco' exige 'diretorio' (privado, criado com permissão 0700).")
+        backend = BackendDisco(config["diretorio"])
+    elif tipo == "redis":
+        backend = BackendRedis.de_url(config["url"])
+    elif tipo == "memoria":
+        backend = BackendMemoria()
+    else:
+        raise ValueError(f"Backend de cache desconhecido: {tipo}")
+    return CacheCompartilhado(backend, namespace=config.get("namespace", "credito"),
+                              ttl=int(config.get("ttl", 600)))
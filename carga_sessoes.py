@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+Harness de carga do app de crédito.
+
+Simula N sessões simultâneas percorrendo os fluxos reais do Credito_libra.py
+(login, Overview com filtros, Detalhada, transição de workflow, pendências,
+calendário) via AppTest do Streamlit, contra um Postgres LOCAL semeado.
+
+Uso:
+    python carga_sessoes.py --semear 2000            # cria/popula o banco local
+    python carga_sessoes.py --sessoes 1 10 50        # roda os níveis de carga
+
+Relatório por nível: p50/p90/p99 de latência por rerun, consultas ao banco
+por rerun (contador _consultas_rerun do app) e throughput (reruns/s).
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import psycopg2
+from streamlit.testing.v1 import AppTest
+
+APP = "Credito_libra.py"
+
+# mesmos logins do USERS do app
+COMERCIAL = ("gabriel", "Gabriel33")
+ANALISTA = ("joao santos", "Joao13")
+AGENTES = ["Gabriel", "Marcelo", "Lilian", "Heverton", "Moacir", "Ellen", "Jose", "Sayonara", "Joao", "Andressa", "Italo"]
+ETAPAS = [
+    "Cadastro", "Pendência de Posicionamento", "Aguardando Documentos", "Em Análise",
+    "Aguardando Documentos Finais", "Elaboração Contrato", "Assinatura Cliente",
+    "Formalização Gestora", "Finalizado"
+]
+DOCUMENTOS = ["Contrato social", "Balanço", "DRE", "Faturamento 12m", "Endividamento",
+              "RG/CPF sócios", "Comprovante de endereço", "Certidões"]
+
+# =========================================================
+# 🌱 BANCO LOCAL
+# =========================================================
+# tabelas como o banco as tem antes do app (sem as colunas/índices que o app cria
+# no import — log_workflow.id, máscaras de pendências, versao...), para que a carga
+# exercite também essas migrações
+DDL_BASE = """
+CREATE TABLE IF NOT EXISTS analise_credito (
+    empresa TEXT PRIMARY KEY,
+    agente TEXT,
+    entrada DATE,
+    situacao TEXT,
+    limite NUMERIC(15,2),
+    etapa_atual TEXT,
+    responsavel_atual TEXT,
+    data_ultima_movimentacao TIMESTAMPTZ,
+    saida_credito DATE,
+    comentario_interno TEXT,
+    envio_das TEXT, emissao_contrato TEXT, assinatura TEXT, homologacao TEXT, apto_a_operar TEXT
+);
+CREATE TABLE IF NOT EXISTS dim_pendencias (documento TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS pendencias_empresa (
+    id SERIAL PRIMARY KEY,
+    empresa TEXT NOT NULL,
+    documento TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pendente',
+    data_ultima_atualizacao TIMESTAMPTZ
+);
+CREATE TABLE IF NOT EXISTS log_workflow (
+    empresa TEXT NOT NULL,
+    etapa TEXT,
+    responsavel TEXT,
+    prazo_dias INT,
+    status_prazo TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS anotacoes_usuario (
+    usuario TEXT NOT NULL,
+    data DATE NOT NULL,
+    nota TEXT,
+    UNIQUE (usuario, data)
+);
+"""
+
+def _opcoes_schema(schema):
+    return f"-c search_path={schema}"
+
+def conectar(args, schema=None):
+    """Conexão do harness; com `schema`, tudo (inclusive o que for criado) fica nele."""
+    extra = {"options": _opcoes_schema(schema)} if schema else {}
+    return psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password, **extra)
+
+def semear(args, n=None, schema=None):
+    """Cria as tabelas base e popula `n` (padrão `args.semear`) empresas com pendências e log."""
+    rnd = random.Random(42)
+    hoje = date.today()
+    n = args.semear if n is None else n
+    with conectar(args, schema) as conn, conn.cursor() as cur:
+        cur.execute(DDL_BASE)
+        cur.executemany("INSERT INTO dim_pendencias VALUES (%s) ON CONFLICT DO NOTHING",
+                        [(d,) for d in DOCUMENTOS])
+        empresas, pends, logs = [], [], []
+        for i in range(n):
+            nome = f"Empresa {i:06d}"
+            entrada = hoje - timedelta(days=rnd.randint(0, 120))
+            n_etapas = rnd.randint(1, len(ETAPAS))
+            empresas.append((nome, rnd.choice(AGENTES), entrada,
+                             rnd.choice(["Em análise", "Aprovada", "Reprovada", "Stand by"]),
+                             rnd.randint(0, 500) * 1000, ETAPAS[n_etapas - 1], "Analista"))
+            for d in DOCUMENTOS:
+                pends.append((nome, d, rnd.choice(["pendente", "recebido"])))
+            for k in range(n_etapas):
+                logs.append((nome, ETAPAS[k], "Analista", rnd.randint(0, 5), "Dentro do prazo",
+                             entrada + timedelta(days=k * 2)))
+        cur.executemany("""
+            INSERT INTO analise_credito (empresa, agente, entrada, situacao, limite, etapa_atual,
+                                         responsavel_atual, data_ultima_movimentacao)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW()) ON CONFLICT DO NOTHING
+        """, empresas)
+        cur.executemany("""
+            INSERT INTO pendencias_empresa (empresa, documento, status, data_ultima_atualizacao)
+            VALUES (%s, %s, %s, NOW())
+        """, pends)
+        cur.executemany("""
+            INSERT INTO log_workflow (empresa, etapa, responsavel, prazo_dias, status_prazo, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, logs)
+        # banco em que o app já rodou: a última transição também fica em analise_credito
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+             WHERE table_schema = current_schema() AND table_name = 'analise_credito'
+               AND column_name = 'ultima_transicao_em'
+        """)
+        if cur.fetchone():
+            cur.execute("""
+                UPDATE analise_credito ac
+                   SET ultima_transicao_em = l.created_at, prazo_dias = l.prazo_dias
+                  FROM (SELECT DISTINCT ON (empresa) empresa, created_at, prazo_dias
+                          FROM log_workflow ORDER BY empresa, created_at DESC) l
+                 WHERE ac.empresa = l.empresa
+            """)
+    print(f"Semeadas {len(empresas)} empresas, {len(pends)} pendências, {len(logs)} linhas de log.")
+
+# =========================================================
+# 🧭 FLUXOS (cada passo = um rerun medido)
+# =========================================================
+def _por_label(widgets, label):
+    return next(w for w in widgets if w.label == label)
+
+def _login(at, usuario, senha):
+    at.sidebar.text_input[0].input(usuario)
+    at.sidebar.text_input[1].input(senha)
+    return _por_label(at.sidebar.button, "Entrar").click()
+
+def fluxo_comercial(at):
+    yield "login", lambda: _login(at, *COMERCIAL)
+    yield "overview_tabela", lambda: _por_label(at.toggle, "Modo tabela").set_value(True)
+    yield "overview_cards", lambda: _por_label(at.toggle, "Modo tabela").set_value(False)
+    yield "detalhada", lambda: _por_label(at.button, "🧠 Detalhada").click()
+    yield "calendario", lambda: _por_label(at.button, "📅 Calendário").click()
+    yield "calendario_mes", lambda: _por_label(at.button, "→").click()
+    yield "overview", lambda: _por_label(at.button, "📊 Overview").click()
+
+def fluxo_analista(at):
+    yield "login", lambda: _login(at, *ANALISTA)
+    yield "overview_arquivadas", lambda: _por_label(at.toggle, "Incluir arquivadas").set_value(True)
+    yield "detalhada", lambda: _por_label(at.button, "🧠 Detalhada").click()
+    yield "salvar_pendencias", lambda: _salvar_pendencias(at)
+    yield "workflow", lambda: _por_label(at.button, "🧭 Workflow").click()
+    yield "transicao", lambda: _por_label(at.button, "💾 Registrar Transição").click()
+    yield "calendario", lambda: _por_label(at.button, "📅 Calendário").click()
+    yield "overview", lambda: _por_label(at.button, "📊 Overview").click()
+
+def _salvar_pendencias(at):
+    # o AppTest não edita st.data_editor: o passo mede o rerun do grid + diff sem mudanças
+    return _por_label(at.button, "💾 Salvar pendências").click()
+
+# =========================================================
+# 📏 PAYLOAD DE MARKDOWN/HTML POR RERUN
+# =========================================================
+def _bytes_markdown(at):
+    return sum(m.proto.ByteSize() for m in [*at.markdown, *at.get("html")])
+
+def medir_payload(args):
+    """Bytes de markdown/HTML (estilo, logo, cards): 1ª execução da sessão, rerun do login e Overview."""
+    at = _nova_sessao(args)
+    at.run()
+    primeira = _bytes_markdown(at)
+    at.run()
+    login = _bytes_markdown(at)
+    _login(at, *COMERCIAL).run()
+    overview = _bytes_markdown(at)
+    print(f"markdown/html | 1ª execução: {primeira / 1024:.2f} KiB | rerun do login: {login / 1024:.2f} KiB"
+          f" | overview (cards): {overview / 1024:.2f} KiB")
+
+# =========================================================
+# 🐢 LENTIDÃO INJETADA (pg_sleep) → TIMEOUT E FALLBACK
+# =========================================================
+def testar_lentidao(args, segundos, n_empresas=200):
+    """
+    Deixa a view analise_credito_todas `segundos` mais lenta (pg_sleep) e abre o
+    Overview com "Incluir arquivadas" e timeouts de 1s: o rerun tem de voltar em ~1s
+    por consulta, sem exceção, com o aviso de "carregando".
+    Roda num schema descartável (semeado aqui; o app cria nele as próprias funções,
+    triggers e views pelo search_path): a view do banco de verdade não é tocada.
+    """
+    schema = f"lentidao_{int(time.time())}"
+    with conectar(args) as conn, conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    try:
+        semear(args, n_empresas, schema)
+        at = _nova_sessao(args, schema)
+        at.secrets["classes_consulta"] = {"rapida": {"timeout_ms": 1000}, "carteira": {"timeout_ms": 1000}}
+        at.secrets["aquecimento_login"] = False
+        at.run()  # 1ª execução: o app cria no schema o que precisa (inclusive a view)
+        with conectar(args, schema) as conn, conn.cursor() as cur:
+            cur.execute("SELECT pg_get_viewdef('analise_credito_todas'::regclass)")
+            original = cur.fetchone()[0].strip().rstrip(";")
+            # subconsulta escalar = InitPlan, dorme uma vez por consulta (num EXISTS o
+            # Postgres descarta a lista do SELECT e o pg_sleep nunca roda)
+            cur.execute(f"""
+                CREATE OR REPLACE VIEW analise_credito_todas AS
+                SELECT * FROM ({original}) v WHERE (SELECT pg_sleep({float(segundos)})::text) IS NOT NULL
+            """)
+        _login(at, *ANALISTA).run()
+        ini = time.perf_counter()
+        _por_label(at.toggle, "Incluir arquivadas").set_value(True).run()
+        dt = time.perf_counter() - ini
+        avisos = [i.value for i in at.info if "carregando" in str(i.value)]
+        print(f"pg_sleep {segundos}s | rerun {dt * 1000:.0f}ms | exceção: {bool(at.exception)} | "
+              f"fallback 'carregando': {'sim' if avisos else 'não'}")
+    finally:
+        with conectar(args) as conn, conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+
+# =========================================================
+# 🔥 TEMPO ATÉ A 1ª TELA APÓS O LOGIN
+# =========================================================
+def medir_aquecimento(args, rodadas=5):
+    """
+    1ª tela após o login (_ttfr_login_s do app), com e sem aquecimento, sempre com
+    st.cache_data frio. Os dois modos se alternam dentro de cada rodada (e a ordem
+    inverte a cada rodada), para que pool, buffers do Postgres e statements preparados
+    estejam no mesmo estado para ambos; a rodada 0 só abre as conexões e é descartada.
+    Relata também quantas consultas a própria 1ª tela fez (0 = tudo veio do aquecimento).
+    """
+    import streamlit as st
+    tempos, consultas = defaultdict(list), defaultdict(list)
+    for rodada in range(rodadas + 1):
+        for usuario in (COMERCIAL, ANALISTA):
+            for aquecer in ((True, False) if rodada % 2 else (False, True)):
+                st.cache_data.clear()
+                at = _nova_sessao(args)
+                at.secrets["aquecimento_login"] = aquecer
+                at.run()
+                _login(at, *usuario).run()
+                if rodada and "_ttfr_login_s" in at.session_state:
+                    tempos[usuario[0], aquecer].append(at.session_state["_ttfr_login_s"] * 1000)
+                    consultas[usuario[0], aquecer].append(at.session_state["_consultas_rerun"])
+    for (nome, aquecer), t in sorted(tempos.items()):
+        print(f"aquecimento {'ligado ' if aquecer else 'desligado'} | {nome:<12} | "
+              f"1ª tela p50 {statistics.median(t):7.1f}ms  máx {max(t):7.1f}ms | "
+              f"consultas da tela {statistics.median(consultas[nome, aquecer]):.0f}")
+
+# =========================================================
+# 📦 BENCH: GRAVAÇÃO DE PENDÊNCIAS
+# =========================================================
+def bench_pendencias(args, n_docs=60, repeticoes=20):
+    """Compara executemany (um UPDATE por documento) com um único UPDATE ... FROM (VALUES ...)."""
+    from psycopg2.extras import execute_values
+    nome = "__bench_pendencias__"
+    with conectar(args) as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM pendencias_empresa WHERE empresa = %s", (nome,))
+        cur.executemany("INSERT INTO pendencias_empresa (empresa, documento, status) VALUES (%s, %s, 'pendente')",
+                        [(nome, f"Documento {i:03d}") for i in range(n_docs)])
+        cur.execute("SELECT id FROM pendencias_empresa WHERE empresa = %s ORDER BY id", (nome,))
+        ids = [r[0] for r in cur.fetchall()]
+
+    def executemany(status):
+        with conectar(args) as conn, conn.cursor() as cur:
+            cur.executemany("""
+                UPDATE pendencias_empresa SET status = %s, data_ultima_atualizacao = NOW()
+                 WHERE id = %s AND empresa = %s
+            """, [(status, i, nome) for i in ids])
+
+    def valores(status):
+        with conectar(args) as conn, conn.cursor() as cur:
+            execute_values(cur, """
+                UPDATE pendencias_empresa p SET status = v.status, data_ultima_atualizacao = NOW()
+                  FROM (VALUES %s) AS v(id, status, empresa)
+                 WHERE p.id = v.id AND p.empresa = v.empresa AND p.status IS DISTINCT FROM v.status
+            """, [(i, status, nome) for i in ids], page_size=len(ids))
+
+    try:
+        for rotulo, fn in (("executemany", executemany), ("update_from_values", valores)):
+            tempos = []
+            for k in range(repeticoes):
+                ini = time.perf_counter()
+                fn("recebido" if k % 2 == 0 else "pendente")
+                tempos.append((time.perf_counter() - ini) * 1000)
+            print(f"{rotulo:<20} {n_docs} docs | p50 {_pct(tempos, 50):7.1f}ms  p99 {_pct(tempos, 99):7.1f}ms")
+    finally:
+        with conectar(args) as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM pendencias_empresa WHERE empresa = %s", (nome,))
+
+# =========================================================
+# ⏱️ EXECUÇÃO
+# =========================================================
+def _nova_sessao(args, schema=None):
+    at = AppTest.from_file(APP, default_timeout=args.timeout)
+    if schema:
+        at.secrets["db_options"] = _opcoes_schema(schema)
+    at.secrets["db_host"] = args.host
+    at.secrets["db_port"] = args.port
+    at.secrets["db_name"] = args.dbname
+    at.secrets["db_user"] = args.user
+    at.secrets["db_password"] = args.password
+    return at
+
+def rodar_sessao(args, idx, amostras, lock):
+    fluxo = fluxo_analista if idx % 2 else fluxo_comercial
+    fim = time.perf_counter() + args.duracao
+    while time.perf_counter() < fim:
+        at = _nova_sessao(args)
+        at.run()
+        for passo, acao in fluxo(at):
+            ini = time.perf_counter()
+            try:
+                acao().run()
+                erro = bool(at.exception)
+            except Exception:
+                erro = True
+            dt = time.perf_counter() - ini
+            consultas = at.session_state["_consultas_rerun"] if "_consultas_rerun" in at.session_state else 0
+            with lock:
+                amostras.append((passo, dt, consultas, erro))
+            if erro or time.perf_counter() >= fim:
+                break
+
+def _pct(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+
+def rodar_nivel(args, n):
+    amostras, lock = [], threading.Lock()
+    ini = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=n) as ex:
+        for f in [ex.submit(rodar_sessao, args, i, amostras, lock) for i in range(n)]:
+            f.result()
+    total = time.perf_counter() - ini
+    lat = [a[1] * 1000 for a in amostras]
+    if not lat:
+        print(f"{n:>4} sessões | sem amostras")
+        return
+    print(f"{n:>4} sessões | reruns: {len(lat):>6} | "
+          f"p50 {_pct(lat, 50):7.1f}ms  p90 {_pct(lat, 90):7.1f}ms  p99 {_pct(lat, 99):7.1f}ms | "
+          f"consultas/rerun {statistics.mean(a[2] for a in amostras):5.1f} | "
+          f"{len(lat) / total:6.1f} reruns/s | erros {sum(a[3] for a in amostras)}")
+    if args.por_passo:
+        for passo in sorted({a[0] for a in amostras}):
+            lp = [a[1] * 1000 for a in amostras if a[0] == passo]
+            print(f"       {passo:<22} n={len(lp):<5} p50 {_pct(lp, 50):7.1f}ms  p99 {_pct(lp, 99):7.1f}ms")
+
+def main():
+    ap = argparse.ArgumentParser(description="Carga multi-sessão do app de crédito (Postgres local).")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", default="5432")
+    ap.add_argument("--dbname", default="credito_carga")
+    ap.add_argument("--user", default="postgres")
+    ap.add_argument("--password", default="postgres")
+    ap.add_argument("--semear", type=int, default=0, help="Cria e popula N empresas antes de rodar")
+    ap.add_argument("--sessoes", type=int, nargs="+", default=[1, 10, 50])
+    ap.add_argument("--duracao", type=float, default=30, help="Segundos por nível")
+    ap.add_argument("--timeout", type=float, default=60, help="Timeout de cada rerun (s)")
+    ap.add_argument("--por-passo", action="store_true", help="Detalha latência por passo do fluxo")
+    ap.add_argument("--bench-pendencias", action="store_true",
+                    help="Só compara as duas formas de gravar pendências e sai")
+    ap.add_argument("--payload", action="store_true",
+                    help="Só mede os bytes de markdown/HTML reenviados por rerun e sai")
+    ap.add_argument("--aquecimento", action="store_true",
+                    help="Só mede a 1ª tela após o login com/sem aquecimento e sai")
+    ap.add_argument("--lentidao", type=float, metavar="S",
+                    help="Só testa timeout/fallback com pg_sleep(S) na view de arquivadas e sai")
+    args = ap.parse_args()
+
+    if args.semear:
+        semear(args)
+    if args.lentidao:
+        testar_lentidao(args, args.lentidao)
+        return
+    if args.aquecimento:
+        medir_aquecimento(args)
+        return
+    if args.payload:
+        medir_payload(args)
+        return
+    if args.bench_pendencias:
+        bench_pendencias(args)
+        return
+    for n in args.sessoes:
+        rodar_nivel(args, n)
+
+if __name__ == "__main__":
+    main()
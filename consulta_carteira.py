@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Consulta da carteira (Overview / Detalhada) e a função carteira_empresas.
+
+Cada combinação de filtros (agente / entrada de / entrada até) tem o seu próprio
+comando, só com os predicados que se aplicam: um `(p IS NULL OR col = p)`
+genérico faz o plano genérico em cache ignorar o índice de agente e varrer
+a tabela inteira mesmo com filtro.
+
+Benchmark (schema descartável): python consulta_carteira.py [N_EMPRESAS]
+"""
+from itertools import product
+
+# Um único texto para os dois caminhos: a função carteira_empresas (tabelas
+# ativas, plano em cache por conexão — COPY não aceita EXECUTE de statement
+# preparado) e a consulta ad hoc sobre as views *_todas (com arquivadas).
+SQL_CARTEIRA = """
+    SELECT
+    ac.empresa,
+    ac.agente,
+    ac.entrada,
+    ac.situacao,
+    COALESCE(ac.limite,0) AS limite,
+    ac.etapa_atual,
+    ac.responsavel_atual,
+    ac.data_ultima_movimentacao,
+    {arquivada} AS arquivada,
+
+    -- 🔹 Campo novo essencial pra barrinha funcionar + prazo mais recente do workflow
+    -- (gravados por registrar_transicao; sem buscar no log_workflow, que é particionado)
+    ac.ultima_transicao_em,
+    ac.prazo_dias,
+
+    -- 🔹 Quantidade de pendências abertas (bits da máscara + documentos fora da dim, sem varrer pendencias_empresa)
+    qtd_bits(ac.pendentes_mask) + ac.pendentes_fora_dim AS pendentes_restantes
+
+    FROM {ac} ac
+    {where}
+    ORDER BY ac.entrada DESC, ac.empresa
+"""
+
+# filtro → predicado; na consulta ad hoc o valor entra como %s, na função como o parâmetro
+FILTROS_CARTEIRA = (
+    ("p_agente", "ac.agente = {}"),
+    ("p_ini",    "ac.entrada >= {}"),
+    ("p_fim",    "ac.entrada <= {}"),
+)
+
+def filtros_carteira(agente=None, ini=None, fim=None):
+    """(cláusula WHERE, params) só com os filtros preenchidos."""
+    wheres, params = [], []
+    for (_, predicado), valor in zip(FILTROS_CARTEIRA, (agente, ini, fim)):
+        if valor:
+            wheres.append(predicado.format("%s"))
+            params.append(valor)
+    return (f"WHERE {' AND '.join(wheres)}" if wheres else ""), params
+
+def _ddl_funcao(nome, corpo):
+    return f"""
+        DROP FUNCTION IF EXISTS {nome}(text, date, date);
+        CREATE FUNCTION {nome}(p_agente text, p_ini date, p_fim date)
+        RETURNS TABLE (
+            empresa                  analise_credito.empresa%TYPE,
+            agente                   analise_credito.agente%TYPE,
+            entrada                  analise_credito.entrada%TYPE,
+            situacao                 analise_credito.situacao%TYPE,
+            limite                   analise_credito.limite%TYPE,
+            etapa_atual              analise_credito.etapa_atual%TYPE,
+            responsavel_atual        analise_credito.responsavel_atual%TYPE,
+            data_ultima_movimentacao analise_credito.data_ultima_movimentacao%TYPE,
+            arquivada                boolean,
+            ultima_transicao_em      analise_credito.ultima_transicao_em%TYPE,
+            prazo_dias               analise_credito.prazo_dias%TYPE,
+            pendentes_restantes      int
+        ) AS $$
+        #variable_conflict use_column
+        BEGIN
+        {corpo}
+        END;
+        $$ LANGUAGE plpgsql STABLE;
+    """
+
+def sql_funcao_carteira():
+    """
+    carteira_empresas(p_agente, p_ini, p_fim) sobre as tabelas ativas: um
+    RETURN QUERY por combinação de filtros, cada um com o seu plano em cache.
+    """
+    ramos = []
+    for usados in product((True, False), repeat=len(FILTROS_CARTEIRA)):
+        condicao = " AND ".join(f"{p} IS {'NOT ' if u else ''}NULL" for (p, _), u in zip(FILTROS_CARTEIRA, usados))
+        wheres = [pred.format(p) for (p, pred), u in zip(FILTROS_CARTEIRA, usados) if u]
+        corpo = SQL_CARTEIRA.format(ac="analise_credito", arquivada="FALSE",
+                                    where=f"WHERE {' AND '.join(wheres)}" if wheres else "")
+        ramos.append(f"{'IF' if not ramos else 'ELSIF'} {condicao} THEN\n    RETURN QUERY {corpo};")
+    return _ddl_funcao("carteira_empresas", "\n".join(ramos) + "\nEND IF;")
+
+
+if __name__ == "__main__":
+    import os
+    import statistics
+    import sys
+    import time
+    from datetime import date
+
+    import psycopg2
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    dsn = os.environ.get("CREDITO_TEST_DSN", "host=localhost port=5432 dbname=credito user=postgres password=postgres")
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    schema = f"bench_carteira_{int(time.time())}"
+    cur = conn.cursor()
+    cur.execute(f"CREATE SCHEMA {schema}; SET search_path = {schema}")
+    try:
+        cur.execute(f"""
+            CREATE FUNCTION qtd_bits(mascara bigint) RETURNS int AS $$
+                SELECT length(replace(mascara::bit(64)::text, '0', ''));
+            $$ LANGUAGE sql IMMUTABLE;
+            CREATE TABLE analise_credito (empresa TEXT PRIMARY KEY, agente TEXT, entrada DATE, situacao TEXT,
+                limite NUMERIC(15,2), etapa_atual TEXT, responsavel_atual TEXT,
+                data_ultima_movimentacao TIMESTAMPTZ, pendentes_mask BIGINT NOT NULL DEFAULT 0,
+                pendentes_fora_dim INT NOT NULL DEFAULT 0, ultima_transicao_em TIMESTAMPTZ, prazo_dias INT);
+            -- 200 agentes: um agente ~0,5% da carteira
+            INSERT INTO analise_credito
+            SELECT 'Empresa ' || lpad(g::text, 7, '0'), 'Agente ' || (g % 200), DATE '2025-06-30' - (g % 720),
+                   'Em análise', 1000, 'Em Análise', 'Analista', NOW(), g % 1024, 0,
+                   NOW() - g * INTERVAL '1 second', 3
+              FROM generate_series(1, {n}) g;
+            CREATE INDEX ON analise_credito (agente);
+            ANALYZE;
+        """)
+
+        # versão anterior: um comando só, com predicados genéricos
+        cur.execute(_ddl_funcao("carteira_generica", "RETURN QUERY " + SQL_CARTEIRA.format(
+            ac="analise_credito", arquivada="FALSE",
+            where="""WHERE (p_agente IS NULL OR ac.agente = p_agente)
+                       AND (p_ini IS NULL OR ac.entrada >= p_ini)
+                       AND (p_fim IS NULL OR ac.entrada <= p_fim)""") + ";"))
+        cur.execute(sql_funcao_carteira())
+
+        casos = {
+            "agente":          ("Agente 7", None, None),
+            "agente+período":  ("Agente 7", date(2025, 5, 1), date(2025, 6, 30)),
+            "período (30 d)":  (None, date(2025, 6, 1), date(2025, 6, 30)),
+        }
+        variantes = {
+            "genérica":              ("carteira_generica", "auto"),
+            "genérica custom plan":  ("carteira_generica", "force_custom_plan"),
+            "por combinação":        ("carteira_empresas", "auto"),
+        }
+        print(f"{n:,} empresas — ms por chamada (p50 / p99 de 200, após 20 de aquecimento)")
+        print(f"{'filtro':18}" + "".join(f"{v:>24}" for v in variantes))
+        for caso, params in casos.items():
+            linha = f"{caso:18}"
+            for funcao, modo in variantes.values():
+                c = psycopg2.connect(dsn, options=f"-c search_path={schema} -c plan_cache_mode={modo}")
+                with c.cursor() as k:
+                    for _ in range(20):  # plpgsql passa ao plano genérico depois de 5 execuções
+                        k.execute(f"SELECT * FROM {funcao}(%s, %s, %s)", params)
+                        k.fetchall()
+                    tempos = []
+                    for _ in range(200):
+                        ini = time.perf_counter()
+                        k.execute(f"SELECT * FROM {funcao}(%s, %s, %s)", params)
+                        k.fetchall()
+                        tempos.append((time.perf_counter() - ini) * 1000)
+                c.close()
+                tempos.sort()
+                linha += f"{statistics.median(tempos):>14.2f} / {tempos[int(len(tempos) * 0.99)]:>7.2f}"
+            print(linha)
+    finally:
+        cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.close()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Tipos e normalização dos dados da carteira — funções puras (sem Streamlit nem
+banco), usadas pelo Credito_libra.py e importáveis nos testes.
+
+Medição de memória por sessão:
+    python dados_carteira.py [N]      # object + datas formatadas × tipado (padrão 100k)
+"""
+import re
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+FUSO_HORARIO = "America/Sao_Paulo"
+
+# horário seguido de offset: "2025-03-01 10:00:00-03", "...:00.5+00:00", "...Z"
+_RE_COM_FUSO = re.compile(r"\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:[+-]\d{2}(?::?\d{2})?|Z)$")
+
+def categoria(serie, conhecidas):
+    """Categórica com as categorias conhecidas (+ valores inesperados, para não virar NaN)."""
+    extras = sorted(set(serie.dropna().astype(str)) - set(conhecidas))
+    return pd.Categorical(serie, categories=list(conhecidas) + extras)
+
+def _tem_fuso(valor):
+    if isinstance(valor, str):
+        return bool(_RE_COM_FUSO.search(valor.strip()))
+    return getattr(valor, "tzinfo", None) is not None
+
+def datas(serie, fuso=FUSO_HORARIO):
+    """
+    datetime64 sem fuso (horário de `fuso`) a partir do que o driver devolver.
+    timestamptz (offsets misturados inclusive, ex. -02/-03 de antes de 2019) passa
+    por UTC e é convertido para `fuso`; date/timestamp sem fuso fica como veio.
+    Uma coluna do banco é toda com ou toda sem fuso, então o 1º valor decide.
+    """
+    serie = pd.Series(serie)
+    if isinstance(serie.dtype, pd.DatetimeTZDtype):
+        return serie.dt.tz_convert(fuso).dt.tz_localize(None)
+    if pd.api.types.is_datetime64_dtype(serie):
+        return serie
+    validos = serie.dropna()
+    primeiro = validos.iloc[0] if len(validos) else None
+    formato = "ISO8601" if isinstance(primeiro, str) else None
+    if not _tem_fuso(primeiro):
+        return pd.to_datetime(serie, errors="coerce", format=formato)
+    d = pd.to_datetime(serie, errors="coerce", utc=True, format=formato)
+    return d.dt.tz_convert(fuso).dt.tz_localize(None)
+
+def tipar_carteira(df, categorias, fuso=FUSO_HORARIO):
+    """
+    Tipos compactos para o DataFrame da carteira:
+    - enums (`categorias`: coluna → valores conhecidos) como category;
+    - datas como datetime64 (formatação só na hora de exibir).
+    """
+    if df.empty:
+        return df
+    for col, conhecidas in categorias.items():
+        if col in df.columns:
+            df[col] = categoria(df[col], conhecidas)
+    for col in ("entrada", "data_ultima_movimentacao", "ultima_transicao_em"):
+        if col in df.columns:
+            df[col] = datas(df[col], fuso)
+    return df
+
+# =========================================================
+# 📝 FORMULÁRIO DA EMPRESA (Detalhada)
+# =========================================================
+CAMPOS_SIM_NAO = ("envio_das", "emissao_contrato", "assinatura", "homologacao", "apto_a_operar")
+
+def sim_nao(valor):
+    """Como o selectbox Sim/Não mostra o valor do banco: só 'sim' (qualquer caixa) é Sim."""
+    return "Sim" if str(valor or "").strip().lower() == "sim" else "Não"
+
+def _data(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)) or valor == "":
+        return None
+    if isinstance(valor, str):
+        for formato in ("%d-%m-%Y", "%Y-%m-%d"):
+            try:
+                return datetime.strptime(valor.strip()[:10], formato).date()
+            except ValueError:
+                pass
+        return None
+    return pd.Timestamp(valor).date()
+
+def valores_formulario(linha, situacoes):
+    """
+    A linha do banco do jeito que os widgets do formulário a mostram (e devolvem
+    num salvar sem edição): situação fora da lista → a 1ª, limite nulo → 0,
+    Sim/Não normalizado, saida_credito como date.
+    """
+    situacao = linha.get("situacao")
+    valores = {
+        "situacao": situacao if situacao in situacoes else situacoes[0],
+        "limite": float(linha.get("limite") or 0),
+        "comentario_interno": linha.get("comentario_interno") or "",
+        "saida_credito": _data(linha.get("saida_credito")),
+    }
+    for col in CAMPOS_SIM_NAO:
+        valores[col] = sim_nao(linha.get(col))
+    return valores
+
+def _valor_campo(v):
+    """Normaliza um valor de campo para comparação (vazio/NaN → None, número → float, data → date)."""
+    if v is None or (not isinstance(v, str) and pd.isna(v)) or v == "":
+        return None
+    if isinstance(v, (int, float, np.number)) or type(v).__name__ == "Decimal":
+        return round(float(v), 2)
+    if isinstance(v, (date, datetime, pd.Timestamp)):
+        return pd.Timestamp(v).date()
+    return v
+
+def campos_alterados(original, payload, situacoes):
+    """Só os campos do payload que diferem da linha carregada, vista como o formulário a mostra."""
+    base = valores_formulario(original, situacoes)
+    return {col: val for col, val in payload.items()
+            if _valor_campo(val) != _valor_campo(base.get(col, original.get(col)))}
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = np.random.default_rng(7)
+    agentes = ["Gabriel", "Marcelo", "Lilian", "Heverton", "Moacir", "Ellen", "Jose", "Sayonara", "Joao"]
+    situacoes = ["Em análise", "Aprovada", "Reprovada", "Stand by"]
+    etapas = ["Cadastro", "Pendência de Posicionamento", "Aguardando Documentos", "Em Análise",
+              "Aguardando Documentos Finais", "Elaboração Contrato", "Assinatura Cliente",
+              "Formalização Gestora", "Finalizado"]
+    responsaveis = ["Analista", "Comercial", "Gestora"]
+    status = ["Dentro do prazo", "Atrasado", "Sem prazo"]
+    base = pd.Timestamp("2025-06-16 12:00", tz="UTC")
+    mov = base - pd.to_timedelta(rnd.integers(0, 90 * 86400, n), unit="s")
+    trans = base - pd.to_timedelta(rnd.integers(0, 90 * 86400, n), unit="s")
+    escolher = lambda valores: [valores[i] for i in rnd.integers(0, len(valores), n)]
+
+    # como o driver entrega: objetos Python por célula (str, date, datetime com tzinfo)
+    bruto = pd.DataFrame({
+        "empresa": [f"Empresa {i:06d}" for i in range(n)],
+        "agente": escolher(agentes),
+        "entrada": [d.date() for d in mov.tz_convert(FUSO_HORARIO)],
+        "situacao": escolher(situacoes),
+        "limite": rnd.integers(0, 500, n) * 1000.0,
+        "etapa_atual": escolher(etapas),
+        "responsavel_atual": escolher(responsaveis),
+        "data_ultima_movimentacao": mov.tz_convert("-03:00").to_pydatetime(),
+        "ultima_transicao_em": trans.tz_convert("-03:00").to_pydatetime(),
+        "status_prazo": escolher(status),
+    })
+    mb = lambda df: df.memory_usage(deep=True).sum() / 2**20
+
+    # antes: tudo object + as duas colunas de data formatadas que a tabela carregava
+    antes = bruto.copy()
+    antes["entrada_fmt"] = [d.strftime("%d/%m/%Y") for d in antes["entrada"]]
+    antes["mov_fmt"] = [d.strftime("%d/%m/%Y %H:%M") for d in antes["data_ultima_movimentacao"]]
+
+    ini = time.perf_counter()
+    depois = tipar_carteira(bruto.copy(), {"agente": agentes, "situacao": situacoes, "etapa_atual": etapas,
+                                            "responsavel_atual": responsaveis, "status_prazo": status})
+    t = time.perf_counter() - ini
+    print(f"{n:,} linhas | antes {mb(antes):.1f} MiB | tipado {mb(depois):.1f} MiB "
+          f"({mb(antes) / mb(depois):.1f}x menor) | tipagem {t * 1000:.0f}ms")
+    print(depois.dtypes.to_string())
@@ -1,26 +1,37 @@
 # db.py
 import os
+import threading
 from dotenv import load_dotenv
 import psycopg
 from psycopg.rows import dict_row
 
-# 🔹 Caminho absoluto para o .env
+# 🔹 Caminho absoluto para o .env (carregado só no primeiro uso, não no import)
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), ".env"))
-print(f"Carregando .env de: {env_path}")
 
-# 🔹 Força o carregamento das variáveis
-load_dotenv(dotenv_path=env_path, override=True)
+_config = None
+_conn = None
+_conn_lock = threading.Lock()
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST"),
-    "port": os.getenv("DB_PORT"),
-    "dbname": os.getenv("DB_NAME"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "sslmode": os.getenv("DB_SSLMODE", "require"),
-}
+def db_config():
+    """Lê o .env uma vez e devolve os parâmetros de conexão."""
+    global _config
+    if _config is None:
+        load_dotenv(dotenv_path=env_path, override=True)
+        _config = {
+            "host": os.getenv("DB_HOST"),
+            "port": os.getenv("DB_PORT"),
+            "dbname": os.getenv("DB_NAME"),
+            "user": os.getenv("DB_USER"),
+            "password": os.getenv("DB_PASSWORD"),
+            "sslmode": os.getenv("DB_SSLMODE", "require"),
+        }
+    return _config
 
-print("DB_CONFIG (teste):", DB_CONFIG)
+def __getattr__(nome):
+    # DB_CONFIG continua disponível (from db import DB_CONFIG), mas só lê o .env quando usado
+    if nome == "DB_CONFIG":
+        return db_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
 
 DDL = """
 CREATE TABLE IF NOT EXISTS financefly_clients (
@@ -33,12 +44,19 @@ CREATE TABLE IF NOT EXISTS financefly_clients (
 """
 
 def get_conn():
-    return psycopg.connect(**DB_CONFIG)
+    """Conexão nova e exclusiva (para quem precisa dela sozinho)."""
+    return psycopg.connect(**db_config())
+
+def _conexao():
+    """Conexão compartilhada do processo (abre na 1ª vez e reabre se cair). Chamar com _conn_lock."""
+    global _conn
+    if _conn is None or _conn.closed or _conn.broken:
+        _conn = psycopg.connect(**db_config(), autocommit=True)
+    return _conn
 
 def init_db():
-    with get_conn() as conn, conn.cursor() as cur:
-        cur.execute(DDL)
-        conn.commit()
+    with _conn_lock:
+        _conexao().execute(DDL)
 
 def save_client(name, email, item_id):
     sql = """
@@ -47,8 +65,79 @@ def save_client(name, email, item_id):
     ON CONFLICT (item_id) DO NOTHING
     RETURNING id;
     """
-    with get_conn() as conn, conn.cursor(row_factory=dict_row) as cur:
+    with _conn_lock, _conexao().cursor(row_factory=dict_row) as cur:
         cur.execute(sql, (name, email, item_id))
         row = cur.fetchone()
-        conn.commit()
         return row["id"] if row else None
+
+def save_clients(clients):
+    """
+    Upsert em lote: `clients` é um iterável de (name, email, item_id).
+    COPY para uma tabela temporária + um único INSERT ... ON CONFLICT (item_id),
+    tudo numa transação. Devolve {item_id: id} (novos e já existentes).
+    Se o mesmo item_id vier repetido no lote, vale a última ocorrência.
+    """
+    with _conn_lock:
+        conn = _conexao()
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS financefly_clients_stage (
+                    ord BIGSERIAL, name TEXT, email TEXT, item_id TEXT
+                ) ON COMMIT DELETE ROWS
+            """)
+            with cur.copy("COPY financefly_clients_stage (name, email, item_id) FROM STDIN") as copy:
+                for row in clients:
+                    copy.write_row(row)
+            cur.execute("""
+                INSERT INTO financefly_clients (name, email, item_id)
+                SELECT DISTINCT ON (item_id) name, email, item_id
+                  FROM financefly_clients_stage
+                 ORDER BY item_id, ord DESC
+                ON CONFLICT (item_id) DO UPDATE
+                   SET name = EXCLUDED.name, email = EXCLUDED.email
+                RETURNING id, item_id
+            """)
+            return {item_id: id_ for id_, item_id in cur.fetchall()}
+
+
+if __name__ == "__main__":
+    # Benchmark: python db.py [N] — caminho original (uma conexão nova por insert) ×
+    # save_client na conexão compartilhada × save_clients em lote
+    import sys
+    import time
+    import uuid
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    init_db()
+    lote = [(f"Cliente {i}", f"cliente{i}@exemplo.com", f"bench-{uuid.uuid4()}") for i in range(3 * n)]
+    sql = """
+    INSERT INTO financefly_clients (name, email, item_id)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (item_id) DO NOTHING
+    RETURNING id;
+    """
+
+    ini = time.perf_counter()
+    for row in lote[:n]:
+        # como o save_client era antes: conecta, insere, commita e fecha a cada cliente
+        with psycopg.connect(**db_config()) as conn, conn.cursor(row_factory=dict_row) as cur:
+            cur.execute(sql, row)
+            cur.fetchone()
+            conn.commit()
+    t_original = time.perf_counter() - ini
+
+    ini = time.perf_counter()
+    for row in lote[n:2 * n]:
+        save_client(*row)
+    t_linha = time.perf_counter() - ini
+
+    ini = time.perf_counter()
+    ids = save_clients(lote[2 * n:])
+    t_lote = time.perf_counter() - ini
+
+    print(f"original (conexão por insert): {n} em {t_original:.2f}s → {n / t_original:,.0f} clientes/s")
+    print(f"save_client (compartilhada):   {n} em {t_linha:.2f}s → {n / t_linha:,.0f} clientes/s")
+    print(f"save_clients (lote):           {len(ids)} em {t_lote:.2f}s → {len(ids) / t_lote:,.0f} clientes/s")
+
+    with _conn_lock:
+        _conexao().execute("DELETE FROM financefly_clients WHERE item_id LIKE 'bench-%'")
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Prazos em dias úteis (calendário bancário brasileiro).
+
+O calendário (fins de semana + feriados nacionais, móveis pela Páscoa, e os
+extras configurados) vira um np.busdaycalendar montado uma única vez; as contas
+de prazo da carteira inteira saem de np.busday_count / np.busday_offset sobre
+arrays, sem laço por linha.
+
+Benchmark:
+    python dias_uteis.py [N]      # vetorizado × linha a linha (padrão 100k)
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+ANO_INICIAL = 2000
+ANO_FINAL = 2060
+
+FERIADOS_FIXOS = [
+    (1, 1),    # Confraternização Universal
+    (4, 21),   # Tiradentes
+    (5, 1),    # Dia do Trabalho
+    (9, 7),    # Independência
+    (10, 12),  # Nossa Senhora Aparecida
+    (11, 2),   # Finados
+    (11, 15),  # Proclamação da República
+    (12, 25),  # Natal
+]
+# dias relativos ao domingo de Páscoa
+FERIADOS_MOVEIS = [
+    -48,  # Carnaval (segunda)
+    -47,  # Carnaval (terça)
+    -2,   # Sexta-feira Santa
+    60,   # Corpus Christi
+]
+
+def pascoa(ano):
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)."""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(ano, mes, dia)
+
+def feriados_nacionais(ano):
+    dias = [date(ano, m, d) for m, d in FERIADOS_FIXOS]
+    if ano >= 2024:
+        dias.append(date(ano, 11, 20))  # Consciência Negra (nacional desde a Lei 14.759/2023)
+    p = pascoa(ano)
+    dias += [p + timedelta(days=n) for n in FERIADOS_MOVEIS]
+    return dias
+
+def _extras(extras, anos):
+    """Extras em 'AAAA-MM-DD' (uma vez) ou 'MM-DD' (todo ano)."""
+    dias = []
+    for item in extras or ():
+        item = str(item).strip()
+        if len(item) == 5:
+            m, d = map(int, item.split("-"))
+            dias += [date(a, m, d) for a in anos]
+        else:
+            dias.append(date.fromisoformat(item))
+    return dias
+
+
+class CalendarioUteis:
+    """Calendário de dias úteis pronto para as contas vetorizadas de prazo."""
+    def __init__(self, extras=(), ano_inicial=ANO_INICIAL, ano_final=ANO_FINAL):
+        anos = range(ano_inicial, ano_final + 1)
+        feriados = {d for a in anos for d in feriados_nacionais(a)}
+        feriados.update(_extras(extras, anos))
+        self.feriados = np.array(sorted(feriados), dtype="datetime64[D]")
+        self.calendario = np.busdaycalendar(weekmask="1111100", holidays=self.feriados)
+
+    def avaliar(self, inicio, prazo, hoje=None):
+        """
+        Prazo de cada linha em dias úteis, de uma vez:
+        - inicio: datas (Series datetime64, NaT = sem prazo)
+        - prazo: dias úteis (Series numérica, <= 0 = sem prazo)
+        Devolve DataFrame (mesmo índice) com dias_passados, dias_restantes,
+        percentual (0..100), vencimento e status ("Dentro do prazo"/"Atrasado"/"Sem prazo").
+        """
+        inicio = pd.to_datetime(pd.Series(inicio))
+        prazo = pd.to_numeric(pd.Series(prazo, index=inicio.index), errors="coerce").fillna(0).astype("int64")
+        hoje = np.datetime64(hoje or pd.Timestamp.now().normalize(), "D")
+
+        valido = inicio.notna().to_numpy() & (prazo.to_numpy() > 0)
+        ini = inicio.to_numpy(dtype="datetime64[D]")
+        ini = np.where(valido, ini, hoje)  # NaT não entra nas funções busday
+        p = np.where(valido, prazo.to_numpy(), 0)
+
+        # início fora de dia útil conta a partir do próximo dia útil
+        ini_util = np.busday_offset(ini, 0, roll="forward", busdaycal=self.calendario)
+        vencimento = np.busday_offset(ini_util, p, roll="forward", busdaycal=self.calendario)
+        passados = np.maximum(0, np.busday_count(ini_util, hoje, busdaycal=self.calendario))
+        restantes = p - passados
+        perc = np.clip(np.divide(passados, p, out=np.zeros(len(p)), where=p > 0), 0, 1) * 100
+
+        status = np.where(restantes < 0, "Atrasado", "Dentro do prazo")
+        out = pd.DataFrame({
+            "dias_passados": np.where(valido, passados, 0),
+            "dias_restantes": restantes,
+            "percentual": np.where(valido, np.where(restantes < 0, 100.0, perc), 0.0),
+            "vencimento": vencimento.astype("datetime64[ns]"),
+            "status": np.where(valido, status, "Sem prazo"),
+        }, index=inicio.index)
+        out["dias_restantes"] = out["dias_restantes"].astype("Int64").mask(~valido)
+        out["vencimento"] = out["vencimento"].mask(~valido)
+        return out
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rnd = np.random.default_rng(42)
+    hoje = np.datetime64("2025-06-16")
+    inicio = pd.Series(hoje - rnd.integers(0, 60, n).astype("timedelta64[D]")).astype("datetime64[ns]")
+    prazo = pd.Series(rnd.integers(0, 10, n))
+
+    ini = time.perf_counter()
+    cal = CalendarioUteis()
+    t_cal = time.perf_counter() - ini
+
+    ini = time.perf_counter()
+    vet = cal.avaliar(inicio, prazo, hoje)
+    t_vet = time.perf_counter() - ini
+
+    ini = time.perf_counter()
+    laco = [
+        int(p) - int(np.busday_count(np.busday_offset(np.datetime64(i, "D"), 0, roll="forward",
+                                                      busdaycal=cal.calendario), hoje, busdaycal=cal.calendario))
+        if p > 0 else None
+        for i, p in zip(inicio, prazo)
+    ]
+    t_laco = time.perf_counter() - ini
+
+    iguais = all(a == b for a, b in zip(vet["dias_restantes"].tolist(), laco)
+                 if a is not pd.NA and b is not None)
+    print(f"calendário ({len(cal.feriados)} feriados): {t_cal * 1000:.1f}ms (uma vez por processo)")
+    print(f"vetorizado: {n:,} linhas em {t_vet * 1000:.1f}ms")
+    print(f"por linha:  {n:,} linhas em {t_laco * 1000:.1f}ms ({t_laco / t_vet:.0f}x) | resultados iguais: {iguais}")
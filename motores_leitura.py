@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Motores de leitura (cursor → DataFrame) usados pelo run_query_df do app.
+
+- ler_tuplas: cursor.fetchall() → DataFrame (resultados pequenos).
+- ler_copy: COPY (consulta) TO STDOUT em CSV, lido pelo parser do pyarrow com os
+  tipos de cada coluna vindos do próprio Postgres (descrição do cursor, guardada
+  por texto de consulta): texto continua texto mesmo só com dígitos, 't'/'f' só
+  viram bool em colunas boolean, e '' (aspas no CSV) não se confunde com NULL.
+
+Benchmark (schema descartável; cada medição num subprocesso para o pico de memória):
+    python motores_leitura.py --linhas 100000 1000000
+"""
+import io
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# OID do tipo no Postgres → tipo do pyarrow; o resto é lido como texto
+TIPOS_ARROW = {
+    16: pa.bool_(),
+    20: pa.int64(), 21: pa.int64(), 23: pa.int64(),
+    700: pa.float64(), 701: pa.float64(), 1700: pa.float64(),  # numeric → float, como no coerce_float
+    1082: pa.date32(),
+    1114: pa.timestamp("us"),
+    1184: pa.timestamp("us", tz="UTC"),
+}
+_tipos_por_consulta = {}
+_tipos_lock = threading.Lock()
+
+def ler_tuplas(conn, sql, params):
+    """Motor padrão: cursor → DataFrame (resultados pequenos)."""
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        colunas = [d.name for d in cur.description]
+        return pd.DataFrame.from_records(cur.fetchall(), columns=colunas, coerce_float=True)
+
+def _colunas(cur, sql, params):
+    """[(nome, oid do tipo)] do resultado de `sql`, descobertos uma vez por texto de consulta."""
+    with _tipos_lock:
+        colunas = _tipos_por_consulta.get(sql)
+    if colunas is None:
+        cur.execute(f"SELECT * FROM ({sql}) AS q LIMIT 0", params)
+        colunas = [(d.name, d.type_code) for d in cur.description]
+        with _tipos_lock:
+            _tipos_por_consulta[sql] = colunas
+    return colunas
+
+def _ler_csv(buf, colunas, tipados=True):
+    buf.seek(0)
+    tipos = {nome: TIPOS_ARROW.get(oid, pa.string()) if tipados else pa.string() for nome, oid in colunas}
+    tabela = pa_csv.read_csv(
+        buf,
+        read_options=pa_csv.ReadOptions(column_names=[n for n, _ in colunas], skip_rows=1),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=tipos,
+            null_values=[""],               # NULL no CSV do COPY = campo vazio sem aspas
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=False,  # "" = texto vazio, não NULL
+            true_values=["t"], false_values=["f"],  # só se aplicam às colunas boolean
+        ),
+    )
+    return tabela.to_pandas(date_as_object=False)
+
+def ler_copy(conn, sql, params):
+    """
+    Motor colunar: COPY (consulta) TO STDOUT em CSV, sem um objeto Python por linha.
+    Datas voltam datetime64; timestamptz em UTC com fuso (tipar_carteira converte).
+    """
+    sql = sql.strip().rstrip(";")
+    with conn.cursor() as cur:
+        colunas = _colunas(cur, sql, params)
+        consulta = cur.mogrify(sql, params).decode()
+        buf = io.BytesIO()
+        cur.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER)", buf)
+    try:
+        return _ler_csv(buf, colunas)
+    except pa.ArrowInvalid:
+        # valor fora do que o pyarrow entende (ex.: 'infinity', offset com segundos): tudo como texto
+        return _ler_csv(buf, colunas, tipados=False)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import resource
+    import subprocess
+    import sys
+    import time
+
+    import psycopg2
+
+    CONSULTAS = {
+        # mesmo formato da carteira (tabela_status_empresas): uma linha por empresa
+        "carteira": """
+            SELECT ac.empresa, ac.agente, ac.entrada, ac.situacao, COALESCE(ac.limite, 0) AS limite,
+                   ac.etapa_atual, ac.responsavel_atual, ac.data_ultima_movimentacao,
+                   FALSE AS arquivada, lw.created_at AS ultima_transicao_em,
+                   lw.prazo_dias, lw.status_prazo
+              FROM analise_credito ac
+              LEFT JOIN LATERAL (SELECT created_at, prazo_dias, status_prazo FROM log_workflow l
+                                  WHERE l.empresa = ac.empresa ORDER BY created_at DESC LIMIT 1) lw ON TRUE
+             WHERE ac.empresa <= %s""",
+        "log_workflow": """
+            SELECT id, empresa, etapa, responsavel, prazo_dias, status_prazo, created_at
+              FROM log_workflow WHERE empresa <= %s""",
+    }
+
+    ap = argparse.ArgumentParser(description="tuplas × copy: tempo e pico de memória.")
+    ap.add_argument("--dsn", default="host=localhost port=5432 dbname=credito user=postgres password=postgres")
+    ap.add_argument("--linhas", type=int, nargs="+", default=[100_000, 1_000_000])
+    ap.add_argument("--medir", nargs=4, metavar=("SCHEMA", "MOTOR", "CONSULTA", "LINHAS"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.medir:  # subprocesso: uma leitura, relata tempo e pico de RSS acima da base
+        schema, motor, consulta, n = args.medir
+        conn = psycopg2.connect(args.dsn, options=f"-c search_path={schema}")
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        ini = time.perf_counter()
+        df = {"tuplas": ler_tuplas, "copy": ler_copy}[motor](conn, CONSULTAS[consulta], (f"Empresa {int(n):07d}",))
+        t = time.perf_counter() - ini
+        pico = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base) / 1024
+        print(json.dumps({"linhas": len(df), "s": t, "pico_mib": pico,
+                          "df_mib": df.memory_usage(deep=True).sum() / 2**20}))
+        sys.exit(0)
+
+    schema = f"bench_leitura_{int(time.time())}"
+    maior = max(args.linhas)
+    conn = psycopg2.connect(args.dsn)
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}; SET search_path = {schema}")
+        cur.execute("""
+            CREATE TABLE analise_credito (empresa TEXT PRIMARY KEY, agente TEXT, entrada DATE, situacao TEXT,
+                limite NUMERIC(15,2), etapa_atual TEXT, responsavel_atual TEXT, data_ultima_movimentacao TIMESTAMPTZ);
+            CREATE TABLE log_workflow (id BIGSERIAL, empresa TEXT, etapa TEXT, responsavel TEXT,
+                prazo_dias INT, status_prazo TEXT, created_at TIMESTAMPTZ);
+        """)
+        cur.execute("""
+            INSERT INTO analise_credito
+            SELECT 'Empresa ' || lpad(g::text, 7, '0'), (ARRAY['Gabriel','Marcelo','Lilian','Ellen'])[1 + g %% 4],
+                   CURRENT_DATE - (g %% 120), (ARRAY['Em análise','Aprovada','Reprovada','Stand by'])[1 + g %% 4],
+                   (g %% 500) * 1000, 'Em Análise', 'Analista', NOW() - (g %% 9000) * INTERVAL '1 minute'
+              FROM generate_series(1, %s) g;
+            INSERT INTO log_workflow (empresa, etapa, responsavel, prazo_dias, status_prazo, created_at)
+            SELECT 'Empresa ' || lpad(g::text, 7, '0'), 'Em Análise', 'Analista', g %% 5, 'Dentro do prazo',
+                   NOW() - (g %% 9000) * INTERVAL '1 minute'
+              FROM generate_series(1, %s) g;
+            CREATE INDEX ON log_workflow (empresa, created_at DESC);
+            ANALYZE;
+        """, (maior, maior))
+    conn.commit()
+    try:
+        print(f"{'consulta':14}{'linhas':>10}{'motor':>8}{'tempo':>9}{'linhas/s':>12}{'pico RSS':>11}{'DataFrame':>11}")
+        for consulta in CONSULTAS:
+            for n in args.linhas:
+                for motor in ("tuplas", "copy"):
+                    saida = subprocess.run([sys.executable, __file__, "--dsn", args.dsn,
+                                            "--medir", schema, motor, consulta, str(n)],
+                                           check=True, capture_output=True, text=True).stdout
+                    r = json.loads(saida.strip().splitlines()[-1])
+                    print(f"{consulta:14}{r['linhas']:>10,}{motor:>8}{r['s']:>8.2f}s{r['linhas'] / r['s']:>12,.0f}"
+                          f"{r['pico_mib']:>9.0f}MiB{r['df_mib']:>9.0f}MiB")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Publicação e escuta das escritas (LISTEN/NOTIFY) para invalidar leituras cacheadas.
+
+- Um NOTIFY por comando (trigger FOR EACH STATEMENT com tabelas de transição),
+  com as empresas tocadas e o id da transação — não um por linha.
+- O processo que escreveu já invalida o próprio cache na hora (VersoesDados.registrar)
+  e marca a transação antes do commit (transacao_propria); quando o aviso dela volta
+  pelo listener, é ignorado para as tabelas já registradas. Tabelas tocadas só por cascata (triggers)
+  chegam pelo aviso normalmente.
+- Cada aviso que conta chama `ao_mudar(tabela)`: o app sobe ali a versão do cache
+  compartilhado, então escritas que não passaram pelo run_exec de nenhum processo
+  (cascatas, funções, outras ferramentas) também o invalidam.
+"""
+import json
+import select
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.extensions
+
+CANAL_MUDANCAS = "credito_mudancas"
+TABELAS_MONITORADAS = ("analise_credito", "pendencias_empresa", "log_workflow", "dim_pendencias")
+TABELAS_SEM_EMPRESA = ("dim_pendencias",)  # aviso vale para a tabela toda
+MAX_EMPRESAS_AVISO = 100          # acima disso o aviso vale para a tabela toda
+MAX_TRANSACOES_LEMBRADAS = 4096
+
+SQL_FUNCAO_AVISO = f"""
+CREATE OR REPLACE FUNCTION notificar_mudanca_credito() RETURNS trigger AS $$
+DECLARE
+    empresas json;
+    qtd INT;
+    aviso TEXT;
+BEGIN
+    IF TG_NARGS > 0 THEN  -- tabela sem coluna empresa (ddl_gatilhos(..., por_empresa=False))
+        PERFORM pg_notify('{CANAL_MUDANCAS}',
+                          json_build_object('tabela', TG_TABLE_NAME, 'transacao', txid_current())::text);
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        SELECT json_agg(DISTINCT empresa), COUNT(DISTINCT empresa) INTO empresas, qtd FROM novas;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT json_agg(DISTINCT empresa), COUNT(DISTINCT empresa) INTO empresas, qtd FROM antigas;
+    ELSE
+        SELECT json_agg(DISTINCT empresa), COUNT(DISTINCT empresa) INTO empresas, qtd
+          FROM (SELECT empresa FROM novas UNION ALL SELECT empresa FROM antigas) t;
+    END IF;
+    IF qtd = 0 THEN
+        RETURN NULL;  -- comando que não tocou linha nenhuma
+    END IF;
+    aviso := json_build_object(
+        'tabela', TG_TABLE_NAME,
+        'transacao', txid_current(),
+        'empresas', CASE WHEN qtd <= {MAX_EMPRESAS_AVISO} THEN empresas END
+    )::text;
+    IF octet_length(aviso) > 7900 THEN  -- limite do payload do NOTIFY
+        aviso := json_build_object('tabela', TG_TABLE_NAME, 'transacao', txid_current())::text;
+    END IF;
+    PERFORM pg_notify('{CANAL_MUDANCAS}', aviso);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+def ddl_gatilhos(tabela, por_empresa=True):
+    """
+    Um trigger por operação (tabelas de transição não aceitam INSERT OR UPDATE OR DELETE).
+    Sem `por_empresa` (tabela sem coluna empresa) o aviso não traz empresas.
+    """
+    arg = "" if por_empresa else "'tabela_toda'"
+    return [
+        f"DROP TRIGGER IF EXISTS trg_notifica_{tabela} ON {tabela}",  # versão antiga, por linha
+        f"DROP TRIGGER IF EXISTS trg_notifica_{tabela}_ins ON {tabela}",
+        f"DROP TRIGGER IF EXISTS trg_notifica_{tabela}_upd ON {tabela}",
+        f"DROP TRIGGER IF EXISTS trg_notifica_{tabela}_del ON {tabela}",
+        f"""CREATE TRIGGER trg_notifica_{tabela}_ins AFTER INSERT ON {tabela}
+            REFERENCING NEW TABLE AS novas
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_mudanca_credito({arg})""",
+        f"""CREATE TRIGGER trg_notifica_{tabela}_upd AFTER UPDATE ON {tabela}
+            REFERENCING OLD TABLE AS antigas NEW TABLE AS novas
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_mudanca_credito({arg})""",
+        f"""CREATE TRIGGER trg_notifica_{tabela}_del AFTER DELETE ON {tabela}
+            REFERENCING OLD TABLE AS antigas
+            FOR EACH STATEMENT EXECUTE FUNCTION notificar_mudanca_credito({arg})""",
+    ]
+
+
+class VersoesDados:
+    """
+    Contadores de versão por tabela e por (tabela, empresa).
+    - Toda escrita (local ou vinda de outro processo via NOTIFY) incrementa os contadores.
+    - As leituras cacheadas usam esses contadores como parte da chave, então
+      uma mudança simplesmente faz a próxima leitura "errar" o cache.
+    """
+    def __init__(self, ao_mudar=None):
+        self._lock = threading.Lock()
+        self._ao_mudar = ao_mudar  # chamado com a tabela de cada aviso que contou (fora do lock)
+        self._epoca = 0           # reconexão do listener → tudo inválido
+        self._tabela = {}         # qualquer mudança na tabela
+        self._tabela_toda = {}    # mudança sem empresa conhecida
+        self._empresa = {}        # mudança em (tabela, empresa)
+        self._proprias = OrderedDict()  # transação escrita aqui → tabelas já registradas
+        self._mudou_em = {}       # tabela → time.time() da última mudança vista
+
+    def _incrementar(self, tabela, empresas):
+        self._tabela[tabela] = self._tabela.get(tabela, 0) + 1
+        self._mudou_em[tabela] = time.time()
+        if empresas is None:
+            self._tabela_toda[tabela] = self._tabela_toda.get(tabela, 0) + 1
+            return
+        for empresa in {str(e).strip() for e in empresas}:
+            chave = (tabela, empresa)
+            self._empresa[chave] = self._empresa.get(chave, 0) + 1
+
+    def transacao_propria(self, transacao, tabelas):
+        """
+        Chamado ANTES do commit de uma escrita deste processo (o aviso pode chegar
+        logo depois dele): o aviso de `transacao` é ignorado para `tabelas`, que
+        registrar() conta localmente.
+        """
+        with self._lock:
+            self._proprias.setdefault(transacao, set()).update(tabelas)
+            while len(self._proprias) > MAX_TRANSACOES_LEMBRADAS:
+                self._proprias.popitem(last=False)
+
+    def registrar(self, tabela, empresa=None):
+        with self._lock:
+            self._incrementar(tabela, None if empresa is None else [empresa])
+
+    def registrar_aviso(self, evento):
+        """Aviso recebido pelo LISTEN: {"tabela", "transacao", "empresas"}. Devolve se contou."""
+        tabela = evento.get("tabela")
+        if tabela not in TABELAS_MONITORADAS:
+            return False
+        with self._lock:
+            if tabela in self._proprias.get(evento.get("transacao"), ()):
+                return False
+            self._incrementar(tabela, evento.get("empresas"))
+        if self._ao_mudar is not None:
+            self._ao_mudar(tabela)
+        return True
+
+    def invalidar_tudo(self):
+        with self._lock:
+            self._epoca += 1
+            self._mudou_em[None] = time.time()
+
+    def mudou_em(self, tabelas):
+        """Quando alguma de `tabelas` mudou pela última vez (0 = nunca, neste processo)."""
+        with self._lock:
+            return max([self._mudou_em.get(t, 0) for t in tabelas] + [self._mudou_em.get(None, 0)])
+
+    def token(self, tabelas, empresa=None):
+        with self._lock:
+            if empresa is None:
+                return (self._epoca,) + tuple(self._tabela.get(t, 0) for t in tabelas)
+            emp = str(empresa).strip()
+            return (self._epoca,) + tuple(
+                (self._tabela_toda.get(t, 0), self._empresa.get((t, emp), 0)) for t in tabelas
+            )
+
+
+def ouvir_mudancas(config, versoes, parar=None):
+    """Loop do listener: uma conexão dedicada em autocommit fazendo LISTEN."""
+    while parar is None or not parar.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(**config)
+            conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CANAL_MUDANCAS};")
+            # eventos podem ter sido perdidos enquanto estávamos desconectados
+            versoes.invalidar_tudo()
+            while parar is None or not parar.is_set():
+                if select.select([conn], [], [], 1 if parar is not None else 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    aviso = conn.notifies.pop(0)
+                    try:
+                        evento = json.loads(aviso.payload)
+                    except ValueError:
+                        continue
+                    versoes.registrar_aviso(evento)
+        except Exception:
+            (parar or threading.Event()).wait(5)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
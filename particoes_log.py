@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+log_workflow particionado por mês (created_at): funções de manutenção, migração
+explícita e benchmark.
+
+A migração NÃO roda no import do app: é um passo de manutenção, executado uma vez
+por este script. Ela copia o histórico mês a mês (uma transação curta por lote,
+com statement_timeout) para uma tabela particionada nova enquanto o app segue
+usando a antiga; no fim, sob LOCK curto (lock_timeout), copia o que chegou no
+meio do caminho e troca os nomes. A tabela antiga fica como log_workflow_legado.
+
+Uso:
+    python particoes_log.py migrar  [--lote-timeout-s 600] [--lock-timeout-s 5]
+    python particoes_log.py bench   [--linhas 10000000] [--empresas 20000]   # schema descartável
+"""
+import argparse
+import random
+import statistics
+import time
+
+import psycopg2
+
+from mudancas import SQL_FUNCAO_AVISO, ddl_gatilhos
+
+SQL_FUNCOES_PARTICAO = """
+-- Cria a partição do mês de `mes` (se log_workflow já for particionada).
+-- Linhas desse mês que tenham caído na partição DEFAULT (partição criada atrasada)
+-- são movidas para a nova antes do ATTACH — com elas lá, o ATTACH falharia.
+CREATE OR REPLACE FUNCTION criar_particao_log_workflow(mes date) RETURNS void AS $$
+DECLARE
+    ini    date := date_trunc('month', mes)::date;
+    fim    date := (date_trunc('month', mes) + INTERVAL '1 month')::date;
+    nome   text := 'log_workflow_' || to_char(date_trunc('month', mes), 'YYYYMM');
+    padrao regclass;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'log_workflow'::regclass) THEN
+        RETURN;  -- ainda não migrada (python particoes_log.py migrar)
+    END IF;
+    IF to_regclass(nome) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    SELECT NULLIF(partdefid, 0)::regclass INTO padrao
+      FROM pg_partitioned_table WHERE partrelid = 'log_workflow'::regclass;
+
+    EXECUTE format('CREATE TABLE %I (LIKE log_workflow INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', nome);
+    IF padrao IS NOT NULL THEN
+        EXECUTE format(
+            'WITH movidas AS (DELETE FROM %s WHERE created_at >= %L AND created_at < %L RETURNING *)
+             INSERT INTO %I SELECT * FROM movidas', padrao, ini, fim, nome);
+    END IF;
+    EXECUTE format('ALTER TABLE log_workflow ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', nome, ini, fim);
+END;
+$$ LANGUAGE plpgsql;
+
+-- Desanexa partições mais antigas que `meses` e as move para o schema arquivo_log
+-- (continuam consultáveis, só saem das varreduras do log "quente").
+CREATE OR REPLACE FUNCTION arquivar_particoes_log_workflow(meses int) RETURNS int AS $$
+DECLARE
+    corte date := (date_trunc('month', NOW()) - make_interval(months => meses))::date;
+    part  record;
+    n     int := 0;
+BEGIN
+    CREATE SCHEMA IF NOT EXISTS arquivo_log;
+    FOR part IN
+        SELECT c.relname
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+         WHERE i.inhparent = 'log_workflow'::regclass
+           AND c.relname ~ '^log_workflow_[0-9]{6}$'
+           AND to_date(right(c.relname, 6), 'YYYYMM') < corte
+    LOOP
+        EXECUTE format('ALTER TABLE log_workflow DETACH PARTITION %I', part.relname);
+        EXECUTE format('ALTER TABLE %I SET SCHEMA arquivo_log', part.relname);
+        n := n + 1;
+    END LOOP;
+    RETURN n;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# log_workflow.id (desempate do keyset do histórico e marca da migração): a tabela
+# original não tem; o app cria no import e a migração também. ADD COLUMN com
+# BIGSERIAL reescreve a tabela, então só roda se a coluna faltar (uma vez).
+SQL_COLUNA_ID_LOG = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                    WHERE table_schema = current_schema() AND table_name = 'log_workflow'
+                      AND column_name = 'id') THEN
+        ALTER TABLE log_workflow ADD COLUMN id BIGSERIAL;
+    END IF;
+    IF to_regclass('log_workflow_arquivo') IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+             WHERE table_schema = current_schema() AND table_name = 'log_workflow_arquivo'
+               AND column_name = 'id') THEN
+        -- as linhas já arquivadas ganham id da mesma sequência (ao restaurar, id é NOT NULL)
+        EXECUTE format('ALTER TABLE log_workflow_arquivo ADD COLUMN id BIGINT DEFAULT nextval(%L)',
+                       pg_get_serial_sequence('log_workflow', 'id'));
+        ALTER TABLE log_workflow_arquivo ALTER COLUMN id DROP DEFAULT;
+    END IF;
+END $$;
+"""
+INDICE_KEYSET = "CREATE INDEX IF NOT EXISTS {nome} ON {tabela} (empresa, created_at DESC, id DESC)"
+TRAVA_ARQUIVAMENTO = "hashtext('arquivar_empresas')"  # a rotina de arquivamento pula enquanto a migração roda
+
+# =========================================================
+# 🚚 MIGRAÇÃO
+# =========================================================
+def particionada(cur):
+    cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'log_workflow'::regclass)")
+    return cur.fetchone()[0]
+
+def _meses(cur, tabela):
+    cur.execute(f"""
+        SELECT date_trunc('month', MIN(created_at))::date,
+               date_trunc('month', GREATEST(MAX(created_at), NOW()))::date
+          FROM {tabela}
+    """)
+    ini, fim = cur.fetchone()
+    if ini is None:
+        cur.execute("SELECT date_trunc('month', NOW())::date")
+        ini = fim = cur.fetchone()[0]
+    cur.execute("SELECT generate_series(%s::date, %s::date, INTERVAL '1 month')::date", (ini, fim))
+    return [r[0] for r in cur.fetchall()]
+
+def migrar(conn, lote_timeout_s=600, lock_timeout_s=5, tentativas=10, log=print):
+    """Converte log_workflow em particionada por mês. Idempotente: não faz nada se já for."""
+    with conn.cursor() as cur:
+        cur.execute(SQL_FUNCOES_PARTICAO)
+        if particionada(cur):
+            conn.commit()
+            log("log_workflow já é particionada.")
+            return False
+        cur.execute(f"SELECT pg_advisory_lock({TRAVA_ARQUIVAMENTO})")
+        cur.execute("SET statement_timeout = %s", (int(lote_timeout_s * 1000),))
+
+        # 1) estrutura nova, ao lado da antiga; id na tabela e no arquivo (log_workflow_arquivo,
+        #    criada LIKE log_workflow, precisa das mesmas colunas para arquivar/restaurar)
+        cur.execute(SQL_COLUNA_ID_LOG)
+        cur.execute("DROP TABLE IF EXISTS log_workflow_novo")  # tentativa anterior interrompida
+        cur.execute("""
+            CREATE TABLE log_workflow_novo (LIKE log_workflow INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                PARTITION BY RANGE (created_at)
+        """)
+        cur.execute("ALTER TABLE log_workflow_novo ALTER COLUMN created_at SET DEFAULT NOW()")
+        meses = _meses(cur, "log_workflow")
+        for mes in meses:
+            cur.execute(f"""
+                CREATE TABLE log_workflow_{mes:%Y%m} PARTITION OF log_workflow_novo
+                    FOR VALUES FROM (%s) TO (%s::date + INTERVAL '1 month')
+            """, (mes, mes))
+        cur.execute("CREATE TABLE log_workflow_default PARTITION OF log_workflow_novo DEFAULT")
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM log_workflow")
+        marca = cur.fetchone()[0]
+        conn.commit()
+        log(f"{len(meses)} partições criadas; copiando até id {marca}.")
+
+        # 2) cópia mês a mês, uma transação por lote (o app segue escrevendo na antiga)
+        total = 0
+        for mes in [None] + meses:
+            ini = time.perf_counter()
+            if mes is None:  # antes do 1º mês / sem data: vão para a DEFAULT
+                cur.execute("""
+                    INSERT INTO log_workflow_novo SELECT * FROM log_workflow
+                     WHERE id <= %s AND (created_at IS NULL OR created_at < %s)
+                """, (marca, meses[0]))
+            elif mes == meses[-1]:
+                cur.execute("""
+                    INSERT INTO log_workflow_novo SELECT * FROM log_workflow
+                     WHERE id <= %s AND created_at >= %s
+                """, (marca, mes))
+            else:
+                cur.execute("""
+                    INSERT INTO log_workflow_novo SELECT * FROM log_workflow
+                     WHERE id <= %s AND created_at >= %s AND created_at < %s::date + INTERVAL '1 month'
+                """, (marca, mes, mes))
+            total += cur.rowcount
+            conn.commit()
+            if mes is not None:
+                log(f"  {mes:%Y-%m}: {cur.rowcount} linhas em {time.perf_counter() - ini:.1f}s")
+        cur.execute(INDICE_KEYSET.format(nome="idx_lw_novo_empresa_created_id", tabela="log_workflow_novo"))
+        cur.execute("ANALYZE log_workflow_novo")
+        conn.commit()
+
+        # 3) troca: LOCK curto, delta do que chegou/saiu durante a cópia, renomeia
+        cur.execute("SET lock_timeout = %s", (int(lock_timeout_s * 1000),))
+        for tentativa in range(1, tentativas + 1):
+            try:
+                _trocar(cur, marca)
+                conn.commit()
+                break
+            except psycopg2.errors.LockNotAvailable:
+                conn.rollback()
+                log(f"  tabela ocupada, nova tentativa de troca ({tentativa}/{tentativas})")
+                time.sleep(1)
+        else:
+            raise RuntimeError("Não consegui o LOCK para trocar as tabelas; rode de novo fora do pico.")
+        cur.execute(f"SELECT pg_advisory_unlock({TRAVA_ARQUIVAMENTO})")
+        conn.commit()
+    log(f"log_workflow particionada: {total} linhas copiadas; a antiga ficou em log_workflow_legado.")
+    return True
+
+def _trocar(cur, marca):
+    # leituras seguem; escritas esperam só durante o delta e os renames
+    cur.execute("LOCK TABLE log_workflow IN EXCLUSIVE MODE")
+    cur.execute("INSERT INTO log_workflow_novo SELECT * FROM log_workflow WHERE id > %s", (marca,))
+    cur.execute("""
+        DELETE FROM log_workflow_novo n
+         WHERE n.id <= %s AND NOT EXISTS (SELECT 1 FROM log_workflow o WHERE o.id = n.id)
+    """, (marca,))  # excluídas no meio da cópia (ex.: "Excluir empresa")
+
+    # views sobre log_workflow apontam para a tabela, não para o nome: recria depois do rename
+    cur.execute("""
+        SELECT DISTINCT v.oid::regclass::text, pg_get_viewdef(v.oid)
+          FROM pg_depend d
+          JOIN pg_rewrite r ON r.oid = d.objid
+          JOIN pg_class v ON v.oid = r.ev_class
+         WHERE d.refobjid = 'log_workflow'::regclass AND v.oid <> 'log_workflow'::regclass
+    """)
+    views = cur.fetchall()
+
+    cur.execute("ALTER TABLE log_workflow RENAME TO log_workflow_legado")
+    cur.execute("ALTER TABLE log_workflow_novo RENAME TO log_workflow")
+    cur.execute("ALTER INDEX IF EXISTS idx_lw_empresa_created_id RENAME TO idx_lw_legado_empresa_created_id")
+    cur.execute("ALTER INDEX idx_lw_novo_empresa_created_id RENAME TO idx_lw_empresa_created_id")
+    cur.execute("SELECT pg_get_serial_sequence('log_workflow_legado', 'id')")
+    seq = cur.fetchone()[0]
+    if seq:
+        cur.execute(f"ALTER SEQUENCE {seq} OWNED BY log_workflow.id")
+    for nome, definicao in views:
+        cur.execute(f"CREATE OR REPLACE VIEW {nome} AS {definicao}")
+    # avisos de mudança: saem da legada e valem já na nova, sem esperar o app reiniciar
+    cur.execute(SQL_FUNCAO_AVISO)
+    for q in ddl_gatilhos("log_workflow")[:4]:  # só os DROP TRIGGER
+        cur.execute(q.replace(" ON log_workflow", " ON log_workflow_legado"))
+    for q in ddl_gatilhos("log_workflow"):
+        cur.execute(q)
+
+# =========================================================
+# ⏱️ BENCHMARK (schema descartável)
+# =========================================================
+CONSULTAS_BENCH = {
+    # a última transição de cada empresa (o que a carteira lia do log antes de guardá-la em analise_credito)
+    "ultima": "SELECT created_at FROM log_workflow WHERE empresa = %s ORDER BY created_at DESC LIMIT 1",
+    # 1ª página do histórico (log_empresa_inicio do app)
+    "historico": """
+        SELECT id, etapa, responsavel, created_at, prazo_dias, status_prazo
+          FROM log_workflow WHERE empresa = %s
+         ORDER BY created_at DESC, id DESC LIMIT 20""",
+}
+
+def _medir(cur, empresas, repeticoes):
+    """p50/p99 (ms) de cada consulta por empresa: ad hoc e preparada (como o app chama o histórico)."""
+    cur.execute("DEALLOCATE ALL")
+    for nome, sql in CONSULTAS_BENCH.items():
+        cur.execute(f"PREPARE bench_{nome} (text) AS {sql.replace('%s', '$1')}")
+    tempos = {}
+    for nome, sql in CONSULTAS_BENCH.items():
+        for modo, texto in (("ad hoc", sql), ("preparada", f"EXECUTE bench_{nome} (%s)")):
+            amostras = []
+            for empresa in empresas[:repeticoes]:
+                ini = time.perf_counter()
+                cur.execute(texto, (empresa,))
+                cur.fetchall()
+                amostras.append((time.perf_counter() - ini) * 1000)
+            amostras.sort()
+            tempos[(nome, modo)] = (statistics.median(amostras),
+                                    amostras[min(len(amostras) - 1, int(.99 * len(amostras)))])
+    return tempos
+
+def bench(conn, linhas, n_empresas, meses=36, repeticoes=2000):
+    schema = f"bench_log_{int(time.time())}"
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}; SET search_path = {schema}")
+        cur.execute("""
+            CREATE TABLE log_workflow (
+                id BIGSERIAL, empresa TEXT NOT NULL, etapa TEXT, responsavel TEXT,
+                prazo_dias INT, status_prazo TEXT, created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        conn.commit()
+        try:
+            ini = time.perf_counter()
+            cur.execute("""
+                INSERT INTO log_workflow (empresa, etapa, responsavel, prazo_dias, status_prazo, created_at)
+                SELECT 'Empresa ' || lpad((g %% %s)::text, 6, '0'), 'Em Análise', 'Analista', 3,
+                       'Dentro do prazo', NOW() - (random() * %s * INTERVAL '30 days')
+                  FROM generate_series(1, %s) g
+            """, (n_empresas, meses, linhas))
+            cur.execute(INDICE_KEYSET.format(nome="idx_lw_empresa_created_id", tabela="log_workflow"))
+            cur.execute("ANALYZE log_workflow")
+            conn.commit()
+            print(f"semeadas {linhas:,} linhas / {n_empresas:,} empresas em {time.perf_counter() - ini:.1f}s")
+
+            empresas = [f"Empresa {i:06d}" for i in random.Random(1).sample(range(n_empresas), min(n_empresas, repeticoes))]
+            _medir(cur, empresas, 200)  # aquece o cache de páginas
+            antes = _medir(cur, empresas, repeticoes)
+            conn.commit()
+
+            ini = time.perf_counter()
+            migrar(conn, log=lambda *_: None)
+            t_migrar = time.perf_counter() - ini
+            with conn.cursor() as cur2:
+                _medir(cur2, empresas, 200)
+                depois = _medir(cur2, empresas, repeticoes)
+                cur2.execute("SELECT COUNT(*) FROM log_workflow")
+                copiadas = cur2.fetchone()[0]
+            conn.commit()
+
+            print(f"migração: {copiadas:,} linhas em {t_migrar:.1f}s")
+            print(f"{'(ms, ' + str(len(empresas)) + ' empresas)':34}{'antes p50':>10}{'p99':>8}{'depois p50':>12}{'p99':>8}")
+            for chave in antes:
+                rotulo = f"{'última transição' if chave[0] == 'ultima' else 'histórico'} ({chave[1]})"
+                print(f"{rotulo:34}{antes[chave][0]:10.2f}{antes[chave][1]:8.2f}"
+                      f"{depois[chave][0]:12.2f}{depois[chave][1]:8.2f}")
+        finally:
+            conn.rollback()
+            cur.execute(f"DROP SCHEMA {schema} CASCADE")
+            conn.commit()
+
+def main():
+    ap = argparse.ArgumentParser(description="Particionamento mensal do log_workflow.")
+    ap.add_argument("acao", choices=["migrar", "bench"])
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", default="5432")
+    ap.add_argument("--dbname", default="credito")
+    ap.add_argument("--user", default="postgres")
+    ap.add_argument("--password", default="postgres")
+    ap.add_argument("--lote-timeout-s", type=float, default=600, help="statement_timeout de cada lote da cópia")
+    ap.add_argument("--lock-timeout-s", type=float, default=5, help="lock_timeout da troca de tabelas")
+    ap.add_argument("--linhas", type=int, default=10_000_000, help="(bench) linhas de log")
+    ap.add_argument("--empresas", type=int, default=20_000, help="(bench) empresas distintas")
+    args = ap.parse_args()
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    try:
+        if args.acao == "migrar":
+            migrar(conn, args.lote_timeout_s, args.lock_timeout_s)
+        else:
+            bench(conn, args.linhas, args.empresas)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Sincronização incremental da carteira com uma planilha do Google Sheets.
+
+Em vez de reescrever a aba inteira a cada execução (estoura a cota da API
+conforme a carteira cresce), cada rodada:
+- usa marcas d'água (analise_credito.data_ultima_movimentacao e
+  log_workflow.created_at) para achar só as empresas que mexeram, mais as
+  que tiveram campos editados (versao), pendências mudadas (a contagem não
+  mexe em nenhuma das marcas: compara com a última enviada) ou ainda não
+  estão na planilha;
+- descarta as que não mudaram de fato (hash da linha já enviada);
+- manda o resto em UM batch_update, agrupando linhas contíguas em ranges;
+- guarda empresa → linha da planilha em sync_planilha_linhas.
+
+Uso:
+    python sync_planilha.py --planilha <id> --credenciais sa.json
+    python sync_planilha.py --falsa                   # planilha em memória (sem API)
+"""
+import argparse
+import hashlib
+import json
+from datetime import date, datetime, timedelta
+
+import psycopg2
+import psycopg2.extras as pg_extras
+
+COLUNAS = [
+    ("empresa", "Empresa"),
+    ("agente", "Agente"),
+    ("entrada", "Entrada"),
+    ("situacao", "Situação"),
+    ("limite", "Limite (R$)"),
+    ("etapa_atual", "Etapa atual"),
+    ("responsavel_atual", "Responsável"),
+    ("ultima_transicao_em", "Última transição"),
+    ("data_ultima_movimentacao", "Última movimentação"),
+    ("pendentes", "Pendências"),
+    ("saida_credito", "Saída crédito"),
+]
+# transações que gravaram NOW() antes da marca anterior mas comitaram depois dela
+MARGEM_MARCA = timedelta(minutes=5)
+MAX_RANGES_POR_CHAMADA = 500
+
+# =========================================================
+# 🗃️ ESTADO NO BANCO
+# =========================================================
+DDL_SYNC = """
+CREATE TABLE IF NOT EXISTS sync_planilha_marcas (
+    planilha TEXT PRIMARY KEY,
+    movimentacao TIMESTAMPTZ,
+    log TIMESTAMPTZ,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS sync_planilha_linhas (
+    planilha TEXT NOT NULL,
+    empresa TEXT NOT NULL,
+    linha INT NOT NULL,
+    versao INT NOT NULL DEFAULT 0,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (planilha, empresa)
+);
+ALTER TABLE sync_planilha_linhas ADD COLUMN IF NOT EXISTS pendentes INT;
+"""
+
+SQL_CANDIDATAS = """
+WITH mexidas AS (
+    -- marca nula (tabela ainda vazia na rodada anterior) = tudo conta como novo
+    SELECT empresa FROM analise_credito WHERE data_ultima_movimentacao > COALESCE(%(mov)s::timestamptz, '-infinity')
+    UNION
+    SELECT empresa FROM log_workflow WHERE created_at > COALESCE(%(log)s::timestamptz, '-infinity')
+)
+SELECT ac.empresa, ac.agente, ac.entrada, ac.situacao, ac.limite, ac.etapa_atual,
+       ac.responsavel_atual, ac.ultima_transicao_em,
+       ac.data_ultima_movimentacao, qtd_bits(ac.pendentes_mask) + ac.pendentes_fora_dim AS pendentes,
+       ac.saida_credito, ac.versao
+  FROM analise_credito ac
+  LEFT JOIN sync_planilha_linhas sl ON sl.planilha = %(planilha)s AND sl.empresa = ac.empresa
+ WHERE sl.empresa IS NULL
+    OR sl.versao <> ac.versao
+    OR sl.pendentes IS DISTINCT FROM qtd_bits(ac.pendentes_mask) + ac.pendentes_fora_dim
+    OR ac.empresa IN (SELECT empresa FROM mexidas)
+ ORDER BY ac.empresa
+"""
+
+def _celula(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.strftime("%d/%m/%Y %H:%M")
+    if isinstance(v, date):
+        return v.strftime("%d/%m/%Y")
+    if type(v).__name__ == "Decimal":
+        return float(v)
+    return v
+
+def _linha_planilha(registro):
+    return [_celula(registro[c]) for c, _ in COLUNAS]
+
+def _hash(valores):
+    return hashlib.sha1(json.dumps(valores, default=str).encode()).hexdigest()
+
+def _letra_coluna(n):
+    letras = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        letras = chr(65 + r) + letras
+    return letras
+
+def _ranges(linhas_por_indice):
+    """Agrupa {linha: valores} em blocos contíguos → [{"range": "A5:K7", "values": [...]}]."""
+    ultima_col = _letra_coluna(len(COLUNAS))
+    blocos, atual = [], []
+    for idx in sorted(linhas_por_indice):
+        if atual and idx != atual[-1] + 1:
+            blocos.append(atual)
+            atual = []
+        atual.append(idx)
+    if atual:
+        blocos.append(atual)
+    return [{"range": f"A{b[0]}:{ultima_col}{b[-1]}",
+             "values": [linhas_por_indice[i] for i in b]} for b in blocos]
+
+# =========================================================
+# 📄 PLANILHAS (real e falsa)
+# =========================================================
+class PlanilhaFalsa:
+    """Aba em memória com a mesma interface usada do gspread.Worksheet; conta chamadas."""
+    def __init__(self, linhas=1000):
+        self.row_count = linhas
+        self.celulas = {}
+        self.chamadas = 0
+
+    def add_rows(self, n):
+        self.chamadas += 1
+        self.row_count += n
+
+    def batch_update(self, data, value_input_option="RAW"):
+        self.chamadas += 1
+        for bloco in data:
+            ini = int(bloco["range"].split(":")[0][1:])
+            for k, valores in enumerate(bloco["values"]):
+                if ini + k > self.row_count:
+                    raise ValueError(f"Linha {ini + k} fora da grade ({self.row_count})")
+                self.celulas[ini + k] = list(valores)
+
+    def linha(self, idx):
+        return self.celulas.get(idx)
+
+
+class ContadorChamadas:
+    """Envolve uma gspread.Worksheet real contando as chamadas de escrita."""
+    def __init__(self, aba):
+        self.aba = aba
+        self.chamadas = 0
+
+    @property
+    def row_count(self):
+        return self.aba.row_count
+
+    def add_rows(self, n):
+        self.chamadas += 1
+        self.aba.add_rows(n)
+
+    def batch_update(self, data, value_input_option="RAW"):
+        self.chamadas += 1
+        self.aba.batch_update(data, value_input_option=value_input_option)
+
+
+def abrir_planilha(planilha_id, aba, credenciais):
+    try:
+        import gspread
+    except ImportError as e:
+        raise RuntimeError("Sincronização real requer o pacote gspread (pip install gspread).") from e
+    cliente = gspread.service_account(filename=credenciais)
+    return ContadorChamadas(cliente.open_by_key(planilha_id).worksheet(aba))
+
+# =========================================================
+# 🔁 SINCRONIZAÇÃO
+# =========================================================
+def sincronizar(conn, aba, planilha="carteira"):
+    """
+    Roda uma rodada incremental e devolve o relatório:
+    {"candidatas", "enviadas", "novas", "atualizadas", "ranges", "chamadas_api"}.
+    A marca d'água só avança depois que a planilha aceitou o batch.
+    """
+    chamadas_ini = aba.chamadas
+    with conn.cursor(cursor_factory=pg_extras.RealDictCursor) as cur:
+        cur.execute(DDL_SYNC)
+        cur.execute("SELECT movimentacao, log FROM sync_planilha_marcas WHERE planilha = %s", (planilha,))
+        marca = cur.fetchone() or {"movimentacao": None, "log": None}
+        # sem marca (primeira rodada) todas entram por não estarem em sync_planilha_linhas
+        mov = marca["movimentacao"] and marca["movimentacao"] - MARGEM_MARCA
+        log = marca["log"] and marca["log"] - MARGEM_MARCA
+
+        cur.execute("SELECT empresa, linha, hash FROM sync_planilha_linhas WHERE planilha = %s", (planilha,))
+        mapa = {r["empresa"]: r for r in cur.fetchall()}
+
+        cur.execute(SQL_CANDIDATAS, {"mov": mov, "log": log, "planilha": planilha})
+        candidatas = cur.fetchall()
+
+        proxima = max([r["linha"] for r in mapa.values()], default=1) + 1
+        envio, gravar, novas = {1: [t for _, t in COLUNAS]}, [], 0
+        for r in candidatas:
+            valores = _linha_planilha(r)
+            h = _hash(valores)
+            atual = mapa.get(r["empresa"])
+            if atual and atual["hash"] == h:
+                gravar.append((planilha, r["empresa"], atual["linha"], r["versao"], r["pendentes"], h))
+                continue
+            if atual:
+                idx = atual["linha"]
+            else:
+                idx, proxima, novas = proxima, proxima + 1, novas + 1
+            envio[idx] = valores
+            gravar.append((planilha, r["empresa"], idx, r["versao"], r["pendentes"], h))
+        if mapa:
+            envio.pop(1)  # cabeçalho já foi escrito na primeira rodada
+
+        if envio:
+            if proxima - 1 > aba.row_count:
+                aba.add_rows(proxima - 1 - aba.row_count)
+            blocos = _ranges(envio)
+            for i in range(0, len(blocos), MAX_RANGES_POR_CHAMADA):
+                aba.batch_update(blocos[i:i + MAX_RANGES_POR_CHAMADA], value_input_option="RAW")
+        else:
+            blocos = []
+
+        if gravar:
+            pg_extras.execute_values(cur, """
+                INSERT INTO sync_planilha_linhas (planilha, empresa, linha, versao, pendentes, hash) VALUES %s
+                ON CONFLICT (planilha, empresa)
+                DO UPDATE SET linha = EXCLUDED.linha, versao = EXCLUDED.versao,
+                              pendentes = EXCLUDED.pendentes, hash = EXCLUDED.hash
+            """, gravar)
+        cur.execute("""
+            INSERT INTO sync_planilha_marcas (planilha, movimentacao, log)
+            SELECT %s,
+                   GREATEST(%s, (SELECT MAX(data_ultima_movimentacao) FROM analise_credito)),
+                   GREATEST(%s, (SELECT MAX(created_at) FROM log_workflow))
+            ON CONFLICT (planilha)
+            DO UPDATE SET movimentacao = EXCLUDED.movimentacao, log = EXCLUDED.log, atualizado_em = NOW()
+        """, (planilha, marca["movimentacao"], marca["log"]))
+    conn.commit()
+
+    enviadas = len(envio) - (0 if mapa else 1)
+    return {
+        "candidatas": len(candidatas),
+        "enviadas": enviadas,
+        "novas": novas,
+        "atualizadas": enviadas - novas,
+        "ranges": len(blocos),
+        "chamadas_api": aba.chamadas - chamadas_ini,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Sincroniza a carteira com o Google Sheets (incremental).")
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--port", default="5432")
+    ap.add_argument("--dbname", default="credito")
+    ap.add_argument("--user", default="postgres")
+    ap.add_argument("--password", default="postgres")
+    ap.add_argument("--planilha", help="ID da planilha (na URL do Google Sheets)")
+    ap.add_argument("--aba", default="Carteira")
+    ap.add_argument("--credenciais", help="JSON da service account")
+    ap.add_argument("--falsa", action="store_true", help="Usa uma planilha em memória (sem API)")
+    args = ap.parse_args()
+
+    if args.falsa:
+        aba, chave = PlanilhaFalsa(), "falsa"
+    else:
+        if not (args.planilha and args.credenciais):
+            ap.error("--planilha e --credenciais são obrigatórios (ou use --falsa)")
+        aba, chave = abrir_planilha(args.planilha, args.aba, args.credenciais), f"{args.planilha}:{args.aba}"
+
+    conn = psycopg2.connect(host=args.host, port=args.port, dbname=args.dbname,
+                            user=args.user, password=args.password)
+    try:
+        rel = sincronizar(conn, aba, planilha=chave)
+    finally:
+        conn.close()
+    print(f"candidatas {rel['candidatas']} | enviadas {rel['enviadas']} "
+          f"(novas {rel['novas']}, atualizadas {rel['atualizadas']}) | "
+          f"ranges {rel['ranges']} | chamadas API {rel['chamadas_api']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures comuns. Os testes que precisam de Postgres leem a conexão de
+CREDITO_TEST_DSN (ex.: "host=localhost port=5432 user=postgres dbname=postgres")
+e são pulados sem ela; cada teste roda num schema descartável.
+"""
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+import psycopg2.extensions
+
+
+@pytest.fixture
+def pg_config():
+    """Parâmetros de conexão (dict para psycopg2.connect) apontando para um schema novo."""
+    dsn = os.environ.get("CREDITO_TEST_DSN")
+    if not dsn:
+        pytest.skip("CREDITO_TEST_DSN não definido")
+    base = psycopg2.extensions.parse_dsn(dsn)
+    schema = f"teste_{uuid.uuid4().hex[:10]}"
+    with psycopg2.connect(**base) as adm, adm.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {schema}")
+    config = {**base, "options": f"-c search_path={schema}"}
+    yield config
+    adm = psycopg2.connect(**base)
+    adm.autocommit = True
+    with adm.cursor() as cur:
+        cur.execute(f"DROP SCHEMA {schema} CASCADE")
+    adm.close()
+
+
+@pytest.fixture
+def pg(pg_config):
+    conn = psycopg2.connect(**pg_config)
+    yield conn
+    conn.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from arquivo_empresas import SQL_FUNCOES_ARQUIVO, TABELAS_ARQUIVAVEIS
+
+
+def _criar(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE analise_credito (
+                empresa TEXT PRIMARY KEY, agente TEXT, entrada DATE, situacao TEXT, etapa_atual TEXT,
+                data_ultima_movimentacao TIMESTAMPTZ,
+                pendentes_mask BIGINT NOT NULL DEFAULT 0, recebidos_mask BIGINT NOT NULL DEFAULT 0,
+                pendentes_fora_dim INT NOT NULL DEFAULT 0);
+            CREATE TABLE pendencias_empresa (id SERIAL PRIMARY KEY, empresa TEXT, documento TEXT, status TEXT);
+            CREATE TABLE log_workflow (empresa TEXT NOT NULL, etapa TEXT, created_at TIMESTAMPTZ DEFAULT NOW());
+        """)
+        cur.execute(SQL_FUNCOES_ARQUIVO)
+        # colunas acrescentadas depois, em ordem diferente em cada lado
+        cur.execute("""
+            ALTER TABLE analise_credito ADD COLUMN versao INT NOT NULL DEFAULT 0;
+            ALTER TABLE analise_credito ADD COLUMN comentario TEXT;
+            ALTER TABLE analise_credito_arquivo ADD COLUMN comentario TEXT;
+            ALTER TABLE analise_credito_arquivo ADD COLUMN versao INT NOT NULL DEFAULT 0;
+        """)
+        for t in TABELAS_ARQUIVAVEIS:
+            cur.execute("SELECT recriar_view_todas(%s)", (t,))
+        cur.execute("""
+            INSERT INTO analise_credito (empresa, agente, entrada, situacao, etapa_atual,
+                                         data_ultima_movimentacao, versao, comentario)
+            VALUES ('Velha', 'Ana', '2024-01-01', 'Aprovada', 'Finalizado', NOW() - INTERVAL '90 days', 7, 'ok'),
+                   ('Ativa', 'Ana', '2025-01-01', 'Em análise', 'Cadastro', NOW(), 1, NULL);
+            INSERT INTO pendencias_empresa (empresa, documento, status) VALUES ('Velha', 'DRE', 'recebido');
+            INSERT INTO log_workflow (empresa, etapa) VALUES ('Velha', 'Cadastro'), ('Velha', 'Finalizado');
+        """)
+    conn.commit()
+
+
+def test_arquiva_e_restaura_casando_colunas_pelo_nome(pg):
+    _criar(pg)
+    with pg.cursor() as cur:
+        cur.execute("SELECT arquivar_empresas_encerradas(30)")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT versao, comentario FROM analise_credito_arquivo WHERE empresa = 'Velha'")
+        assert cur.fetchone() == (7, "ok")
+        cur.execute("SELECT COUNT(*) FROM log_workflow_arquivo")
+        assert cur.fetchone()[0] == 2
+        cur.execute("SELECT empresa, versao, comentario, arquivada FROM analise_credito_todas ORDER BY empresa")
+        assert cur.fetchall() == [("Ativa", 1, None, False), ("Velha", 7, "ok", True)]
+
+        cur.execute("SELECT restaurar_empresa_arquivada('Velha')")
+        assert cur.fetchone()[0] is True
+        cur.execute("SELECT versao, comentario FROM analise_credito WHERE empresa = 'Velha'")
+        assert cur.fetchone() == (7, "ok")
+        cur.execute("SELECT COUNT(*) FROM log_workflow WHERE empresa = 'Velha'")
+        assert cur.fetchone()[0] == 2
+        cur.execute("SELECT COUNT(*) FROM empresas_arquivadas")
+        assert cur.fetchone()[0] == 0
+    pg.commit()
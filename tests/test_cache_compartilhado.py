@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from cache_compartilhado import (BackendDisco, BackendMemoria, BackendRedis, CacheCompartilhado,
+                                 ErroBackend, criar_cache)
+
+
+class Contador:
+    def __init__(self, valor):
+        self.valor, self.chamadas = valor, 0
+
+    def __call__(self):
+        self.chamadas += 1
+        return self.valor
+
+
+def test_acerto_e_invalidacao_substituem_a_mesma_entrada():
+    backend = BackendMemoria()
+    cache = CacheCompartilhado(backend)
+    calcular = Contador(pd.DataFrame({"empresa": ["A"]}))
+    for _ in range(3):
+        assert cache.obter(("sql", None), ["analise_credito"], calcular)["empresa"].tolist() == ["A"]
+    assert calcular.chamadas == 1
+    for _ in range(5):
+        cache.invalidar(["analise_credito"])
+        cache.obter(("sql", None), ["analise_credito"], calcular)
+    assert calcular.chamadas == 6
+    dados = [c for c in backend._dados if ":d:" in c]
+    assert len(dados) == 1  # versões antigas não se acumulam
+    assert cache.estatisticas()["hits"] == 2
+
+
+def test_entradas_expiradas_sao_varridas():
+    backend = BackendMemoria(intervalo_limpeza=0)
+    cache = CacheCompartilhado(backend, ttl=1)
+    for i in range(20):
+        cache.obter(("sql", i), ["t"], Contador(i))
+    time.sleep(1.1)
+    cache.obter(("outra", 0), ["t"], Contador(0))
+    assert len([c for c in backend._dados if ":d:" in c]) == 1
+
+
+def test_disco_varre_expiradas(tmp_path):
+    backend = BackendDisco(str(tmp_path / "cache"), intervalo_limpeza=0)
+    cache = CacheCompartilhado(backend, ttl=1)
+    for i in range(10):
+        cache.obter(("sql", i), ["t"], Contador(i))
+    time.sleep(1.1)
+    assert cache.obter(("sql", 3), ["t"], Contador("novo")) == "novo"
+    assert len([n for n in os.listdir(backend.diretorio) if not n.endswith(".lock")]) == 1
+
+
+def test_disco_exige_diretorio_privado(tmp_path):
+    with pytest.raises(ValueError):
+        criar_cache({"backend": "disco"})
+    backend = BackendDisco(str(tmp_path / "novo"))
+    assert os.stat(backend.diretorio).st_mode & 0o777 == 0o700
+    aberto = tmp_path / "aberto"
+    aberto.mkdir()
+    os.chmod(aberto, 0o777)
+    with pytest.raises(ValueError):
+        BackendDisco(str(aberto))
+
+
+class ConsultaFalhou(Exception):
+    pass
+
+
+def test_erro_da_consulta_sobe_sem_repetir():
+    cache = CacheCompartilhado(BackendMemoria())
+    chamadas = []
+
+    def calcular():
+        chamadas.append(1)
+        raise ConsultaFalhou()
+
+    with pytest.raises(ConsultaFalhou):
+        cache.obter(("sql", None), ["t"], calcular)
+    assert len(chamadas) == 1
+
+
+class RedisForaDoAr:
+    def __getattr__(self, nome):
+        def falhar(*args, **kwargs):
+            raise ConnectionError("recusada")
+        return falhar
+
+
+def test_backend_fora_do_ar_e_entrada_corrompida_viram_miss():
+    cache = CacheCompartilhado(BackendRedis(RedisForaDoAr(), erros=(ConnectionError,)))
+    calcular = Contador(1)
+    assert cache.obter(("sql", None), ["t"], calcular) == 1 and calcular.chamadas == 1
+    with pytest.raises(ErroBackend):
+        cache.invalidar(["t"])
+
+    backend = BackendMemoria()
+    cache = CacheCompartilhado(backend)
+    cache.obter(("sql", None), ["t"], Contador(1))
+    chave = next(c for c in backend._dados if ":d:" in c)
+    backend.set(chave, b"0\nlixo")
+    assert cache.obter(("sql", None), ["t"], Contador(2)) == 2
+
+
+class IncrFalha(BackendMemoria):
+    def __init__(self):
+        super().__init__()
+        self.fora = False
+
+    def incr(self, chave):
+        if self.fora:
+            raise ErroBackend("incr recusado")
+        return super().incr(chave)
+
+
+def test_versao_que_nao_subiu_nao_serve_a_entrada_antiga():
+    backend = IncrFalha()
+    cache = CacheCompartilhado(backend)
+    assert cache.obter(("sql", None), ["t"], Contador("velho")) == "velho"
+    backend.fora = True
+    with pytest.raises(ErroBackend):
+        cache.invalidar(["t"])
+    # só o incr falha: a entrada antiga continua legível, mas não é servida
+    assert cache.obter(("sql", None), ["t"], Contador("novo")) == "novo"
+    backend.fora = False
+    assert cache.obter(("sql", None), ["t"], Contador("novo")) == "novo"  # subiu agora: recalcula
+    assert cache.versoes(["t"]) == (1,)
+    assert cache.obter(("sql", None), ["t"], Contador("outro")) == "novo"
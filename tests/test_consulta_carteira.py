@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+from itertools import product
+
+from consulta_carteira import SQL_CARTEIRA, filtros_carteira, sql_funcao_carteira
+
+
+def _criar(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE FUNCTION qtd_bits(mascara bigint) RETURNS int AS $$
+                SELECT length(replace(mascara::bit(64)::text, '0', ''));
+            $$ LANGUAGE sql IMMUTABLE;
+            CREATE TABLE analise_credito (empresa TEXT PRIMARY KEY, agente TEXT, entrada DATE, situacao TEXT,
+                limite NUMERIC(15,2), etapa_atual TEXT, responsavel_atual TEXT,
+                data_ultima_movimentacao TIMESTAMPTZ, pendentes_mask BIGINT NOT NULL DEFAULT 0,
+                pendentes_fora_dim INT NOT NULL DEFAULT 0, ultima_transicao_em TIMESTAMPTZ, prazo_dias INT);
+            INSERT INTO analise_credito (empresa, agente, entrada, pendentes_mask, ultima_transicao_em, prazo_dias)
+            SELECT 'E' || g, (ARRAY['Ana', 'Bia'])[1 + g % 2], DATE '2025-01-01' + g, g,
+                   TIMESTAMPTZ '2025-01-01' + g * INTERVAL '1 hour', g % 5
+              FROM generate_series(1, 40) g;
+        """)
+        cur.execute(sql_funcao_carteira())
+    conn.commit()
+
+
+def test_cada_combinacao_de_filtros_igual_a_consulta_ad_hoc(pg):
+    _criar(pg)
+    with pg.cursor() as cur:
+        for agente, ini, fim in product(("Ana", None), (date(2025, 1, 10), None), (date(2025, 1, 30), None)):
+            cur.execute("SELECT * FROM carteira_empresas(%s, %s, %s)", (agente, ini, fim))
+            funcao = cur.fetchall()
+            where, params = filtros_carteira(agente, ini, fim)
+            cur.execute(SQL_CARTEIRA.format(ac="analise_credito", arquivada="FALSE", where=where), params)
+            assert funcao == cur.fetchall()
+            assert funcao  # todas as combinações acham alguma empresa
+
+
+def test_funcao_nao_usa_predicado_generico():
+    assert "IS NULL OR" not in sql_funcao_carteira()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from datetime import date, datetime, timedelta, timezone
+
+import pandas as pd
+
+from decimal import Decimal
+
+from dados_carteira import campos_alterados, categoria, datas, tipar_carteira, valores_formulario
+
+CATEGORIAS = {"situacao": ["Em análise", "Aprovada"], "etapa_atual": ["Cadastro", "Finalizado"]}
+
+
+def test_categoria_mantem_valores_inesperados():
+    c = categoria(pd.Series(["Aprovada", "Nova", None]), ["Em análise", "Aprovada"])
+    assert list(c.categories) == ["Em análise", "Aprovada", "Nova"]
+    assert c[1] == "Nova" and pd.isna(c[2])
+
+
+def test_datas_com_offsets_misturados():
+    # offsets diferentes na mesma coluna (sessões/servidores com TimeZone distintos)
+    s = pd.Series([datetime(2025, 6, 1, 10, tzinfo=timezone(timedelta(hours=-2))),
+                   datetime(2025, 6, 1, 10, tzinfo=timezone(timedelta(hours=-3))), None])
+    d = datas(s)
+    assert str(d.dtype).startswith("datetime64")
+    assert d.iloc[0] == pd.Timestamp("2025-06-01 09:00")  # 10h -02 = 9h em São Paulo (-03)
+    assert d.iloc[1] == pd.Timestamp("2025-06-01 10:00")
+    assert pd.isna(d.iloc[2])
+    assert d.dt.day.tolist()[:2] == [1, 1]  # .dt funciona (não ficou object)
+
+
+def test_datas_texto_do_copy():
+    d = datas(pd.Series(["2025-06-01 13:00:00+00", "2019-01-10 08:30:00.25-03", None]))
+    assert d.iloc[0] == pd.Timestamp("2025-06-01 10:00")
+    assert d.iloc[1] == pd.Timestamp("2019-01-10 09:30:00.25")  # horário de verão (-02) em 2019
+
+
+def test_datas_sem_fuso_nao_deslocam():
+    d = datas(pd.Series([date(2025, 1, 2), None]))
+    assert d.iloc[0] == pd.Timestamp("2025-01-02")
+    d = datas(pd.Series(["2025-01-02", "2025-01-03"]))
+    assert d.iloc[0] == pd.Timestamp("2025-01-02")
+
+
+def test_tipar_carteira():
+    df = pd.DataFrame({
+        "empresa": ["A", "B"],
+        "situacao": ["Aprovada", "Em análise"],
+        "etapa_atual": ["Cadastro", None],
+        "entrada": [date(2025, 1, 2), None],
+        "data_ultima_movimentacao": ["2025-06-01 13:00:00+00", "2025-06-02 13:00:00+00"],
+    })
+    out = tipar_carteira(df, CATEGORIAS)
+    assert isinstance(out["situacao"].dtype, pd.CategoricalDtype)
+    assert list(out["situacao"].cat.categories) == CATEGORIAS["situacao"]
+    assert str(out["entrada"].dtype).startswith("datetime64")
+    assert out["data_ultima_movimentacao"].iloc[1] == pd.Timestamp("2025-06-02 10:00")
+    assert tipar_carteira(pd.DataFrame(), CATEGORIAS).empty
+
+
+SITUACOES = ["Em análise", "Aprovada", "Reprovada", "Stand by"]
+
+
+def _salvar_sem_editar(linha):
+    """O payload que o formulário monta quando o usuário só clica em Salvar."""
+    form = valores_formulario(linha, SITUACOES)
+    texto = form["saida_credito"].strftime("%d-%m-%Y") if form["saida_credito"] else ""
+    payload = {k: v for k, v in form.items() if k != "saida_credito"}
+    payload["saida_credito"] = datetime.strptime(texto, "%d-%m-%Y").date() if texto else None
+    return payload
+
+
+def test_salvar_sem_editar_nao_grava_nada():
+    linhas = [
+        {"situacao": None, "limite": None, "comentario_interno": None, "saida_credito": None,
+         "envio_das": None, "emissao_contrato": "sim", "assinatura": "SIM", "homologacao": "nao",
+         "apto_a_operar": ""},
+        {"situacao": "Aprovada", "limite": Decimal("150000.00"), "comentario_interno": "ok",
+         "saida_credito": date(2025, 3, 1), "envio_das": "Sim", "emissao_contrato": "Não",
+         "assinatura": "não", "homologacao": " Sim ", "apto_a_operar": "x"},
+        {"situacao": "desconhecida", "limite": 0, "saida_credito": pd.NaT},
+    ]
+    for linha in linhas:
+        assert campos_alterados(linha, _salvar_sem_editar(linha), SITUACOES) == {}
+
+
+def test_so_o_campo_editado_e_gravado():
+    linha = {"situacao": None, "limite": Decimal("10.00"), "envio_das": "sim", "saida_credito": None}
+    payload = _salvar_sem_editar(linha)
+    payload.update(envio_das="Não", limite=10.0, saida_credito=date(2025, 5, 2))
+    assert campos_alterados(linha, payload, SITUACOES) == {"envio_das": "Não", "saida_credito": date(2025, 5, 2)}
+    payload = _salvar_sem_editar(linha)
+    payload["situacao"] = "Aprovada"
+    assert campos_alterados(linha, payload, SITUACOES) == {"situacao": "Aprovada"}
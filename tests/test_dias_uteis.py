@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from dias_uteis import CalendarioUteis, feriados_nacionais, pascoa
+
+CAL = CalendarioUteis()
+SEG = "2025-06-16"  # segunda; quinta 19/06/2025 é Corpus Christi
+
+
+def _avaliar(inicio, prazo, hoje, cal=CAL):
+    return cal.avaliar(pd.Series(pd.to_datetime(inicio)), pd.Series(prazo), hoje)
+
+
+def test_pascoa_e_feriados_moveis():
+    assert pascoa(2024) == date(2024, 3, 31)
+    assert pascoa(2025) == date(2025, 4, 20)
+    f = set(feriados_nacionais(2025))
+    assert {date(2025, 3, 3), date(2025, 3, 4), date(2025, 4, 18), date(2025, 6, 19)} <= f
+    assert date(2025, 11, 20) in f and date(2023, 11, 20) not in set(feriados_nacionais(2023))
+
+
+def test_vencimento_pula_feriado():
+    r = _avaliar([SEG], [3], SEG).iloc[0]
+    assert r["vencimento"] == pd.Timestamp("2025-06-20")  # 17, 18, (19 feriado), 20
+    assert r["dias_passados"] == 0 and r["dias_restantes"] == 3
+    assert r["percentual"] == 0 and r["status"] == "Dentro do prazo"
+
+
+def test_percentual_no_meio_do_prazo():
+    r = _avaliar([SEG], [4], "2025-06-18").iloc[0]
+    assert r["dias_passados"] == 2 and r["dias_restantes"] == 2
+    assert r["percentual"] == 50
+
+
+def test_atrasado_conta_so_dias_uteis():
+    r = _avaliar([SEG], [3], "2025-06-23").iloc[0]  # 16, 17, 18, 20 (sem o feriado e o fim de semana)
+    assert r["dias_passados"] == 4 and r["dias_restantes"] == -1
+    assert r["percentual"] == 100 and r["status"] == "Atrasado"
+
+
+def test_inicio_no_fim_de_semana_conta_do_proximo_dia_util():
+    r = _avaliar(["2025-06-14"], [1], SEG).iloc[0]  # sábado
+    assert r["dias_passados"] == 0 and r["dias_restantes"] == 1
+    assert r["vencimento"] == pd.Timestamp("2025-06-17")
+
+
+def test_sem_prazo_e_indice_preservado():
+    inicio = pd.Series(pd.to_datetime([SEG, None, SEG]), index=[10, 20, 30])
+    r = CAL.avaliar(inicio, pd.Series([0, 5, None], index=[10, 20, 30]), SEG)
+    assert list(r.index) == [10, 20, 30]
+    assert (r["status"] == "Sem prazo").all()
+    assert r["dias_restantes"].isna().all() and r["vencimento"].isna().all()
+    assert (r["percentual"] == 0).all() and (r["dias_passados"] == 0).all()
+
+
+def test_feriados_extras():
+    cal = CalendarioUteis(extras=["06-17", "2025-06-18"], ano_inicial=2025, ano_final=2025)
+    r = _avaliar([SEG], [1], SEG, cal).iloc[0]
+    assert r["vencimento"] == pd.Timestamp("2025-06-20")  # 17 (todo ano), 18 (só 2025) e 19 fora
+
+
+def test_vetorizado_igual_ao_laco():
+    rnd = np.random.default_rng(3)
+    hoje = np.datetime64(SEG)
+    inicio = pd.Series(hoje - rnd.integers(0, 60, 500).astype("timedelta64[D]")).astype("datetime64[ns]")
+    prazo = pd.Series(rnd.integers(1, 10, 500))
+    r = CAL.avaliar(inicio, prazo, hoje)
+    for i, p, restantes in zip(inicio, prazo, r["dias_restantes"]):
+        ini = np.busday_offset(np.datetime64(i, "D"), 0, roll="forward", busdaycal=CAL.calendario)
+        assert restantes == p - max(0, int(np.busday_count(ini, hoje, busdaycal=CAL.calendario)))
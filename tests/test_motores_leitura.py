@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import pandas as pd
+
+from motores_leitura import ler_copy, ler_tuplas
+
+SQL = "SELECT cnpj, nome, ativo, flag, qtd, limite, entrada, mov FROM t WHERE qtd >= %s ORDER BY qtd"
+
+
+def _criar(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE t (cnpj TEXT, nome TEXT, ativo BOOLEAN, flag TEXT, qtd INT,
+                            limite NUMERIC(15,2), entrada DATE, mov TIMESTAMPTZ);
+            INSERT INTO t VALUES
+              ('00123', '',    TRUE,  't', 1, 10.5, '2025-03-01', '2025-03-01 10:00-03'),
+              ('45678', NULL,  FALSE, 'f', 2, NULL, NULL,         '2018-12-01 10:00-02'),
+              ('0099',  'Ana', NULL,  NULL, 3, 0,   '2025-01-02', NULL);
+        """)
+    conn.commit()
+
+
+def test_copy_respeita_os_tipos_do_banco(pg):
+    _criar(pg)
+    df = ler_copy(pg, SQL, (0,))
+    # texto só com dígitos continua texto (com zeros à esquerda)
+    assert df["cnpj"].tolist() == ["00123", "45678", "0099"]
+    # '' não é NULL
+    assert df["nome"].iloc[0] == "" and pd.isna(df["nome"].iloc[1])
+    # 't'/'f' só viram bool em coluna boolean
+    assert df["ativo"].iloc[:2].tolist() == [True, False] and pd.isna(df["ativo"].iloc[2])
+    assert df["flag"].iloc[:2].tolist() == ["t", "f"]
+    assert df["qtd"].tolist() == [1, 2, 3]
+    assert df["limite"].iloc[0] == 10.5
+    assert pd.api.types.is_datetime64_dtype(df["entrada"])
+    # timestamptz com offsets misturados → UTC
+    assert df["mov"].iloc[0] == pd.Timestamp("2025-03-01 13:00", tz="UTC")
+    assert df["mov"].iloc[1] == pd.Timestamp("2018-12-01 12:00", tz="UTC")
+
+
+def test_copy_e_tuplas_devolvem_os_mesmos_valores(pg):
+    _criar(pg)
+    copy, tuplas = ler_copy(pg, SQL, (2,)), ler_tuplas(pg, SQL, (2,))
+    assert copy.columns.tolist() == tuplas.columns.tolist()
+    for col in ("cnpj", "nome", "flag", "qtd"):
+        assert copy[col].tolist() == tuplas[col].tolist()
+    assert copy["mov"].iloc[0] == pd.Timestamp(tuplas["mov"].iloc[0])
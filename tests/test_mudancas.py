@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+import json
+import select
+import subprocess
+import sys
+import threading
+import time
+
+import psycopg2
+
+from mudancas import (CANAL_MUDANCAS, SQL_FUNCAO_AVISO, VersoesDados, ddl_gatilhos,
+                      ouvir_mudancas)
+
+TABELAS = ("analise_credito",)
+
+
+def _criar_tabela(conn):
+    with conn.cursor() as cur:
+        cur.execute("CREATE TABLE analise_credito (empresa TEXT PRIMARY KEY, situacao TEXT)")
+        cur.execute(SQL_FUNCAO_AVISO)
+        for q in ddl_gatilhos("analise_credito"):
+            cur.execute(q)
+    conn.commit()
+
+
+def _esperar(condicao, segundos=10):
+    fim = time.time() + segundos
+    while time.time() < fim:
+        if condicao():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_aviso_da_propria_transacao_nao_conta_de_novo():
+    v = VersoesDados()
+    v.transacao_propria(10, ["analise_credito"])
+    v.registrar("analise_credito", "A")
+    antes = v.token(TABELAS, "A")
+    assert not v.registrar_aviso({"tabela": "analise_credito", "transacao": 10, "empresas": ["A"]})
+    assert v.token(TABELAS, "A") == antes
+    # tabela tocada só por cascata na mesma transação ainda conta
+    assert v.registrar_aviso({"tabela": "pendencias_empresa", "transacao": 10, "empresas": ["A"]})
+    # aviso de outra transação conta, e só para as empresas dele
+    assert v.registrar_aviso({"tabela": "analise_credito", "transacao": 11, "empresas": ["B"]})
+    assert v.token(TABELAS, "A") == antes
+    assert v.token(TABELAS, "B") != v.token(("analise_credito",), "C")
+
+
+def test_aviso_que_conta_chama_ao_mudar():
+    mudadas = []
+    v = VersoesDados(ao_mudar=mudadas.append)
+    v.transacao_propria(10, ["analise_credito"])
+    v.registrar_aviso({"tabela": "analise_credito", "transacao": 10, "empresas": ["A"]})  # já contada aqui
+    v.registrar_aviso({"tabela": "pendencias_empresa", "transacao": 10, "empresas": ["A"]})  # cascata
+    v.registrar_aviso({"tabela": "analise_credito", "transacao": 11})  # outro processo / ferramenta
+    v.registrar_aviso({"tabela": "fora_da_lista", "transacao": 12})
+    assert mudadas == ["pendencias_empresa", "analise_credito"]
+
+
+def test_um_aviso_por_comando(pg, pg_config):
+    _criar_tabela(pg)
+    ouvinte = psycopg2.connect(**pg_config)
+    ouvinte.autocommit = True
+    with ouvinte.cursor() as cur:
+        cur.execute(f"LISTEN {CANAL_MUDANCAS}")
+    with pg.cursor() as cur:
+        cur.execute("INSERT INTO analise_credito VALUES ('A', 'x'), ('B', 'x'), ('C', 'x')")
+        pg.commit()
+        cur.execute("UPDATE analise_credito SET situacao = 'y'")
+        cur.execute("UPDATE analise_credito SET situacao = 'z' WHERE false")  # nenhuma linha
+        pg.commit()
+
+    avisos = []
+    fim = time.time() + 2
+    while time.time() < fim:
+        if select.select([ouvinte], [], [], 0.1) != ([], [], []):
+            ouvinte.poll()
+            avisos += ouvinte.notifies
+            ouvinte.notifies.clear()
+    ouvinte.close()
+    eventos = [json.loads(a.payload) for a in avisos]
+    assert len(eventos) == 2  # INSERT e UPDATE de 3 linhas: um aviso cada
+    assert all(sorted(e["empresas"]) == ["A", "B", "C"] for e in eventos)
+    assert eventos[0]["transacao"] != eventos[1]["transacao"]
+
+
+def test_invalidacao_entre_dois_processos(pg, pg_config):
+    _criar_tabela(pg)
+    versoes, parar = VersoesDados(), threading.Event()
+    ouvinte = threading.Thread(target=ouvir_mudancas, args=(pg_config, versoes, parar), daemon=True)
+    ouvinte.start()
+    try:
+        assert _esperar(lambda: versoes.token(TABELAS)[0] >= 1)  # LISTEN ativo
+
+        # escrita deste processo: invalida na hora e o aviso dela não conta de novo
+        with pg.cursor() as cur:
+            cur.execute("INSERT INTO analise_credito VALUES ('A', 'x')")
+            cur.execute("SELECT txid_current()")
+            versoes.transacao_propria(cur.fetchone()[0], ["analise_credito"])
+        pg.commit()
+        versoes.registrar("analise_credito", "A")
+        token_a = versoes.token(TABELAS, "A")
+
+        # escrita de outro processo
+        token_b = versoes.token(TABELAS, "B")
+        subprocess.run([sys.executable, "-c", (
+            "import json, sys, psycopg2\n"
+            "conn = psycopg2.connect(**json.loads(sys.argv[1]))\n"
+            "conn.cursor().execute(\"INSERT INTO analise_credito VALUES ('B', 'x')\")\n"
+            "conn.commit()\n"
+        ), json.dumps(pg_config)], check=True)
+
+        assert _esperar(lambda: versoes.token(TABELAS, "B") != token_b)
+        # os avisos chegam em ordem: o da escrita local já passou e foi ignorado
+        assert versoes.token(TABELAS, "A") == token_a
+        assert versoes.token(TABELAS)[1] == 2
+    finally:
+        parar.set()
+        ouvinte.join(5)
+
+
+def test_aviso_de_tabela_sem_empresa(pg, pg_config):
+    with pg.cursor() as cur:
+        cur.execute("CREATE TABLE dim_pendencias (documento TEXT PRIMARY KEY)")
+        cur.execute(SQL_FUNCAO_AVISO)
+        for q in ddl_gatilhos("dim_pendencias", por_empresa=False):
+            cur.execute(q)
+    pg.commit()
+    ouvinte = psycopg2.connect(**pg_config)
+    ouvinte.autocommit = True
+    with ouvinte.cursor() as cur:
+        cur.execute(f"LISTEN {CANAL_MUDANCAS}")
+    with pg.cursor() as cur:
+        cur.execute("INSERT INTO dim_pendencias VALUES ('Contrato social')")
+    pg.commit()
+    assert _esperar(lambda: ouvinte.poll() or ouvinte.notifies)
+    evento = json.loads(ouvinte.notifies[0].payload)
+    ouvinte.close()
+    assert evento["tabela"] == "dim_pendencias" and "empresas" not in evento
+    v = VersoesDados()
+    antes = v.token(("dim_pendencias",))
+    assert v.registrar_aviso(evento)
+    assert v.token(("dim_pendencias",)) != antes
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+from arquivo_empresas import SQL_FUNCOES_ARQUIVO
+from particoes_log import migrar, particionada
+
+
+def _log_antigo(conn, linhas):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE log_workflow (
+                id BIGSERIAL, empresa TEXT NOT NULL, etapa TEXT, responsavel TEXT,
+                prazo_dias INT, status_prazo TEXT, created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+        cur.execute("""
+            INSERT INTO log_workflow (empresa, etapa, created_at)
+            SELECT 'E' || (g %% 7), 'Cadastro', NOW() - g * INTERVAL '9 days' FROM generate_series(1, %s) g
+        """, (linhas,))
+        cur.execute("CREATE VIEW log_workflow_todas AS SELECT empresa, created_at FROM log_workflow")
+    conn.commit()
+
+
+def test_migracao_preserva_historico_e_views(pg):
+    _log_antigo(pg, 300)
+    assert migrar(pg, log=lambda *_: None)
+    with pg.cursor() as cur:
+        assert particionada(cur)
+        cur.execute("SELECT COUNT(*) FROM log_workflow")
+        assert cur.fetchone()[0] == 300
+        cur.execute("SELECT COUNT(*) FROM log_workflow_legado")
+        assert cur.fetchone()[0] == 300
+        cur.execute("SELECT COUNT(*) FROM log_workflow_default")
+        assert cur.fetchone()[0] == 0
+        # a view passou a ler a tabela nova
+        cur.execute("INSERT INTO log_workflow (empresa, etapa) VALUES ('nova', 'Cadastro')")
+        cur.execute("SELECT COUNT(*) FROM log_workflow_todas WHERE empresa = 'nova'")
+        assert cur.fetchone()[0] == 1
+    pg.commit()
+    assert not migrar(pg, log=lambda *_: None)  # idempotente
+
+
+def test_particao_atrasada_absorve_linhas_da_default(pg):
+    _log_antigo(pg, 10)
+    migrar(pg, log=lambda *_: None)
+    with pg.cursor() as cur:
+        # mês sem partição ainda: a linha cai na DEFAULT
+        cur.execute("INSERT INTO log_workflow (empresa, etapa, created_at) "
+                    "VALUES ('E1', 'Cadastro', date_trunc('month', NOW()) + INTERVAL '14 months')")
+        cur.execute("SELECT criar_particao_log_workflow((NOW() + INTERVAL '14 months')::date)")
+        cur.execute("SELECT COUNT(*) FROM log_workflow_default")
+        assert cur.fetchone()[0] == 0
+        cur.execute("SELECT tableoid::regclass::text FROM log_workflow WHERE created_at > NOW() + INTERVAL '1 year'")
+        assert cur.fetchone()[0].startswith("log_workflow_2")
+    pg.commit()
+
+
+def test_arquivo_segue_funcionando_depois_da_migracao(pg):
+    # esquema de antes do app: log sem id, e o arquivo (LIKE log_workflow) também
+    with pg.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE analise_credito (
+                empresa TEXT PRIMARY KEY, entrada DATE, situacao TEXT, etapa_atual TEXT,
+                data_ultima_movimentacao TIMESTAMPTZ,
+                pendentes_mask BIGINT NOT NULL DEFAULT 0, recebidos_mask BIGINT NOT NULL DEFAULT 0,
+                pendentes_fora_dim INT NOT NULL DEFAULT 0);
+            CREATE TABLE pendencias_empresa (id SERIAL PRIMARY KEY, empresa TEXT, documento TEXT, status TEXT);
+            CREATE TABLE log_workflow (empresa TEXT NOT NULL, etapa TEXT, created_at TIMESTAMPTZ DEFAULT NOW());
+        """)
+        cur.execute(SQL_FUNCOES_ARQUIVO)
+        cur.execute("""
+            INSERT INTO analise_credito (empresa, entrada, situacao, etapa_atual, data_ultima_movimentacao)
+            VALUES ('Antiga', '2023-01-01', 'Aprovada', 'Finalizado', NOW() - INTERVAL '400 days'),
+                   ('Recente', '2025-01-01', 'Aprovada', 'Finalizado', NOW() - INTERVAL '60 days');
+            INSERT INTO log_workflow (empresa, etapa, created_at)
+            VALUES ('Antiga', 'Finalizado', NOW() - INTERVAL '400 days'),
+                   ('Recente', 'Cadastro', NOW() - INTERVAL '90 days'),
+                   ('Recente', 'Finalizado', NOW() - INTERVAL '60 days');
+        """)
+        cur.execute("SELECT arquivar_empresas_encerradas(365)")  # 'Antiga' vai sem id para o arquivo
+        assert cur.fetchone()[0] == 1
+    pg.commit()
+
+    assert migrar(pg, log=lambda *_: None)
+    with pg.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM log_workflow_arquivo WHERE id IS NULL")
+        assert cur.fetchone()[0] == 0
+        cur.execute("SELECT arquivar_empresas_encerradas(30)")
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT COUNT(*) FROM log_workflow_arquivo")
+        assert cur.fetchone()[0] == 3
+        cur.execute("SELECT restaurar_empresa_arquivada('Antiga')")
+        assert cur.fetchone()[0] is True
+        cur.execute("SELECT COUNT(*), COUNT(DISTINCT id) FROM log_workflow")
+        assert cur.fetchone() == (1, 1)
+    pg.commit()
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+O cancelamento de consultas de execuções abandonadas (_execucao_interrompida no
+Credito_libra.py) lê ScriptRequests._state, que não é API pública do Streamlit.
+Se uma versão nova mudar esse detalhe, estes testes quebram antes do app.
+"""
+import dataclasses
+
+from streamlit.runtime.scriptrunner_utils.script_requests import RerunData, ScriptRequests, ScriptRequestType
+from streamlit.runtime.scriptrunner_utils.script_run_context import ScriptRunContext
+
+
+def test_contexto_tem_script_requests():
+    assert "script_requests" in {f.name for f in dataclasses.fields(ScriptRunContext)}
+
+
+def test_estado_acompanha_rerun_e_parada():
+    pedidos = ScriptRequests()
+    assert pedidos._state is ScriptRequestType.CONTINUE
+    assert pedidos.request_rerun(RerunData())
+    assert pedidos._state is ScriptRequestType.RERUN
+    pedidos.request_stop()
+    assert pedidos._state is ScriptRequestType.STOP
+
+
+def test_execucao_retomada_volta_a_continue():
+    pedidos = ScriptRequests()
+    pedidos.request_rerun(RerunData())
+    pedidos.on_scriptrunner_yield()  # o ScriptRunner atende o rerun
+    assert pedidos._state is ScriptRequestType.CONTINUE
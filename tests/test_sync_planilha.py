@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from sync_planilha import COLUNAS, PlanilhaFalsa, sincronizar
+
+PENDENTES = [c for c, _ in COLUNAS].index("pendentes")
+
+
+def _criar(conn, n=5):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE FUNCTION qtd_bits(mascara bigint) RETURNS int AS $$
+                SELECT length(replace(mascara::bit(64)::text, '0', ''));
+            $$ LANGUAGE sql IMMUTABLE;
+            CREATE TABLE analise_credito (
+                empresa TEXT PRIMARY KEY, agente TEXT, entrada DATE, situacao TEXT, limite NUMERIC(15,2),
+                etapa_atual TEXT, responsavel_atual TEXT, data_ultima_movimentacao TIMESTAMPTZ,
+                saida_credito DATE, versao INT NOT NULL DEFAULT 0,
+                pendentes_mask BIGINT NOT NULL DEFAULT 0, pendentes_fora_dim INT NOT NULL DEFAULT 0,
+                ultima_transicao_em TIMESTAMPTZ, prazo_dias INT);
+            CREATE TABLE log_workflow (id BIGSERIAL, empresa TEXT, created_at TIMESTAMPTZ);
+        """)
+        cur.execute("""
+            INSERT INTO analise_credito (empresa, agente, entrada, situacao, limite, data_ultima_movimentacao,
+                                         pendentes_mask)
+            SELECT 'E' || g, 'Ana', DATE '2025-01-01', 'Em análise', 1000, NOW() - g * INTERVAL '1 day', 3
+              FROM generate_series(1, %s) g
+        """, (n,))
+    conn.commit()
+
+
+def _linha_da(aba, empresa):
+    return next(v for i, v in aba.celulas.items() if i > 1 and v[0] == empresa)
+
+
+def test_primeira_rodada_e_rodada_sem_mudanca(pg):
+    _criar(pg)
+    aba = PlanilhaFalsa()
+    rel = sincronizar(pg, aba)
+    assert rel["novas"] == 5 and rel["chamadas_api"] == 1
+    assert aba.linha(1)[0] == "Empresa"
+    rel = sincronizar(pg, aba)  # as da margem da marca voltam como candidatas; o hash as descarta
+    assert rel["enviadas"] == 0 and rel["chamadas_api"] == 0
+
+
+def test_mudanca_so_de_pendencias_chega_a_planilha(pg):
+    _criar(pg)
+    aba = PlanilhaFalsa()
+    sincronizar(pg, aba)
+    assert _linha_da(aba, "E2")[PENDENTES] == 2
+    with pg.cursor() as cur:
+        # o que o trigger de pendencias_empresa faz: só as máscaras/contador, sem marca d'água
+        cur.execute("UPDATE analise_credito SET pendentes_mask = 7 WHERE empresa = 'E2'")
+        cur.execute("UPDATE analise_credito SET pendentes_fora_dim = 1 WHERE empresa = 'E4'")
+    pg.commit()
+    rel = sincronizar(pg, aba)
+    assert rel["enviadas"] == rel["atualizadas"] == 2 and rel["chamadas_api"] == 1
+    assert _linha_da(aba, "E2")[PENDENTES] == 3
+    assert _linha_da(aba, "E4")[PENDENTES] == 3
+    assert sincronizar(pg, aba)["enviadas"] == 0
+
+
+def test_versao_e_log_tambem_entram(pg):
+    _criar(pg)
+    aba = PlanilhaFalsa()
+    sincronizar(pg, aba)
+    with pg.cursor() as cur:
+        cur.execute("UPDATE analise_credito SET situacao = 'Aprovada', versao = versao + 1 WHERE empresa = 'E1'")
+        # a transição como registrar_transicao grava: log + última transição na empresa
+        cur.execute("INSERT INTO log_workflow (empresa, created_at) VALUES ('E3', NOW())")
+        cur.execute("UPDATE analise_credito SET ultima_transicao_em = NOW() WHERE empresa = 'E3'")
+        cur.execute("INSERT INTO analise_credito (empresa, pendentes_mask) VALUES ('E9', 0)")
+    pg.commit()
+    rel = sincronizar(pg, aba)
+    assert rel["novas"] == 1 and rel["atualizadas"] == 2
+    assert _linha_da(aba, "E1")[3] == "Aprovada"
+    assert _linha_da(aba, "E3")[[c for c, _ in COLUNAS].index("ultima_transicao_em")] != ""